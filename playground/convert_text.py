@@ -1,24 +1,11 @@
-text = "Hello, this is Isabella. I am trying something? Let's see."
-print("Input text: ", text)
-
-def convert_text(text):
-    text_arr = list(text)
-    output_text = ""
-    for char in text_arr:
-        # print(char)
-        if char == ",": # default pause
-            output_text = output_text + "<break time=\"0.0s\" />"
-
-        elif char == "." or char == "?" or char == "!":
-            output_text = output_text + "<break time=\"0.5s\" />"
-
-        elif char == ";":
-            output_text = output_text + "<break time=\"0.5s\" />"
-
-        output_text = output_text + char
-
-    print(output_text)
+import os
+import sys
 
+# NOTE The converter lives in the app (src/modules/ssml/breaks.py), run `python src/modules/ssml/breaks.py` for a benchmark
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from modules.ssml.breaks import BreakConverter
 
+text = "Hello, this is Isabella. I am trying something? Let's see."
+print("Input text: ", text)
 
-convert_text(text)
\ No newline at end of file
+print(BreakConverter().convert(text))
@@ -2,24 +2,38 @@ from abc import ABC, abstractmethod
 from kivy.event import EventDispatcher
 from kivy.clock import Clock
 from kivy.app import App
+from kivy.properties import NumericProperty, ObjectProperty
 
 import os
 import logging
-import queue
-import sys
 import threading
+import time
 
 try:
     import io
 
+    import numpy as np  # type: ignore
     import sounddevice as sd  # type: ignore
     import soundfile as sf  # type: ignore
 except ModuleNotFoundError:
     message = (
-        "`pip install sounddevice soundfile` required` "
+        "`pip install numpy sounddevice soundfile` required` "
     )
     raise ValueError(message)
 
+from modules.audio.artifacts import ArtifactStore
+from modules.audio.cache import SegmentCache
+from modules.audio.export import Exporter
+from modules.audio.formats import negotiate_output_format
+from modules.audio.peaks import PeakBuilder, PeakPyramid
+from modules.audio.playback import PlaybackService
+from modules.audio.processing import process_segment
+from modules.audio.render import RenderWriter
+from modules.audio.timing import TimingIndex
+from modules.ssml.chunker import SsmlChunker
+from modules.ssml.pronunciation import PronunciationDictionary
+from modules.text.segmenter import SentenceSegmenter
+
 class BaseApiSettings(ABC, EventDispatcher):
     _instance = None
 
@@ -69,8 +83,15 @@ class BaseApiSettings(ABC, EventDispatcher):
 
 class BaseApi(ABC, EventDispatcher):
     _instance = None
-    buffersize = 2
-    blocksize = 2048
+    blocksize = 512 # NOTE Small blocks keep play, pause and stop responsive (~12 ms at 44.1 kHz)
+    crossfade_ms = 0 # NOTE Length of the crossfade between queued segments (0 plays them back to back)
+    timing_suffix = ".timing.json" # NOTE The timing index of a render is stored next to the audio file
+    output_formats = [] # NOTE OutputFormat instances the API can return, in order of preference (see modules/audio/formats.py)
+    fallback_samplerate = 44100
+    peaks = ObjectProperty(None, allownone=True) # NOTE PeakPyramid of the latest render, set once it has been built in the background
+    segmenter = SentenceSegmenter() # NOTE Shared with the editor, so segments, timing and play-from-cursor use the same boundaries
+    character_limit = None # NOTE Characters the API accepts per request (None for no limit), longer sentences are split
+    text_filters_revision = NumericProperty(0) # NOTE Incremented once the conversion of the text has changed, e.g. to count the billed characters again
 
     @classmethod
     def __new__(cls, *args, **kwargs):
@@ -81,27 +102,73 @@ class BaseApi(ABC, EventDispatcher):
     def __init__(self, settings: BaseApiSettings, **kwargs):
         super(BaseApi, self).__init__(**kwargs)
         self.settings = settings
-        self.q = queue.Queue(maxsize=self.buffersize)
-        self.event = threading.Event()
+        global_settings = App.get_running_app().global_settings
+        # NOTE Renders are always stored as PCM WAV under a unique name, so playback never decodes and never races a synthesis
+        self.artifacts = ArtifactStore(os.path.join(global_settings.get_tmp_dir(), "renders"))
+        # NOTE Opt-in, a warm stream keeps the output device open (and awake) while the app is running
+        keep_warm = global_settings.get_setting("Playback", "keep_warm", default=False)
+        self.playback = PlaybackService(blocksize=self.blocksize, keep_warm=keep_warm)
+        self.pronunciations = PronunciationDictionary()
+        try:
+            self.pronunciations.set_entries(global_settings.get_setting("Pronunciation", "entries", default={}))
+        except ValueError as e:
+            logging.error("%s: Invalid pronunciation dictionary: %s", self.__class__.__name__, e)
+        if keep_warm:
+            # NOTE Renders have the rate of the negotiated format (e.g. pcm_44100 on a 48 kHz device),
+            # warming up at the device rate would only make the first playback reopen the stream
+            output_format = self.negotiate_output_format()
+            try:
+                if output_format is not None:
+                    self.playback.warm_up(output_format.samplerate, output_format.channels)
+                else:
+                    self.playback.warm_up()
+            except Exception as e:
+                logging.error("Could not warm up output device: %s", e)
+
+    def update_pronunciations(self, entries: dict):
+        """
+        Replace the pronunciation dictionary and store it with the app settings.
+
+        Args:
+            entries (dict): Word -> {"ph": pronunciation, "alphabet": "ipa" or "x-sampa"} or {"alias": text}
+        Raises:
+            ValueError: Invalid entry (the dictionary is left unchanged)
+        """
+        digest = self.pronunciations.digest
+        self.pronunciations.set_entries(entries)
+        if self.pronunciations.digest != digest:
+            App.get_running_app().global_settings.update_setting("Pronunciation", "entries", entries)
+            self.update_text_filters(self.settings, None)
 
-    def play(self, audio_file_name="output_file.wav"):
+    def update_text_filters(self, instance, value):
         """
-        This method plays the given audio_file_name in the tmp folder.
+        This method may be overridden in derived classes, which convert the text before synthesis.
+        It's called when a setting of the conversion (e.g. the pronunciation dictionary) has changed.
+        Overrides increment text_filters_revision once the new filters are in place.
+        """
+        pass
+
+    def play(self, char_offset: int = None):
+        """
+        This method plays the latest render, which is resolved through the artifact manifest.
+        If char_offset is given and the render has a timing index, playback starts at the sentence containing that character.
 
         Only override it, if you need a special playback.
         """
-        # Placeholder implementation
-        app_instance = App.get_running_app()
-        tmp_path = app_instance.global_settings.get_tmp_dir()
-        if len(os.listdir(tmp_path)) == 0:
-            logging.error("Directory is empty. Press generate first!")
+        artifact = self.artifacts.latest()
+        if artifact is None or not os.path.exists(artifact.path):
+            logging.error("Nothing has been rendered yet. Press generate first!")
         else:
-            # name of your audio file
-            audio_path = os.path.join(tmp_path, audio_file_name)
+            audio_path = artifact.path
             logging.info("Playing audio file %s",audio_path)
-            logging.info("file exists %s",os.path.exists(audio_path))
+            start_frame = 0
+            timing_path = audio_path + self.timing_suffix
+            if char_offset is not None and os.path.exists(timing_path):
+                start_frame = TimingIndex.load(timing_path).sample_at(char_offset)
+                logging.info("Seeking to frame %d for character %d", start_frame, char_offset)
+            self.playback.metrics.play_requested()
             try:
-                t=threading.Thread(target=lambda: self.play_raw(audio_path))
+                t=threading.Thread(target=lambda: self.play_raw(audio_path, start_frame))
                 t.start()
             except Exception as error:
                 logging.error("Could not play audio file: %s, reason: %s", audio_path,error)
@@ -118,42 +185,225 @@ class BaseApi(ABC, EventDispatcher):
         """
         pass
 
-    def callback(self, outdata, frames, time, status):
-        assert frames == self.blocksize
-        if status.output_underflow:
-            print('Output underflow: increase blocksize?', file=sys.stderr)
-            raise sd.CallbackAbort
-        assert not status
+    def split_segments(self, text: str):
+        """
+        Split the text into the segments which are synthesized one by one: sentences, split again where they exceed
+        the character limit of the API. Open SSML and Speech Markdown elements are closed and reopened at the
+        boundaries (see modules/ssml/chunker.py).
+
+        Returns:
+            list: Chunk of every segment, segment text is chunk.text(text)
+        """
+        return SsmlChunker(self.segmenter, self.character_limit, self.measure_segment).split(text)
+
+    def measure_segment(self, segment_text: str) -> int:
+        """
+        This method may be overridden in derived classes, which convert the text before synthesis.
+        It should return the characters of the request for the segment, which are checked against the character limit.
+        """
+        return len(segment_text)
+
+    def character_quota(self):
+        """
+        This method may be overridden in derived classes, which bill by character.
+        It's called on a background thread and may query the API.
+
+        Returns:
+            tuple: (used, limit) characters of the current billing period, or None if unknown
+        """
+        return None
+
+    def negotiate_output_format(self):
+        """
+        Negotiate the format to request from the API against the native rate of the output device.
+
+        Returns:
+            OutputFormat: The format to request, or None if the API does not declare any output formats
+        """
         try:
-            data = self.q.get_nowait()
-        except queue.Empty as e:
-            print('Buffer is empty: increase buffersize?', file=sys.stderr)
-            raise sd.CallbackAbort from e
-        if len(data) < len(outdata):
-            outdata[:len(data)] = data
-            outdata[len(data):] = b'\x00' * (len(outdata) - len(data))
-            raise sd.CallbackStop
-        else:
-            outdata[:] = data
+            device_samplerate = self.playback.device_samplerate()
+        except Exception as e:
+            logging.error("Could not query output device: %s", e)
+            device_samplerate = self.fallback_samplerate
+        output_format = negotiate_output_format(self.output_formats, device_samplerate)
+        logging.info("Negotiated output format %s for device rate %d Hz", output_format, device_samplerate)
+        return output_format
+
+    @staticmethod
+    def decode(audio: bytes, output_format=None):
+        """
+        Decode audio returned by the API into float32 frames.
+
+        Args:
+            audio (bytes): Audio data as returned by the API
+            output_format (OutputFormat): Format of the data (None lets soundfile detect the container)
+        Returns:
+            tuple: (frames as np.ndarray of shape (frames, channels), sample rate)
+        """
+        if output_format is not None and output_format.is_pcm:
+            data = np.frombuffer(audio, dtype='<i2').astype(np.float32) / 32768.0
+            return data.reshape(-1, output_format.channels), output_format.samplerate
+        return sf.read(io.BytesIO(audio), dtype='float32', always_2d=True)
+
+    def render(self, text: str, chunks, out_filename: str, fetch_segment, output_format=None, voice: str = None, context=()):
+        """
+        Synthesize the chunks of the text into a single PCM WAV render and store its timing index next to it.
+        The render is written under a temporary name and recorded in the artifact manifest once it is complete.
+
+        Every segment is loudness normalized once after synthesis and then cached, so unchanged segments are
+        neither requested nor processed again. Only the edges of the whole render are trimmed (see RenderWriter),
+        so the pauses between the sentences are kept.
+
+        Args:
+            text (str): The complete input text
+            chunks (list): Chunk of every segment in text order (see split_segments())
+            out_filename (str): Path of the rendered audio file (see ArtifactStore.new_path())
+            fetch_segment (callable): fetch_segment(segment_text, output_format) returns (audio bytes, OutputFormat of the bytes)
+            output_format (OutputFormat): The negotiated format (None lets soundfile detect the container)
+            voice (str): Voice used for the synthesis, recorded in the manifest
+            context (tuple): API settings which influence the audio (e.g. voice and model), part of the cache key
+        """
+        global_settings = App.get_running_app().global_settings
+        trim = global_settings.get_setting("Processing", "trim_silence", default=True)
+        target_db = global_settings.get_setting("Processing", "loudness_db", default=-20.0)
+        cache_bytes = int(global_settings.get_setting("Processing", "segment_cache_mb", default=512) * 1024 * 1024)
+        cache = SegmentCache(os.path.join(global_settings.get_tmp_dir(), "segments"), cache_bytes)
+        cache.prune()  # NOTE Before the render, so its segments and peaks are never removed while they are in use
+        peak_builder = PeakBuilder()
+        peak_paths = []
+        format_name = output_format.name if output_format is not None else None
+        writer = RenderWriter(out_filename + ArtifactStore.partial_suffix, trim)
+        completed = False
+        try:
+            for number, chunk in enumerate(chunks):
+                segment_text = chunk.text(text)
+                key = SegmentCache.key(self.__class__.__name__, *context, format_name, target_db, segment_text)
+                cached = cache.get(key)
+                if cached is not None:
+                    data, samplerate = cached
+                else:
+                    audio, audio_format = fetch_segment(segment_text, output_format)
+                    if audio_format is not output_format:
+                        # NOTE The API fell back to another format (e.g. PCM is not available for the subscription),
+                        # the segment is cached under that format and the remaining segments are requested in it
+                        output_format = audio_format
+                        format_name = audio_format.name if audio_format is not None else None
+                        key = SegmentCache.key(self.__class__.__name__, *context, format_name, target_db, segment_text)
+                    data, samplerate = self.decode(audio, audio_format)
+                    data = process_segment(data, samplerate, target_db)
+                    cache.put(key, data, samplerate)
+                if writer.index is None:
+                    render_format = format_name  # NOTE The render has the layout of its first segment
+                data = writer.write(data, samplerate, chunk.start, last=number == len(chunks) - 1)
+                # NOTE Keyed by the written frames too, the first and the last segment are trimmed
+                peak_paths.append(cache.peaks_path(key, writer.samplerate, len(data)))
+                peak_builder.submit_segment(data, writer.samplerate, peak_paths[-1])
+            completed = True
+        finally:
+            writer.close(completed)
+        if writer.index is not None:
+            writer.index.save(out_filename + self.timing_suffix)
+            self.artifacts.add(out_filename, text, voice, render_format or "auto", writer.samplerate, writer.frames / writer.samplerate)
+            peak_builder.submit_render(peak_paths, out_filename, callback=self.set_peaks)
+
+    def save(self, target: str, on_progress=None, on_done=None):
+        """
+        Export the latest render to the target path in the background. The format is chosen by the extension (wav, flac, mp3 or ogg).
+
+        Args:
+            target (str): Path of the exported file
+            on_progress (callable): on_progress(fraction), called on the main thread
+            on_done (callable): on_done(target, error), called on the main thread (error is None on success)
+        Raises:
+            FileNotFoundError: Nothing has been synthesized yet
+            ValueError: Unsupported export format
+        """
+        artifact = self.artifacts.latest()
+        if artifact is None or not os.path.exists(artifact.path):
+            raise FileNotFoundError("Nothing has been rendered yet")
+        source = artifact.path
+        logging.info("Exporting %s to %s", source, target)
+
+        def progress(fraction):
+            if on_progress is not None:
+                Clock.schedule_once(lambda dt: on_progress(fraction))
+
+        def done(path, error):
+            if on_done is not None:
+                Clock.schedule_once(lambda dt: on_done(path, error))
+        Exporter().export(source, target, on_progress=progress, on_done=done)
+
+    def set_peaks(self, pyramid: PeakPyramid):
+        """Publish the peaks of a render (may be called from any thread, the property is updated on the main thread)."""
+        Clock.schedule_once(lambda dt: setattr(self, 'peaks', pyramid))
+
+    def load_peaks(self):
+        """Load the peaks of the latest render, if they exist."""
+        artifact = self.artifacts.latest()
+        if artifact is not None and os.path.exists(artifact.path + PeakPyramid.suffix):
+            self.peaks = PeakPyramid.load(artifact.path + PeakPyramid.suffix)
+
+    def play_segments(self, segments, samplerate: int, channels: int = 1) -> int:
+        """
+        Play the given segments back to back, replacing any playback in progress.
+
+        Args:
+            segments (iterable): float32 sample arrays with shape (frames,) or (frames, channels)
+            samplerate (int): Sample rate of all segments
+            channels (int): Channel count of all segments
+        Returns:
+            int: Playback generation, further segments can be added with append_segment() until finish_segments() is called
+        """
+        crossfade_frames = int(samplerate * self.crossfade_ms / 1000)
+        generation = self.playback.start(samplerate, channels, crossfade_frames)
+        for segment in segments:
+            if not self.playback.append(segment, generation):
+                break
+        return generation
+
+    def append_segment(self, samples, generation: int, crossfade: bool = True) -> bool:
+        """Append a segment to the running playback. Returns False, if that playback has been stopped or replaced."""
+        return self.playback.append(samples, generation, crossfade=crossfade)
+
+    def finish_segments(self, generation: int):
+        """Let the playback stop once all queued segments have been played."""
+        self.playback.finish(generation)
+
+    def pause(self):
+        self.playback.pause()
+
+    def resume(self):
+        self.playback.resume()
+
+    def stop(self):
+        self.playback.stop()
+
+    def is_paused(self) -> bool:
+        return self.playback.state == PlaybackService.PAUSED
+
+    def get_playback_metrics(self) -> dict:
+        """Return a snapshot of the playback metrics (underflows, queue starvation, callback, decode and start latency)."""
+        return self.playback.metrics.snapshot()
 
-    def play_raw(self, filename):
-        self.q = queue.Queue(maxsize=self.buffersize)
+    def play_raw(self, filename, start_frame: int = 0):
         try:
             with sf.SoundFile(filename) as f:
-                for _ in range(self.buffersize):
-                    data = f.buffer_read(self.blocksize, dtype='float32')
-                    if not data:
+                if start_frame:
+                    f.seek(start_frame)
+                generation = self.play_segments([], f.samplerate, f.channels)
+                first = True
+                decode_ms = self.playback.metrics.decode_ms
+                blocks = f.blocks(blocksize=self.blocksize * 16, dtype='float32', always_2d=True)
+                while True:
+                    started = time.perf_counter()
+                    block = next(blocks, None)
+                    if block is None:
                         break
-                    self.q.put_nowait(data)  # Pre-fill queue
-                stream = sd.RawOutputStream(
-                    samplerate=f.samplerate, blocksize=self.blocksize,
-                    channels=f.channels, dtype='float32',
-                    callback=self.callback, finished_callback=self.event.set)
-                with stream:
-                    timeout = self.blocksize * self.buffersize / f.samplerate
-                    while data:
-                        data = f.buffer_read(self.blocksize, dtype='float32')
-                        self.q.put(data, timeout=timeout)
-                    self.event.wait()  # Wait until playback is finished
+                    decode_ms.record((time.perf_counter() - started) * 1000)
+                    # NOTE Only the first block of a file is crossfaded, the rest continues the same segment
+                    if not self.append_segment(block, generation, crossfade=first):
+                        return  # Playback was stopped or replaced by another play
+                    first = False
+                self.finish_segments(generation)
         except Exception as e:
             logging.error(type(e).__name__ + ': ' + str(e))
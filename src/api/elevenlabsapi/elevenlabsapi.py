@@ -1,5 +1,7 @@
 try:
     from elevenlabs import voices, generate, play, save, set_api_key, get_api_key, VoiceSettings
+    from elevenlabs.api.base import API, api_base_url_v1
+    from elevenlabs.api.error import APIError
 except ImportError:
     raise ImportError(
         "Please install elevenlabs module: pip install elevenlabs (for installation details: https://github.com/elevenlabs/elevenlabs-python)")
@@ -13,8 +15,14 @@ from kivy.logger import Logger as log
 from kivymd.uix.screen import MDScreen
 from typing import Iterator, List
 from ..base import BaseApiSettings, BaseApi
+from modules.audio.formats import OutputFormat
+from modules.ssml.breaks import BreakConverter, DEFAULT_BREAKS
+from modules.ssml.normalizer import TextNormalizer
 from kivy.uix.button import Button
 from kivy.uix.dropdown import DropDown
+from importlib import import_module
+# NOTE The package name contains a hyphen, so it can't be imported with an import statement
+SpeechMarkdownCompiler = import_module("modules.speech-markdown.compiler").SpeechMarkdownCompiler
 
 class ElevenLabsAPIWidget(MDScreen):
     settings = ObjectProperty(None)
@@ -23,6 +31,7 @@ class ElevenLabsAPIWidget(MDScreen):
     api_key_input = ObjectProperty(None)
     voice_selection = ObjectProperty(None)
     model_selection = ObjectProperty(None)
+    breaks_input = ObjectProperty(None)
     voice_names = ListProperty()
     model_names = ListProperty()
 
@@ -69,6 +78,8 @@ class ElevenLabsAPISettings(BaseApiSettings):
     api_key_text = StringProperty("")
     voice_text = StringProperty("")
     model_text = StringProperty("")
+    breaks_text = StringProperty(BreakConverter.format_rules(DEFAULT_BREAKS))  # NOTE Pauses inserted in front of punctuation, e.g. ".=0.5s"
+    language_text = StringProperty("en")  # NOTE Language of the text normalization (numbers, dates, units and abbreviations)
 
     @classmethod
     def isSupported(cls):
@@ -100,6 +111,11 @@ class ElevenLabsAPISettings(BaseApiSettings):
         # Changes in settings object, update widget
         self.bind(voice_text=self.widget.voice_selection.setter('text'))
 
+        # Changes in widget, update settings object
+        self.widget.breaks_input.bind(text=self.update_settings)
+        # Changes in settings object, update widget
+        self.bind(breaks_text=self.widget.breaks_input.setter('text'))
+
         self.load_settings()
 
     # loads the settings from the settings file.
@@ -111,16 +127,29 @@ class ElevenLabsAPISettings(BaseApiSettings):
             self.api_name, "voice", default="Serena")
         self.model_text = app_instance.global_settings.get_setting(
             self.api_name, "model", default=ElevenLabsAPI.get_models()[0])
+        self.breaks_text = BreakConverter.format_rules(app_instance.global_settings.get_setting(
+            self.api_name, "breaks", default=DEFAULT_BREAKS))
+        self.language_text = app_instance.global_settings.get_setting(
+            self.api_name, "language", default="en")
 
     # saves the settings to the settings file.
     def save_settings(self):
         app_instance = App.get_running_app()
-        app_instance.global_settings.update_setting(
-            self.api_name, "api_key", self.api_key_text)
-        app_instance.global_settings.update_setting(
-            self.api_name, "voice", self.voice_text)
-        app_instance.global_settings.update_setting(
-            self.api_name, "model", self.model_text)
+        # NOTE Written to the settings file once, after all settings have been updated
+        with app_instance.global_settings.batch():
+            app_instance.global_settings.update_setting(
+                self.api_name, "api_key", self.api_key_text)
+            app_instance.global_settings.update_setting(
+                self.api_name, "voice", self.voice_text)
+            app_instance.global_settings.update_setting(
+                self.api_name, "model", self.model_text)
+            try:
+                app_instance.global_settings.update_setting(
+                    self.api_name, "breaks", BreakConverter(BreakConverter.parse_rules(self.breaks_text)).breaks)
+            except ValueError as e:
+                log.error("%s: Pauses not saved: %s", self.__class__.__name__, e)
+            app_instance.global_settings.update_setting(
+                self.api_name, "language", self.language_text)
 
     # Updates the settings: Stores current values of the widget properties in the settings properties.
     def update_settings(self, instance, value):
@@ -128,6 +157,7 @@ class ElevenLabsAPISettings(BaseApiSettings):
         self.api_key_text=self.widget.api_key_input.text
         self.model_text=self.widget.model_selection.text
         self.voice_text=self.widget.voice_selection.text
+        self.breaks_text=self.widget.breaks_input.text
         #self.save_settings()
 
 class ElevenLabsAPI(BaseApi):
@@ -135,11 +165,26 @@ class ElevenLabsAPI(BaseApi):
         "eleven_multilingual_v2",
         "eleven_monolingual_v1"
     ]
+    # NOTE Raw PCM is preferred, since it is neither decoded nor resampled (pcm_44100 requires a Pro subscription)
+    output_formats = [
+        OutputFormat("pcm_44100", "pcm", 44100),
+        OutputFormat("pcm_24000", "pcm", 24000),
+        OutputFormat("pcm_22050", "pcm", 22050),
+        OutputFormat("pcm_16000", "pcm", 16000),
+        OutputFormat("mp3_44100_128", "mp3", 44100)
+    ]
+    codec_format = output_formats[-1] # NOTE Used when the subscription does not allow the negotiated PCM format
+    character_limit = 5000 # NOTE Request limit of the monolingual model, the multilingual model accepts more
 
     def __init__(self, settings: ElevenLabsAPISettings = None):
         super(ElevenLabsAPI, self).__init__(settings)
         logging.debug("Initializing ElevenLabsAPI instance...")
         self.settings = settings
+        self.break_converter = BreakConverter(escape=True)
+        self.normalizer = TextNormalizer(text_filter=self.break_converter.convert)
+        self.markdown_compiler = SpeechMarkdownCompiler(self.normalizer.convert)
+        self.update_text_filters(self.settings, None)
+        self.settings.bind(breaks_text=self.update_text_filters, language_text=self.update_text_filters)
         self.init_api()
 
     def init_api(self):
@@ -174,23 +219,46 @@ class ElevenLabsAPI(BaseApi):
         self.settings.save_settings()
         self.init_api()
 
-    # neue Funktion
+    def update_text_filters(self, instance, value):
+        """
+        Rebuild the text filters from the configured pauses, language and pronunciation dictionary
+        (invalid settings keep the previous ones). The dictionary is applied first, the normalizer and the
+        break converter only see the text around its words. A new compiler drops the compiled paragraphs.
+        """
+        try:
+            self.break_converter = BreakConverter(BreakConverter.parse_rules(self.settings.breaks_text), escape=True)
+        except ValueError as e:
+            log.error("%s: Invalid pauses '%s': %s", self.__class__.__name__, self.settings.breaks_text, e)
+        try:
+            self.normalizer = TextNormalizer(self.settings.language_text, text_filter=self.break_converter.convert)
+        except ValueError as e:
+            log.error("%s: %s", self.__class__.__name__, e)
+            self.normalizer = TextNormalizer(self.normalizer.language, text_filter=self.break_converter.convert)
+        self.pronunciations.text_filter = self.normalizer.convert
+        self.markdown_compiler = SpeechMarkdownCompiler(self.pronunciations.convert)
+        self.text_filters_revision += 1
+
     def convert_text(self, text: str):
-        text_arr = list(text)
-        output_text = ""
-        for char in text_arr:
-            # print(char)
-            if char == ",":  # default pause
-                output_text = output_text + "<break time=\"0.0s\" />"
+        """
+        Compile the Speech Markdown of the text into SSML, apply the pronunciation dictionary, annotate numbers,
+        dates, units and abbreviations and insert the configured breaks in front of punctuation.
 
-            elif char == "." or char == "?" or char == "!":
-                output_text = output_text + "<break time=\"0.5s\" />"
+        Raises:
+            SpeechMarkdownError: Invalid Speech Markdown
+        """
+        return self.markdown_compiler.compile(text)
 
-            elif char == ";":
-                output_text = output_text + "<break time=\"0.5s\" />"
+    def measure_segment(self, segment_text: str) -> int:
+        """The limit applies to the SSML sent to the API, which is longer than the Speech Markdown typed into the editor."""
+        return len(self.convert_text(segment_text))
 
-            output_text = output_text + char
-        return output_text
+    def character_quota(self):
+        try:
+            subscription = API.get(f"{api_base_url_v1}/user/subscription").json()
+            return subscription["character_count"], subscription["character_limit"]
+        except (APIError, OSError, KeyError, ValueError) as e:
+            log.error("%s: Could not query the character quota: %s", self.__class__.__name__, e)
+            return None
 
     def synthesize(self, input: str, out_filename: str = None):
         """
@@ -212,21 +280,61 @@ class ElevenLabsAPI(BaseApi):
         self.model = self.settings.model_text
         set_api_key(self.settings.api_key_text)
 
-        # TODO: hier neuer Teil
-        converted_input = self.convert_text(input)
-
-        audio = generate(text=converted_input, voice=self.voice,
-                         model=self.model, stream=shouldStream)
         if (shouldStream):
+            # TODO: hier neuer Teil
+            converted_input = self.convert_text(input)
+            audio = generate(text=converted_input, voice=self.voice,
+                             model=self.model, stream=shouldStream)
             play(audio)
         else:
-            save(audio, out_filename)
+            # Synthesize sentence by sentence, so the timing index can map the text to the rendered audio
+            self.render(input, self.split_segments(input), out_filename, self.fetch_segment,
+                        self.negotiate_output_format(), voice=self.settings.voice_text,
+                        context=(self.settings.voice_text, self.model,
+                                 BreakConverter.format_rules(self.break_converter.breaks), self.normalizer.language,
+                                 self.pronunciations.digest))
+
+    def fetch_segment(self, text: str, output_format: OutputFormat = None):
+        """
+        Convert and synthesize a single segment.
 
-    def save(self):
+        Returns:
+            tuple: (audio bytes, OutputFormat of the audio)
         """
-        now you can choose where to save the file .
+        converted = self.convert_text(text)
+        try:
+            return self.generate_segment(converted, output_format), output_format
+        except APIError as e:
+            if output_format is None or not output_format.is_pcm:
+                raise
+            log.warning("%s: %s not available (%s), falling back to %s",
+                        self.__class__.__name__, output_format.name, e, self.codec_format.name)
+            # NOTE Only the codec is negotiated from now on, since the subscription does not allow PCM
+            self.output_formats = [self.codec_format]
+            return self.generate_segment(converted, self.codec_format), self.codec_format
+
+    def generate_segment(self, text: str, output_format: OutputFormat = None) -> bytes:
+        """
+        Request the audio of a single segment.
+
+        Args:
+            text (str): Converted text of the segment
+            output_format (OutputFormat): Format to request (None returns the default format of the SDK)
+        Returns:
+            bytes: Audio data in the requested format
         """
-        pass 
+        if output_format is None:
+            return generate(text=text, voice=self.voice, model=self.model)
+        if self.voice is None:
+            raise ValueError(f"Voice '{self.settings.voice_text}' not found")
+        # NOTE The SDK's generate() can't select the output format, so the endpoint is called directly
+        url = f"{api_base_url_v1}/text-to-speech/{self.voice.voice_id}?output_format={output_format.name}"
+        data = dict(
+            text=text,
+            model_id=self.model,
+            voice_settings=self.voice.settings.model_dump() if self.voice.settings else None
+        )
+        return API.post(url, json=data).content
 
     @staticmethod
     def get_config():
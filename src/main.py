@@ -11,12 +11,15 @@ from kivymd.uix.list import MDListItemTrailingIcon
 # stdlib
 import os
 import sys
+import multiprocessing
 from pathlib import Path
 # Custom
 from screens.about import About
 from screens.settings import Settings
 from screens.main_screen import MainScreen
 from modules.dialog.exitdialog import ExitDialog
+from modules.dialog.recoverydialog import RecoveryDialog
+from modules.editor.editor import DocumentEditor
 from modules.util.widget_loader import load_widget
 from settings.app_settings import GlobalSettings
 from api.api_factory import load_apis
@@ -38,6 +41,8 @@ class SpeechJokey(MDApp):
         # load_widget(os.path.join(os.path.dirname(loaddialog.__file__), 'loaddialog.kv'))
         # load_widget(os.path.join(os.path.dirname(savedialog.__file__), 'savedialog.kv'))
         # load_widget(os.path.join(os.path.dirname(app_settings.__file__), 'AppSettingsPopup.kv'))
+        load_widget(os.path.join(os.path.dirname(
+            sys.modules[DocumentEditor.__module__].__file__), 'editor.kv'))
         load_widget(os.path.join(os.path.dirname(
             sys.modules[MainScreen.__module__].__file__), 'main_screen.kv'))
         load_widget(os.path.join(os.path.dirname(
@@ -46,6 +51,8 @@ class SpeechJokey(MDApp):
             sys.modules[About.__module__].__file__), 'about.kv'))
         load_widget(os.path.join(os.path.dirname(
             sys.modules[ExitDialog.__module__].__file__), 'exitdialog.kv'))
+        load_widget(os.path.join(os.path.dirname(
+            sys.modules[RecoveryDialog.__module__].__file__), 'recoverydialog.kv'))
         self.sm = ScreenManager()
         # self.screens = [Screen(name='Title {}'.format(i)) for i in range(4)]
         # self.screens = {
@@ -67,7 +74,14 @@ class SpeechJokey(MDApp):
         self.sm.add_widget(About(title="About", name="about"))
         return self.sm
 
+    def on_stop(self):
+        # NOTE Pending changes and edits are saved before the process exits
+        for saved in (self.global_settings.flush(), self.sm.get_screen("main").autosave.flush()):
+            if saved is not None:
+                saved.result()
+
 if __name__ == '__main__':
+    multiprocessing.freeze_support() # NOTE Required for the export process in PyInstaller bundles
     if hasattr(sys, '_MEIPASS'):
         resource_add_path(os.path.join(sys._MEIPASS))
     log.info(f"Using APP_DIR={APP_DIR}")
@@ -0,0 +1,117 @@
+"""artifacts.py
+
+Manifest of rendered audio files, backed by SQLite.
+"""
+from collections import namedtuple
+from contextlib import contextmanager
+import glob
+import hashlib
+import os
+import sqlite3
+import time
+import uuid
+
+Artifact = namedtuple("Artifact", ["id", "created", "text_hash", "voice", "format", "samplerate", "duration", "path"])
+
+
+class ArtifactStore:
+    """
+    Stores every render under a unique file name and records it in a manifest,
+    so readers resolve renders through the index instead of scanning or sharing a fixed file name.
+
+    Renders are written under a temporary name (see new_path()) and only become visible once add() has
+    renamed them into place and recorded them, so a concurrent play never sees a partial file.
+
+    Args:
+        directory (str): Directory of the renders and the manifest (created if missing)
+        keep (int): Number of renders kept on disk, older ones are removed when a new render is added
+    """
+    manifest_name = "artifacts.sqlite"
+    partial_suffix = ".part"
+
+    def __init__(self, directory: str, keep: int = 20):
+        self.directory = directory
+        self.keep = keep
+        os.makedirs(self.directory, exist_ok=True)
+        self.manifest = os.path.join(self.directory, self.manifest_name)
+        with self._connect() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS artifacts (
+                id TEXT PRIMARY KEY,
+                created REAL NOT NULL,
+                text_hash TEXT NOT NULL,
+                voice TEXT,
+                format TEXT,
+                samplerate INTEGER,
+                duration REAL,
+                path TEXT NOT NULL)""")
+            db.execute("CREATE INDEX IF NOT EXISTS artifacts_created ON artifacts (created)")
+
+    @contextmanager
+    def _connect(self):
+        # NOTE A connection per operation, since renders are recorded from worker threads
+        db = sqlite3.connect(self.manifest, timeout=5)
+        try:
+            with db:  # Commits on success, rolls back on errors
+                yield db
+        finally:
+            db.close()
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def new_path(self, extension: str = "wav") -> str:
+        """Return a unique path for a new render. Write it to path + partial_suffix, then pass it to add()."""
+        return os.path.join(self.directory, f"{uuid.uuid4().hex}.{extension}")
+
+    def add(self, path: str, text: str, voice: str, format: str, samplerate: int, duration: float) -> Artifact:
+        """
+        Rename the completed render into place and record it in the manifest.
+
+        Args:
+            path (str): Path returned by new_path(), the render must have been written to path + partial_suffix
+            text (str): Synthesized text
+            voice (str): Voice used for the synthesis
+            format (str): Format the API returned the render in
+            samplerate (int): Sample rate of the render
+            duration (float): Duration of the render in seconds
+        Returns:
+            Artifact: The recorded render
+        """
+        os.replace(path + self.partial_suffix, path)
+        artifact = Artifact(os.path.splitext(os.path.basename(path))[0], time.time(), self.text_hash(text),
+                            voice, format, samplerate, duration, path)
+        with self._connect() as db:
+            db.execute("INSERT INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?, ?)", artifact)
+        self.prune()
+        return artifact
+
+    def latest(self):
+        """Return the most recent render, or None if nothing has been rendered yet."""
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM artifacts ORDER BY created DESC LIMIT 1").fetchone()
+        return Artifact(*row) if row else None
+
+    def find(self, text: str, voice: str = None):
+        """Return the most recent render of the given text (and voice), or None."""
+        query = "SELECT * FROM artifacts WHERE text_hash = ?"
+        params = [self.text_hash(text)]
+        if voice is not None:
+            query += " AND voice = ?"
+            params.append(voice)
+        with self._connect() as db:
+            row = db.execute(query + " ORDER BY created DESC LIMIT 1", params).fetchone()
+        return Artifact(*row) if row else None
+
+    def prune(self):
+        """Remove all but the newest `keep` renders, including their sidecar files (timing index, peaks)."""
+        with self._connect() as db:
+            rows = db.execute("SELECT id, path FROM artifacts ORDER BY created DESC LIMIT -1 OFFSET ?",
+                              (self.keep,)).fetchall()
+            for artifact_id, path in rows:
+                try:
+                    for file in glob.glob(glob.escape(path) + "*"):
+                        os.remove(file)
+                except OSError:
+                    continue  # NOTE Still in use (e.g. being played or exported), retried on the next render
+                db.execute("DELETE FROM artifacts WHERE id = ?", (artifact_id,))
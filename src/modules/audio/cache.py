@@ -0,0 +1,94 @@
+"""cache.py
+
+Cache of processed audio segments, so unchanged sentences are neither synthesized nor processed twice.
+"""
+import glob
+import hashlib
+import logging
+import os
+
+import soundfile as sf  # type: ignore
+
+from modules.audio.peaks import PeakPyramid
+
+
+class SegmentCache:
+    """
+    Directory of processed segments, stored as float WAV files named by a content hash.
+
+    The cache is kept below a byte budget: prune() removes the least recently used segments (a hit touches the
+    file) together with their peak pyramids, until the files fit into max_bytes.
+
+    Args:
+        directory (str): Cache directory (created if missing)
+        max_bytes (int): Size of the cached segments and peaks kept on disk
+    """
+    suffix = ".wav"
+
+    def __init__(self, directory: str, max_bytes: int = 512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(*parts) -> str:
+        """Return the cache key for everything that influences a segment's audio (text, voice, model, format, processing)."""
+        digest = hashlib.sha1()
+        for part in parts:
+            digest.update(str(part).encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.suffix)
+
+    def peaks_path(self, key: str, samplerate: int, frames: int) -> str:
+        """Return the path of the peak pyramid of the segment as written to a render (rate and length), stored next to the cached audio."""
+        return os.path.join(self.directory, f"{key}.{samplerate}.{frames}{PeakPyramid.suffix}")
+
+    def get(self, key: str):
+        """
+        Returns:
+            tuple: (float32 frames of shape (frames, channels), sample rate), or None if the segment is not cached
+        """
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            os.utime(path)  # NOTE Marks the segment as recently used for prune()
+        except OSError:
+            pass
+        return sf.read(path, dtype='float32', always_2d=True)
+
+    def put(self, key: str, samples, samplerate: int):
+        """Store a processed segment. The file is written under a temporary name and renamed, so readers never see partial files."""
+        path = self.path(key)
+        tmp_path = path + ".part"
+        sf.write(tmp_path, samples, samplerate, subtype='FLOAT', format='WAV')
+        os.replace(tmp_path, path)
+
+    def prune(self):
+        """Remove the least recently used segments and their peaks until the cache fits into max_bytes."""
+        entries = []
+        total = 0
+        for path in glob.glob(os.path.join(glob.escape(self.directory), "*" + self.suffix)):
+            key = os.path.basename(path)[:-len(self.suffix)]
+            files = [path] + glob.glob(os.path.join(glob.escape(self.directory), glob.escape(key) + ".*" + PeakPyramid.suffix))
+            try:
+                used = os.path.getmtime(path)
+                size = sum(os.path.getsize(file) for file in files)
+            except OSError:
+                continue  # NOTE Removed concurrently
+            entries.append((used, size, files))
+            total += size
+        entries.sort()
+        for used, size, files in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                for file in files:
+                    os.remove(file)
+            except OSError as e:
+                logging.debug("%s: Could not remove %s: %s", self.__class__.__name__, files[0], e)
+                continue  # NOTE Retried on the next render
+            total -= size
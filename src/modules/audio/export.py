@@ -0,0 +1,105 @@
+"""export.py
+
+Encodes renders into user-chosen formats in a separate process.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+
+import soundfile as sf  # type: ignore
+
+# NOTE Maps the file extension to the soundfile (libsndfile) format and subtype
+EXPORT_FORMATS = {
+    "wav": ("WAV", "PCM_16"),
+    "flac": ("FLAC", "PCM_16"),
+    "mp3": ("MP3", "MPEG_LAYER_III"),
+    "ogg": ("OGG", "VORBIS")
+}
+
+
+def export_format(path: str):
+    """
+    Returns:
+        tuple: (format, subtype) for the extension of the path
+    Raises:
+        ValueError: Unsupported extension
+    """
+    extension = os.path.splitext(path)[1][1:].lower()
+    if extension not in EXPORT_FORMATS:
+        raise ValueError(f'Unsupported export format: {extension} (must be one of: {", ".join(EXPORT_FORMATS)})')
+    return EXPORT_FORMATS[extension]
+
+
+def encode(source: str, target: str, progress, blocksize: int = 65536):
+    """
+    Stream the source audio block by block into the target file, so memory stays flat for long renders.
+    Runs in the export process and reports the progress (0.0 - 1.0) through the progress queue.
+    The target is written under a temporary name and renamed once complete.
+    """
+    try:
+        file_format, subtype = export_format(target)
+        tmp_target = target + ".part"
+        with sf.SoundFile(source) as src:
+            total = max(src.frames, 1)
+            with sf.SoundFile(tmp_target, 'w', samplerate=src.samplerate, channels=src.channels,
+                              format=file_format, subtype=subtype) as dst:
+                done = 0
+                for block in src.blocks(blocksize=blocksize, dtype='float32'):
+                    dst.write(block)
+                    done += len(block)
+                    progress.put(("progress", done / total))
+        os.replace(tmp_target, target)
+        progress.put(("done", target))
+    except Exception as e:
+        progress.put(("error", f"{type(e).__name__}: {e}"))
+
+
+class Exporter:
+    """
+    Runs exports in a background process, so encoding neither blocks the UI nor competes with it for the GIL.
+    """
+    def __init__(self):
+        self._context = multiprocessing.get_context("spawn")
+
+    def export(self, source: str, target: str, on_progress=None, on_done=None):
+        """
+        Start exporting the source audio into the target file. The format is chosen by the target's extension.
+
+        Args:
+            source (str): Path of the rendered audio
+            target (str): Path of the exported file (wav, flac, mp3 or ogg)
+            on_progress (callable): on_progress(fraction), called from a watcher thread
+            on_done (callable): on_done(target, error), called from a watcher thread (error is None on success)
+        Returns:
+            multiprocessing.Process: The export process
+        Raises:
+            ValueError: Unsupported target format
+        """
+        export_format(target)  # NOTE Validate before spawning a process
+        progress = self._context.Queue()
+        process = self._context.Process(target=encode, args=(source, target, progress), daemon=True)
+        process.start()
+
+        def watch():
+            error = "Export process terminated unexpectedly"
+            while True:
+                try:
+                    kind, value = progress.get(timeout=0.5)
+                except Exception:
+                    if not process.is_alive():
+                        break
+                    continue
+                if kind == "progress":
+                    if on_progress is not None:
+                        on_progress(value)
+                    continue
+                error = None if kind == "done" else value
+                break
+            process.join()
+            if error is not None:
+                logging.error("%s: Export to %s failed: %s", self.__class__.__name__, target, error)
+            if on_done is not None:
+                on_done(target, error)
+        threading.Thread(target=watch, daemon=True).start()
+        return process
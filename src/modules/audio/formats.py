@@ -0,0 +1,56 @@
+"""formats.py
+
+Output formats declared by the speech synthesis backends and their negotiation against the output device.
+"""
+
+
+class OutputFormat:
+    """
+    Audio format a backend can return.
+
+    Args:
+        name (str): Name of the format as understood by the backend (e.g. "pcm_44100")
+        codec (str): "pcm" for raw signed 16 bit little endian samples, otherwise the codec name (e.g. "mp3")
+        samplerate (int): Sample rate in Hz
+        channels (int): Channel count
+    """
+    def __init__(self, name: str, codec: str, samplerate: int, channels: int = 1):
+        self.name = name
+        self.codec = codec
+        self.samplerate = samplerate
+        self.channels = channels
+
+    @property
+    def is_pcm(self) -> bool:
+        return self.codec == "pcm"
+
+    def __repr__(self) -> str:
+        return f"OutputFormat({self.name}: {self.codec}, {self.samplerate} Hz, {self.channels} ch)"
+
+
+def negotiate_output_format(formats, device_samplerate: int):
+    """
+    Pick the format that needs the least work on the play path.
+
+    Preference order:
+        1. PCM at the native rate of the device (no decoding, no resampling)
+        2. A declared codec at the native rate (decoded once at synthesis, no resampling)
+        3. The PCM format with the highest rate (the stream is opened at that rate)
+        4. The first declared format
+
+    Args:
+        formats (list): OutputFormat instances declared by the backend, in the backend's order of preference
+        device_samplerate (int): Native sample rate of the output device
+    Returns:
+        OutputFormat: The negotiated format, or None if the backend declares no formats
+    """
+    if not formats:
+        return None
+    for wants_pcm in (True, False):
+        for output_format in formats:
+            if output_format.is_pcm == wants_pcm and output_format.samplerate == device_samplerate:
+                return output_format
+    pcm_formats = [output_format for output_format in formats if output_format.is_pcm]
+    if pcm_formats:
+        return max(pcm_formats, key=lambda output_format: output_format.samplerate)
+    return formats[0]
@@ -0,0 +1,113 @@
+"""metrics.py
+
+Low overhead counters for the playback path.
+"""
+from bisect import bisect_left
+import time
+
+
+class LatencyHistogram:
+    """
+    Histogram with fixed bucket bounds, recording a sample is a single bisect and increment.
+
+    Args:
+        bounds (list): Upper bounds of the buckets in milliseconds (a final overflow bucket is added)
+    """
+    def __init__(self, bounds):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.maximum = 0.0
+
+    def record(self, value_ms: float):
+        self.counts[bisect_left(self.bounds, value_ms)] += 1
+        self.total += 1
+        if value_ms > self.maximum:
+            self.maximum = value_ms
+
+    def percentile(self, fraction: float) -> float:
+        """Return the upper bound of the bucket containing the given fraction of samples (inf for the overflow bucket)."""
+        if self.total == 0:
+            return 0.0
+        threshold = fraction * self.total
+        seen = 0
+        for bound, count in zip(self.bounds + [float('inf')], self.counts):
+            seen += count
+            if seen >= threshold:
+                return bound
+        return float('inf')
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.maximum = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "bounds_ms": self.bounds,
+            "counts": list(self.counts),
+            "max_ms": round(self.maximum, 3),
+            "p50_ms": self.percentile(0.5),
+            "p99_ms": self.percentile(0.99)
+        }
+
+
+class PlaybackMetrics:
+    """
+    Counters collected by the playback service. Recording only does integer arithmetic on preallocated state,
+    so the metrics can stay enabled in production builds.
+
+    Attributes:
+        underflows (int): Device underflows reported by the output stream (device is starved)
+        starvations (int): Callbacks during playback which found the queue empty (decode or queue is too slow)
+        callbacks (int): Number of audio callbacks
+        queue_frames (int): Frames queued ahead at the last callback
+        queue_low_water (int): Lowest number of queued frames seen during playback
+        callback_ms (LatencyHistogram): Time spent inside the audio callback
+        decode_ms (LatencyHistogram): Time spent decoding one block in the producer
+        start_latency_ms (LatencyHistogram): Time from the play request until the first sample reaches the device
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.underflows = 0
+        self.starvations = 0
+        self.callbacks = 0
+        self.queue_frames = 0
+        self.queue_low_water = None
+        self.callback_ms = LatencyHistogram([0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10])
+        self.decode_ms = LatencyHistogram([0.5, 1, 2, 5, 10, 20, 50, 100])
+        self.start_latency_ms = LatencyHistogram([5, 10, 20, 50, 100, 200, 500, 1000])
+        self._play_requested = None
+
+    def play_requested(self):
+        """Remember when playback was requested, the latency is recorded with the first played sample."""
+        self._play_requested = time.perf_counter()
+
+    def first_sample(self, output_delay: float = 0.0):
+        """
+        Args:
+            output_delay (float): Seconds until the current block is audible (reported by the device)
+        """
+        if self._play_requested is not None:
+            self.start_latency_ms.record((time.perf_counter() - self._play_requested + output_delay) * 1000)
+            self._play_requested = None
+
+    def queue_level(self, frames: int, track_low_water: bool = True):
+        self.queue_frames = frames
+        if track_low_water and (self.queue_low_water is None or frames < self.queue_low_water):
+            self.queue_low_water = frames
+
+    def snapshot(self) -> dict:
+        """Return a copy of all metrics as plain data."""
+        return {
+            "underflows": self.underflows,
+            "starvations": self.starvations,
+            "callbacks": self.callbacks,
+            "queue_frames": self.queue_frames,
+            "queue_low_water": self.queue_low_water or 0,
+            "callback_ms": self.callback_ms.to_dict(),
+            "decode_ms": self.decode_ms.to_dict(),
+            "start_latency_ms": self.start_latency_ms.to_dict()
+        }
@@ -0,0 +1,180 @@
+"""peaks.py
+
+Multi-resolution min/max peaks of rendered audio, so waveform views never touch raw samples.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+
+import numpy as np
+
+
+class PeakPyramid:
+    """
+    Mipmap of (min, max) pairs per bucket. Level 0 holds one pair per base_bucket frames,
+    every further level combines factor buckets of the level below.
+
+    Args:
+        mins (list): np.ndarray of bucket minima per level
+        maxs (list): np.ndarray of bucket maxima per level
+        base_bucket (int): Frames per bucket on level 0
+        factor (int): Reduction factor between two levels
+        samplerate (int): Sample rate of the source audio
+    """
+    suffix = ".peaks.npz"
+
+    def __init__(self, mins, maxs, base_bucket: int = 64, factor: int = 4, samplerate: int = 0):
+        self.mins = mins
+        self.maxs = maxs
+        self.base_bucket = base_bucket
+        self.factor = factor
+        self.samplerate = samplerate
+
+    @property
+    def levels(self) -> int:
+        return len(self.mins)
+
+    @property
+    def frames(self) -> int:
+        """Approximate length of the source audio in frames."""
+        return len(self.mins[0]) * self.base_bucket if self.mins else 0
+
+    def bucket_size(self, level: int) -> int:
+        return self.base_bucket * self.factor ** level
+
+    @staticmethod
+    def _reduce(mins: np.ndarray, maxs: np.ndarray, factor: int):
+        pad = (-len(mins)) % factor
+        if pad:
+            mins = np.concatenate([mins, np.repeat(mins[-1:], pad)])
+            maxs = np.concatenate([maxs, np.repeat(maxs[-1:], pad)])
+        return mins.reshape(-1, factor).min(axis=1), maxs.reshape(-1, factor).max(axis=1)
+
+    @classmethod
+    def from_level0(cls, mins: np.ndarray, maxs: np.ndarray, base_bucket: int = 64, factor: int = 4,
+                    samplerate: int = 0) -> 'PeakPyramid':
+        """Build all higher levels from the level 0 peaks (until a level has a single bucket)."""
+        level_mins, level_maxs = [mins], [maxs]
+        while len(level_mins[-1]) > 1:
+            reduced_mins, reduced_maxs = cls._reduce(level_mins[-1], level_maxs[-1], factor)
+            level_mins.append(reduced_mins)
+            level_maxs.append(reduced_maxs)
+        return cls(level_mins, level_maxs, base_bucket, factor, samplerate)
+
+    @classmethod
+    def from_samples(cls, samples: np.ndarray, samplerate: int = 0, base_bucket: int = 64,
+                     factor: int = 4) -> 'PeakPyramid':
+        """
+        Args:
+            samples (np.ndarray): float32 frames of shape (frames, channels), channels are mixed down
+        """
+        mono = samples.mean(axis=1) if samples.ndim == 2 else samples
+        if len(mono) == 0:
+            empty = np.zeros(0, dtype=np.float32)
+            return cls([empty], [empty], base_bucket, factor, samplerate)
+        pad = (-len(mono)) % base_bucket
+        if pad:
+            mono = np.concatenate([mono, np.zeros(pad, dtype=mono.dtype)])
+        buckets = mono.reshape(-1, base_bucket)
+        return cls.from_level0(buckets.min(axis=1), buckets.max(axis=1), base_bucket, factor, samplerate)
+
+    @classmethod
+    def concatenate(cls, pyramids) -> 'PeakPyramid':
+        """Join the pyramids of consecutive segments into the pyramid of the whole render (level 0 is reused, no samples are read)."""
+        pyramids = list(pyramids)
+        if not pyramids:
+            return cls.from_samples(np.zeros(0, dtype=np.float32))
+        first = pyramids[0]
+        mins = np.concatenate([pyramid.mins[0] for pyramid in pyramids])
+        maxs = np.concatenate([pyramid.maxs[0] for pyramid in pyramids])
+        return cls.from_level0(mins, maxs, first.base_bucket, first.factor, first.samplerate)
+
+    def window(self, start_frame: int, end_frame: int, columns: int):
+        """
+        Return min/max peaks for columns of a frame range, read from the coarsest level that still has one bucket per column.
+
+        Returns:
+            tuple: (mins, maxs) arrays with up to columns entries
+        """
+        if columns <= 0 or end_frame <= start_frame or not self.frames:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+        frames_per_column = (end_frame - start_frame) / columns
+        level = 0
+        while level + 1 < self.levels and self.bucket_size(level + 1) <= frames_per_column:
+            level += 1
+        bucket = self.bucket_size(level)
+        first, last = start_frame // bucket, -(-end_frame // bucket)
+        mins, maxs = self.mins[level][first:last], self.maxs[level][first:last]
+        if len(mins) <= columns:
+            return mins, maxs
+        # NOTE Group the buckets into exactly `columns` columns
+        edges = np.linspace(0, len(mins), columns + 1).astype(np.int64)
+        return np.minimum.reduceat(mins, edges[:-1]), np.maximum.reduceat(maxs, edges[:-1])
+
+    def save(self, path: str):
+        """Store the pyramid atomically (written under a temporary name, then renamed)."""
+        arrays = {"meta": np.array([self.base_bucket, self.factor, self.samplerate], dtype=np.int64)}
+        for level in range(self.levels):
+            arrays[f"min{level}"] = self.mins[level]
+            arrays[f"max{level}"] = self.maxs[level]
+        tmp_path = path + ".part"
+        with open(tmp_path, 'wb') as file:
+            np.savez(file, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'PeakPyramid':
+        with np.load(path) as data:
+            base_bucket, factor, samplerate = (int(value) for value in data["meta"])
+            levels = (len(data.files) - 1) // 2
+            mins = [data[f"min{level}"] for level in range(levels)]
+            maxs = [data[f"max{level}"] for level in range(levels)]
+        return cls(mins, maxs, base_bucket, factor, samplerate)
+
+
+class PeakBuilder:
+    """
+    Builds peak pyramids on a single background thread, so jobs run in the order they were submitted.
+
+    Segment pyramids are stored next to the cached segments. Once all segments of a render have pyramids,
+    they are concatenated into the pyramid of the render, which is stored next to the render file.
+    """
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(PeakBuilder, cls).__new__(cls)
+            cls._instance.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="peaks")
+        return cls._instance
+
+    def submit_segment(self, samples: np.ndarray, samplerate: int, path: str):
+        """Build and store the pyramid of a segment, unless it already exists."""
+        if os.path.exists(path):
+            return None
+
+        def build():
+            PeakPyramid.from_samples(samples, samplerate).save(path)
+        return self.executor.submit(build)
+
+    def submit_render(self, segment_paths, render_path: str, callback=None):
+        """
+        Concatenate the segment pyramids into the pyramid of a render, after all pending segment jobs.
+
+        Args:
+            segment_paths (list): Pyramid paths of all segments in render order
+            render_path (str): Path of the rendered audio file, the pyramid is stored next to it
+            callback (callable): Called with the render pyramid once it has been stored (on the worker thread)
+        Returns:
+            concurrent.futures.Future: Resolves to the render pyramid
+        """
+        def build():
+            try:
+                pyramid = PeakPyramid.concatenate(PeakPyramid.load(path) for path in segment_paths)
+                pyramid.save(render_path + PeakPyramid.suffix)
+            except Exception as e:
+                logging.error("%s: Could not build peaks for %s: %s", self.__class__.__name__, render_path, e)
+                raise
+            if callback is not None:
+                callback(pyramid)
+            return pyramid
+        return self.executor.submit(build)
@@ -0,0 +1,280 @@
+"""playback.py
+
+Gapless playback of audio segments through a single output stream.
+"""
+from collections import deque
+import logging
+import threading
+import time
+
+import numpy as np
+import sounddevice as sd  # type: ignore
+
+from modules.audio.metrics import PlaybackMetrics
+
+
+class SegmentQueue:
+    """
+    FIFO of float32 audio segments, which is drained block by block from the audio callback.
+
+    Segments are played back to back without gaps. When crossfading is enabled, the head of an appended
+    segment is mixed into the tail of the previous segment, as long as that tail has not been played yet.
+
+    Args:
+        channels (int): Number of channels of every segment
+        crossfade_frames (int): Length of the crossfade between two segments in frames (0 disables crossfading)
+    Attributes:
+        finished (bool): Set by the producer once no further segments will be appended
+    """
+    def __init__(self, channels: int = 1, crossfade_frames: int = 0):
+        self.channels = channels
+        self.crossfade_frames = crossfade_frames
+        self.finished = False
+        self._segments = deque()
+        self._position = 0  # NOTE Read position (in frames) inside the head segment
+        self._pending = 0  # NOTE Running count of unplayed frames, so the callback can query the fill level cheaply
+        self._lock = threading.Lock()
+
+    def _as_frames(self, samples) -> np.ndarray:
+        samples = np.asarray(samples, dtype=np.float32)
+        return samples.reshape(-1, self.channels)
+
+    def append(self, samples, crossfade: bool = True):
+        """
+        Append a segment to the end of the queue. Can be called while the queue is being played.
+
+        Args:
+            samples (array-like): Audio samples, shape (frames,) or (frames, channels)
+            crossfade (bool): Crossfade into the previous segment (use False for continuation blocks of the same segment)
+        """
+        samples = self._as_frames(samples)
+        with self._lock:
+            self.finished = False
+            if crossfade and self.crossfade_frames > 0 and self._segments:
+                previous = self._segments[-1]
+                unplayed = len(previous) - (self._position if len(self._segments) == 1 else 0)
+                n = min(self.crossfade_frames, unplayed, len(samples))
+                if n > 0:
+                    ramp = np.linspace(0.0, 1.0, n, dtype=np.float32)[:, np.newaxis]
+                    # NOTE The mixed overlap is stored as its own segment, so the caller's arrays are never modified
+                    overlap = previous[-n:] * (1.0 - ramp) + samples[:n] * ramp
+                    self._segments[-1] = previous[:-n]
+                    self._segments.append(overlap)
+                    samples = samples[n:]
+            if len(samples):
+                self._segments.append(samples)
+                self._pending += len(samples)
+
+    def finish(self):
+        """Mark the queue as complete, so playback stops once all segments have been played."""
+        with self._lock:
+            self.finished = True
+
+    def clear(self):
+        """Drop all pending segments."""
+        with self._lock:
+            self._segments.clear()
+            self._position = 0
+            self._pending = 0
+
+    def pending_frames(self) -> int:
+        """Return the number of frames which have not been played yet."""
+        return self._pending
+
+    def read(self, out: np.ndarray) -> int:
+        """
+        Fill the output buffer with the next frames of the queue. Unfilled frames are set to silence.
+
+        Args:
+            out (np.ndarray): Output buffer of shape (frames, channels)
+        Returns:
+            int: Number of frames taken from the queue
+        """
+        frames = len(out)
+        filled = 0
+        with self._lock:
+            while filled < frames and self._segments:
+                segment = self._segments[0]
+                take = min(frames - filled, len(segment) - self._position)
+                out[filled:filled + take] = segment[self._position:self._position + take]
+                filled += take
+                self._position += take
+                if self._position >= len(segment):
+                    self._segments.popleft()
+                    self._position = 0
+            self._pending -= filled
+        if filled < frames:
+            out[filled:] = 0
+        return filled
+
+
+class PlaybackService:
+    """
+    Long-lived playback service, which owns the output stream of the application.
+
+    The stream is opened for a playback and closed once it has finished, so the device is only held while playing.
+    With keep_warm enabled, the stream is opened once and kept running: while nothing is playing (or playback is
+    paused), the callback outputs silence, so play takes effect within one block instead of waiting for the device
+    to open, at the cost of keeping the device open for the lifetime of the app.
+
+    Every call to start() begins a new playback generation. Producers pass their generation to append(),
+    which rejects segments of a superseded playback, so a second play simply replaces the running one.
+
+    Args:
+        blocksize (int): Frames per callback (512 frames are ~12 ms at 44.1 kHz)
+        keep_warm (bool): Keep the stream open and play silence while idle
+        buffer_seconds (float): Maximum amount of audio queued ahead of the playback position
+    """
+    _instance = None
+
+    STOPPED = "stopped"
+    PLAYING = "playing"
+    PAUSED = "paused"
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(PlaybackService, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self, blocksize: int = 512, keep_warm: bool = False, buffer_seconds: float = 5.0):
+        if self._initialized:
+            return
+        self._initialized = True
+        self.blocksize = blocksize
+        self.keep_warm = keep_warm
+        self.buffer_seconds = buffer_seconds
+        self.state = self.STOPPED
+        self.queue = SegmentQueue()
+        self.stream = None
+        self.finished = threading.Event()
+        self.finished.set()
+        self.metrics = PlaybackMetrics()
+        self._generation = 0
+        self._first_block = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def device_samplerate() -> int:
+        """Return the native sample rate of the default output device."""
+        return int(sd.query_devices(kind='output')['default_samplerate'])
+
+    def warm_up(self, samplerate: int = None, channels: int = 1):
+        """Open the output stream ahead of the first playback (defaults to the native rate of the output device)."""
+        if samplerate is None:
+            samplerate = self.device_samplerate()
+        with self._lock:
+            self._open(samplerate, channels)
+
+    def _open(self, samplerate: int, channels: int):
+        if self.stream is not None and self.stream.active and \
+                self.stream.samplerate == samplerate and self.stream.channels == channels:
+            return
+        self._close()
+        self.stream = sd.OutputStream(
+            samplerate=samplerate, blocksize=self.blocksize, latency='low',
+            channels=channels, dtype='float32', callback=self.callback)
+        self.stream.start()
+        logging.info("%s: Opened output stream (%d Hz, %d channels)", self.__class__.__name__, samplerate, channels)
+
+    def _close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    def close(self):
+        """Stop playback and release the output device."""
+        with self._lock:
+            self._generation += 1
+            self.state = self.STOPPED
+            self.queue.clear()
+            self._close()
+        self.finished.set()
+
+    def start(self, samplerate: int, channels: int = 1, crossfade_frames: int = 0) -> int:
+        """
+        Begin a new playback, replacing any playback in progress.
+
+        Returns:
+            int: Generation of the new playback, which must be passed to append() and finish()
+        """
+        with self._lock:
+            self._generation += 1
+            self.state = self.STOPPED  # NOTE Silence the callback while the queue is swapped
+            self.queue = SegmentQueue(channels=channels, crossfade_frames=crossfade_frames)
+            self._open(samplerate, channels)
+            self.finished.clear()
+            self._first_block = True
+            self.state = self.PLAYING
+            return self._generation
+
+    def append(self, samples, generation: int, crossfade: bool = True) -> bool:
+        """
+        Queue samples for the given playback, blocking while more than buffer_seconds are queued ahead.
+
+        Returns:
+            bool: False if the playback has been stopped or replaced, so the producer should give up
+        """
+        # NOTE stop() and close() may close the stream on another thread, so it is read once under the lock
+        with self._lock:
+            if generation != self._generation or self.stream is None:
+                return False
+            queue = self.queue
+            samplerate = self.stream.samplerate
+        max_frames = int(samplerate * self.buffer_seconds)
+        wait = self.blocksize / samplerate
+        while generation == self._generation and queue.pending_frames() > max_frames:
+            time.sleep(wait)
+        if generation != self._generation:
+            return False
+        queue.append(samples, crossfade=crossfade)
+        return True
+
+    def finish(self, generation: int):
+        """Mark the playback as complete, so it stops once all queued samples have been played."""
+        if generation == self._generation:
+            self.queue.finish()
+
+    def pause(self):
+        if self.state == self.PLAYING:
+            self.state = self.PAUSED
+
+    def resume(self):
+        if self.state == self.PAUSED:
+            self.state = self.PLAYING
+
+    def stop(self):
+        with self._lock:
+            self._generation += 1
+            self.state = self.STOPPED
+            self.queue.clear()
+        self.finished.set()
+        if not self.keep_warm:
+            self.close()
+
+    def callback(self, outdata, frames, time_info, status):
+        started = time.perf_counter()
+        metrics = self.metrics
+        metrics.callbacks += 1
+        if status.output_underflow:
+            metrics.underflows += 1
+        if self.state != self.PLAYING:
+            outdata.fill(0)
+            return
+        queue = self.queue
+        written = queue.read(outdata)
+        if written and self._first_block:
+            self._first_block = False
+            metrics.first_sample(max(time_info.outputBufferDacTime - time_info.currentTime, 0.0))
+        pending = queue.pending_frames()
+        # NOTE Once the producer is done, the queue drains to zero by design, so the low-water mark is not updated
+        metrics.queue_level(pending, track_low_water=not queue.finished)
+        if written < frames:
+            if queue.finished and pending == 0:
+                self.state = self.STOPPED
+                self.finished.set()
+                if not self.keep_warm:
+                    raise sd.CallbackStop
+            else:
+                metrics.starvations += 1
+        metrics.callback_ms.record((time.perf_counter() - started) * 1000)
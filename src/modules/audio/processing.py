@@ -0,0 +1,94 @@
+"""processing.py
+
+Vectorized post-processing of synthesized segments (silence trimming, loudness normalization, resampling).
+"""
+import numpy as np
+
+
+def db_to_amplitude(db: float) -> float:
+    return 10.0 ** (db / 20.0)
+
+
+def trim_silence(samples: np.ndarray, samplerate: int, threshold_db: float = -50.0, padding_ms: float = 20.0,
+                 leading: bool = True, trailing: bool = True) -> np.ndarray:
+    """
+    Remove leading and trailing silence.
+
+    Args:
+        samples (np.ndarray): float32 frames of shape (frames, channels)
+        samplerate (int): Sample rate in Hz
+        threshold_db (float): Frames below this peak level (dBFS) count as silence
+        padding_ms (float): Silence kept before the first and after the last loud frame
+        leading (bool): Trim the silence in front of the first loud frame
+        trailing (bool): Trim the silence behind the last loud frame
+    Returns:
+        np.ndarray: View into samples without the silent edges (empty if everything is silent)
+    """
+    loud = np.flatnonzero(np.max(np.abs(samples), axis=1) > db_to_amplitude(threshold_db))
+    if len(loud) == 0:
+        return samples[:0]
+    padding = int(samplerate * padding_ms / 1000)
+    start = max(loud[0] - padding, 0) if leading else 0
+    end = loud[-1] + 1 + padding if trailing else len(samples)
+    return samples[start:end]
+
+
+def normalize_rms(samples: np.ndarray, target_db: float = -20.0, peak_db: float = -1.0, reference: np.ndarray = None) -> np.ndarray:
+    """
+    Scale the samples in place to the target RMS level, without letting peaks exceed peak_db.
+
+    Args:
+        samples (np.ndarray): Writable float32 frames
+        target_db (float): Target RMS level in dBFS
+        peak_db (float): Maximum peak level in dBFS
+        reference (np.ndarray): Frames the level is measured on (defaults to samples), e.g. without the silent edges
+    Returns:
+        np.ndarray: The same array, for chaining
+    """
+    reference = samples if reference is None else reference
+    if reference.size == 0:
+        return samples
+    rms = float(np.sqrt(np.mean(np.square(reference, dtype=np.float64))))
+    peak = float(np.max(np.abs(reference)))
+    if rms == 0.0:
+        return samples
+    gain = min(db_to_amplitude(target_db) / rms, db_to_amplitude(peak_db) / peak)
+    samples *= np.float32(gain)
+    return samples
+
+
+def resample(samples: np.ndarray, samplerate: int, target_samplerate: int) -> np.ndarray:
+    """Linearly resample frames to the target rate (only used if a segment doesn't match the rest of a render)."""
+    if samplerate == target_samplerate or len(samples) == 0:
+        return samples
+    frames = int(round(len(samples) * target_samplerate / samplerate))
+    positions = np.linspace(0, len(samples) - 1, frames)
+    channels = [np.interp(positions, np.arange(len(samples)), samples[:, c]) for c in range(samples.shape[1])]
+    return np.stack(channels, axis=1).astype(np.float32)
+
+
+def mix_channels(samples: np.ndarray, channels: int) -> np.ndarray:
+    """Mix frames to the given channel count: mono is copied to every channel, other layouts are mixed down to mono first."""
+    if samples.shape[1] == channels:
+        return samples
+    if samples.shape[1] > 1:
+        samples = samples.mean(axis=1, keepdims=True, dtype=np.float32)
+    return np.repeat(samples, channels, axis=1) if channels > 1 else samples
+
+
+def process_segment(samples: np.ndarray, samplerate: int, target_db: float = -20.0) -> np.ndarray:
+    """
+    Post-process a synthesized segment: normalize it in place, measuring the level without its silent edges.
+    The silence is kept, since the pauses at the ends of the segments are the pauses between the sentences
+    (see RenderWriter, which only trims the edges of the whole render).
+
+    Args:
+        samples (np.ndarray): Writable float32 frames of shape (frames, channels)
+        samplerate (int): Sample rate in Hz
+        target_db (float): Target RMS level in dBFS (None disables normalization)
+    Returns:
+        np.ndarray: The processed frames
+    """
+    if target_db is not None:
+        normalize_rms(samples, target_db, reference=trim_silence(samples, samplerate))
+    return samples
@@ -0,0 +1,74 @@
+"""render.py
+
+Assembles the processed segments of a synthesis into a single PCM WAV render.
+"""
+import logging
+import os
+
+import soundfile as sf  # type: ignore
+
+from modules.audio.processing import mix_channels, resample, trim_silence
+from modules.audio.timing import TimingIndex
+
+
+class RenderWriter:
+    """
+    Writes segments one after another into a PCM WAV file at the rate and channel count of the first segment
+    (later segments are resampled and mixed to it) and records where every segment starts in a TimingIndex.
+
+    The segments keep their silence, the pauses at their ends (e.g. the configured breaks in front of punctuation)
+    are the gaps between the sentences. With trim enabled, only the silence in front of the first and behind the
+    last segment is trimmed. Unless close() is told that the render is complete, it removes the file.
+
+    Args:
+        path (str): Path of the file (usually the partial path of a render, see ArtifactStore.new_path())
+        trim (bool): Trim the silence at the start and at the end of the render
+    """
+    def __init__(self, path: str, trim: bool = True):
+        self.path = path
+        self.trim = trim
+        self.output = None
+        self.index = None
+        self.frames = 0
+
+    @property
+    def samplerate(self):
+        return self.index.samplerate if self.index is not None else None
+
+    def write(self, samples, samplerate: int, char_offset: int, last: bool = False):
+        """
+        Append a segment.
+
+        Args:
+            samples (np.ndarray): float32 frames of shape (frames, channels)
+            samplerate (int): Sample rate of the frames
+            char_offset (int): Character offset of the segment in the synthesized text
+            last (bool): Whether this is the last segment of the render
+        Returns:
+            np.ndarray: The frames as written (trimmed, resampled and mixed)
+        """
+        first = self.output is None
+        if self.trim and (first or last):
+            samples = trim_silence(samples, samplerate, leading=first, trailing=last)
+        if first:
+            self.output = sf.SoundFile(self.path, 'w', samplerate=samplerate, channels=samples.shape[1], format='WAV')
+            self.index = TimingIndex(samplerate)
+        else:
+            # NOTE e.g. a segment cached with another format, the render keeps the layout of its first segment
+            samples = mix_channels(resample(samples, samplerate, self.output.samplerate), self.output.channels)
+        self.index.add(char_offset, self.frames)
+        self.output.write(samples)
+        self.frames += len(samples)
+        return samples
+
+    def close(self, completed: bool):
+        """Close the file, and remove it if the render is not complete (e.g. a request failed)."""
+        if self.output is None:
+            return
+        self.output.close()
+        self.output = None
+        if not completed:
+            try:
+                os.remove(self.path)
+            except OSError as e:
+                logging.error("%s: Could not remove the partial render %s: %s", self.__class__.__name__, self.path, e)
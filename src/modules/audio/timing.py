@@ -0,0 +1,75 @@
+"""timing.py
+
+Maps character offsets of the synthesized text to sample offsets of the rendered audio.
+"""
+from array import array
+from bisect import bisect_right
+import json
+
+
+class TimingIndex:
+    """
+    Sorted index of (character offset, sample offset) pairs recorded during synthesis.
+
+    Every entry marks the start of a synthesized unit (sentence or word). Lookups use binary search,
+    so seeking stays instant even for hour-long renders.
+
+    Args:
+        samplerate (int): Sample rate of the indexed audio
+    """
+    def __init__(self, samplerate: int = 0):
+        self.samplerate = samplerate
+        self._chars = array('q')
+        self._samples = array('q')
+
+    def __len__(self):
+        return len(self._chars)
+
+    def add(self, char_offset: int, sample_offset: int):
+        """
+        Record the start of a unit. Entries must be added in ascending order.
+
+        Raises:
+            ValueError: Offsets are not ascending
+        """
+        if self._chars and (char_offset < self._chars[-1] or sample_offset < self._samples[-1]):
+            raise ValueError(f'Timing entries must be ascending: ({char_offset}, {sample_offset})')
+        self._chars.append(char_offset)
+        self._samples.append(sample_offset)
+
+    def sample_at(self, char_offset: int) -> int:
+        """
+        Args:
+            char_offset (int): Character offset in the synthesized text
+        Returns:
+            int: Sample offset of the unit containing the character (0 if it lies before the first unit)
+        """
+        i = bisect_right(self._chars, char_offset) - 1
+        return self._samples[i] if i >= 0 else 0
+
+    def char_at(self, sample_offset: int) -> int:
+        """
+        Args:
+            sample_offset (int): Sample offset in the rendered audio
+        Returns:
+            int: Character offset of the unit being played at that sample
+        """
+        i = bisect_right(self._samples, sample_offset) - 1
+        return self._chars[i] if i >= 0 else 0
+
+    def save(self, path: str):
+        with open(path, 'w') as file:
+            json.dump({
+                "samplerate": self.samplerate,
+                "chars": self._chars.tolist(),
+                "samples": self._samples.tolist()
+            }, file)
+
+    @classmethod
+    def load(cls, path: str) -> 'TimingIndex':
+        with open(path, 'r') as file:
+            data = json.load(file)
+        index = cls(data["samplerate"])
+        index._chars = array('q', data["chars"])
+        index._samples = array('q', data["samples"])
+        return index
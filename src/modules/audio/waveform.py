@@ -0,0 +1,75 @@
+# Kivy
+from kivy.uix.widget import Widget
+from kivy.graphics import Color, Mesh
+from kivy.properties import ObjectProperty, NumericProperty, ListProperty
+# stdlib
+# Custom
+import numpy as np
+
+
+class WaveformView(Widget):
+    """
+    Timeline view of the rendered audio, drawn from a PeakPyramid.
+
+    Zooming and scrolling only select a window of precomputed peaks, so redraws never touch the raw samples.
+    The mouse wheel zooms, dragging scrolls.
+    """
+    pyramid = ObjectProperty(None, allownone=True)
+    zoom = NumericProperty(1.0)  # NOTE 1.0 shows the complete render
+    scroll = NumericProperty(0.0)  # NOTE Start of the visible window as fraction of the scrollable range (0.0 - 1.0)
+    color = ListProperty([0.25, 0.45, 0.85, 1])
+    max_zoom = NumericProperty(512.0)
+
+    def __init__(self, **kwargs):
+        super(WaveformView, self).__init__(**kwargs)
+        self.bind(pos=self.redraw, size=self.redraw, pyramid=self.redraw,
+                  zoom=self.redraw, scroll=self.redraw, color=self.redraw)
+
+    def visible_frames(self):
+        """Return the (start, end) frames of the visible window."""
+        total = self.pyramid.frames
+        visible = max(int(total / self.zoom), 1)
+        start = int(self.scroll * (total - visible))
+        return start, start + visible
+
+    def redraw(self, *args):
+        self.canvas.clear()
+        if self.pyramid is None or self.pyramid.frames == 0 or self.width < 1:
+            return
+        start, end = self.visible_frames()
+        mins, maxs = self.pyramid.window(start, end, int(self.width))
+        columns = len(mins)
+        if columns == 0:
+            return
+        half_height = self.height / 2
+        vertices = np.zeros((columns, 2, 4), dtype=np.float32)
+        vertices[:, :, 0] = (self.x + np.arange(columns) * (self.width / columns))[:, np.newaxis]
+        vertices[:, 0, 1] = self.center_y + np.clip(mins, -1, 1) * half_height
+        vertices[:, 1, 1] = self.center_y + np.clip(maxs, -1, 1) * half_height
+        with self.canvas:
+            Color(*self.color)
+            Mesh(vertices=vertices.ravel().tolist(), indices=list(range(columns * 2)), mode='lines')
+
+    def on_touch_down(self, touch):
+        if not self.collide_point(*touch.pos) or self.pyramid is None:
+            return super(WaveformView, self).on_touch_down(touch)
+        if touch.is_mouse_scrolling:
+            factor = 1.25 if touch.button == 'scrolldown' else 0.8
+            self.zoom = min(max(self.zoom * factor, 1.0), self.max_zoom)
+            return True
+        touch.grab(self)
+        return True
+
+    def on_touch_move(self, touch):
+        if touch.grab_current is not self:
+            return super(WaveformView, self).on_touch_move(touch)
+        if self.zoom > 1.0:
+            # NOTE Dragging by the full width scrolls by one visible window
+            self.scroll = min(max(self.scroll - touch.dx / self.width / (self.zoom - 1.0), 0.0), 1.0)
+        return True
+
+    def on_touch_up(self, touch):
+        if touch.grab_current is self:
+            touch.ungrab(self)
+            return True
+        return super(WaveformView, self).on_touch_up(touch)
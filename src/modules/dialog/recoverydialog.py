@@ -0,0 +1,36 @@
+# Kivy
+from kivy.properties import StringProperty
+# KivyMD
+from kivymd.uix.dialog import MDDialog
+# stdlib
+import os
+import time
+# Custom
+
+class RecoveryDialog(MDDialog):
+    """
+    Offers the text of an autosave after the app did not exit cleanly.
+
+    Args:
+        recovery (Recovery): The recovered text and its file, see modules/editor/autosave.py
+        on_restore (callable): on_restore(recovery) is called if the text is restored
+        on_discard (callable): on_discard() is called if the text is discarded
+    """
+    description = StringProperty("")
+
+    def __init__(self, recovery, on_restore, on_discard, **kwargs):
+        self.recovery = recovery
+        self.restore_callback = on_restore
+        self.discard_callback = on_discard
+        name = os.path.basename(recovery.path) if recovery.path else "a new text"
+        saved = time.strftime("%Y-%m-%d %H:%M", time.localtime(recovery.time))
+        self.description = f"Unsaved changes to {name} were autosaved at {saved}. Do you want to restore them?"
+        super(RecoveryDialog, self).__init__(**kwargs)
+
+    def on_discard(self, *args):
+        self.dismiss()
+        self.discard_callback()
+
+    def on_restore(self, *args):
+        self.dismiss()
+        self.restore_callback(self.recovery)
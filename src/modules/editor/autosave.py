@@ -0,0 +1,245 @@
+"""autosave.py
+
+Crash-safe autosave of the editor document: a journal of the edits is appended on every pause in typing,
+a snapshot of the whole text is only written once the journal has grown.
+"""
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from kivy.clock import Clock
+
+from modules.editor.document import Document
+from modules.util.files import write_atomic
+
+
+# NOTE Text of an autosave and the file it was edited from (path is None for a new text), time is the last autosave
+Recovery = namedtuple("Recovery", ["text", "path", "encoding", "time"])
+
+
+def _digest(chunks) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for chunk in chunks:
+        digest.update(chunk.encode("utf-8", "surrogatepass"))
+    return digest.hexdigest()
+
+
+class Autosave:
+    """
+    Autosaves a document into a recovery directory, on a single background thread.
+
+    After every pause of delay seconds the edits since the last pause are appended to the journal (one JSON line
+    per edit). Once the journal exceeds journal_limit characters (e.g. after loading a file), a snapshot of the
+    text is written atomically and the journal starts over. Snapshots are skipped if the content hash is unchanged.
+    The journal names the hash of the snapshot it applies to, so a crash between writing the snapshot and
+    starting the new journal never replays edits twice, and the file the text was loaded from (see set_source),
+    so a recovery can be offered for that file and saved back to it.
+
+    Args:
+        document (Document): The document to save
+        directory (str): Recovery directory (created if needed)
+        delay (float): Pause in seconds after the last edit before saving
+        journal_limit (int): Characters in the journal after which a snapshot is written instead
+    """
+    snapshot_name = "autosave.txt"
+    journal_name = "autosave.journal"
+
+    def __init__(self, document: Document, directory: str, delay: float = 2.0, journal_limit: int = 1048576):
+        self.document = document
+        self.directory = directory
+        self.journal_limit = journal_limit
+        self.snapshot_path = os.path.join(directory, self.snapshot_name)
+        self.journal_path = os.path.join(directory, self.journal_name)
+        os.makedirs(directory, exist_ok=True)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="autosave")
+        self._pending = []  # NOTE Edits since the last pause as [start, removed length, inserted]
+        self._pending_size = 0
+        # NOTE The journal size and the snapshot flag are updated by the main and the writer thread
+        self._lock = threading.Lock()
+        self._journal_size = 0
+        self._snapshot_hash = None
+        self._needs_snapshot = True
+        self.source = (None, "utf-8")  # NOTE (path, encoding) of the file the document was loaded from
+        self._save_event = Clock.create_trigger(lambda dt: self.save(), delay)
+        document.bind(on_change=self.on_document_change)
+
+    def set_source(self, path: str, encoding: str = "utf-8"):
+        """Name the file the document has been loaded from (None for a new text) in the next snapshot."""
+        self.source = (path, encoding)
+        with self._lock:
+            self._needs_snapshot = True
+        self._save_event.cancel()
+        self._save_event()
+
+    def on_document_change(self, document, start: int, removed: str, inserted: str):
+        self._pending.append([start, len(removed), inserted])
+        self._pending_size += len(inserted) + 16
+        # NOTE Debounced: saving waits for a pause of delay seconds after the last edit
+        self._save_event.cancel()
+        self._save_event()
+
+    def flush(self):
+        """
+        Save the pending edits now instead of after the pause, e.g. when the app is closed.
+
+        Returns:
+            Future: Done once they are written (None if there was nothing to save)
+        """
+        self._save_event.cancel()
+        return self.save()
+
+    def save(self):
+        """Append the pending edits to the journal, or write a snapshot if the journal would grow too large."""
+        with self._lock:
+            needs_snapshot = self._needs_snapshot or self._journal_size + self._pending_size > self.journal_limit
+            if needs_snapshot:
+                # NOTE The appends submitted after the snapshot are written into the new journal
+                self._needs_snapshot = False
+                self._journal_size = 0
+            elif self._pending:
+                self._journal_size += self._pending_size
+        if needs_snapshot:
+            self._pending, self._pending_size = [], 0
+            snapshot = self.document.snapshot()
+            return self.executor.submit(self._write_snapshot, snapshot, self.source)
+        if not self._pending:
+            return None
+        lines = "".join(json.dumps(edit, ensure_ascii=False) + "\n" for edit in self._pending)
+        self._pending, self._pending_size = [], 0
+        return self.executor.submit(self._append_journal, lines)
+
+    def _write_snapshot(self, snapshot, source):
+        try:
+            chunks = [text[start:end] for text, start, end in snapshot]
+            content_hash = _digest(chunks)
+            if content_hash != self._snapshot_hash:
+                write_atomic(self.snapshot_path, chunks)
+                self._snapshot_hash = content_hash
+            path, encoding = source
+            header = {"snapshot": content_hash, "path": path, "encoding": encoding}
+            write_atomic(self.journal_path, [json.dumps(header, ensure_ascii=False) + "\n"])
+        except (OSError, UnicodeError) as e:
+            with self._lock:
+                self._needs_snapshot = True
+            logging.error("%s: Could not write the autosave snapshot: %s", self.__class__.__name__, e)
+
+    def _append_journal(self, lines: str):
+        try:
+            with open(self.journal_path, "a", encoding="utf-8", newline="") as file:
+                file.write(lines)
+                file.flush()
+                os.fsync(file.fileno())
+        except (OSError, UnicodeError) as e:
+            with self._lock:
+                self._needs_snapshot = True
+            logging.error("%s: Could not append to the autosave journal: %s", self.__class__.__name__, e)
+
+    def recover(self):
+        """
+        Rebuild the autosaved text from the snapshot and the journal. Nothing is recovered if the file the text was
+        loaded from has been modified since the last autosave (e.g. saved by another program), or if the text is
+        still the content of that file (e.g. it was only opened).
+
+        Returns:
+            Recovery: The recovered text and its file, or None if there is nothing to recover
+        """
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8", newline="") as file:
+                text = file.read()
+            with open(self.journal_path, "r", encoding="utf-8", newline="") as file:
+                journal = file.read().split("\n")
+            saved = os.path.getmtime(self.journal_path)
+        except OSError:
+            return None
+        try:
+            header = json.loads(journal[0])
+        except ValueError:
+            return Recovery(text, None, "utf-8", saved)
+        path, encoding = header.get("path"), header.get("encoding") or "utf-8"
+        if path is not None:
+            try:
+                if os.path.getmtime(path) >= saved:
+                    logging.info("%s: %s is newer than the autosave, nothing to recover", self.__class__.__name__, path)
+                    return None
+            except OSError:
+                pass  # NOTE The file is gone, the autosave is all that is left of it
+        if header.get("snapshot") != _digest([text]):
+            return Recovery(text, path, encoding, saved)  # NOTE The journal belongs to an older snapshot, the edits are already in this one
+        recovered = Document(text)
+        for line in journal[1:]:
+            try:
+                start, removed, inserted = json.loads(line)
+            except ValueError:
+                break  # NOTE The last line might have been cut off by the crash
+            recovered.replace(start, removed, inserted)
+        if path is not None and self._matches_source(recovered.text, path, encoding):
+            logging.info("%s: %s is unchanged, nothing to recover", self.__class__.__name__, path)
+            return None
+        return Recovery(recovered.text, path, encoding, saved)
+
+    @staticmethod
+    def _matches_source(text: str, path: str, encoding: str) -> bool:
+        """Whether the text is the content of the file, decoded and with its line breaks converted like TextLoader does."""
+        try:
+            with open(path, "r", encoding=encoding, errors="replace") as file:
+                return file.read() == text
+        except (OSError, LookupError):
+            return False
+
+    def discard(self):
+        """Delete the recovery files, e.g. after the document has been saved by the user."""
+        self._save_event.cancel()
+        self._pending, self._pending_size = [], 0
+        with self._lock:
+            # NOTE The next save is queued behind the removal and starts over with a snapshot
+            self._journal_size = 0
+            self._needs_snapshot = True
+
+        def remove():
+            for path in (self.journal_path, self.snapshot_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._snapshot_hash = None
+        return self.executor.submit(remove)
+
+
+if __name__ == '__main__':
+    import random
+    import tempfile
+    import time
+
+    directory = tempfile.mkdtemp()
+    document = Document("".join(f"Line {index} of a large document.\n" for index in range(400000)))
+    autosave = Autosave(document, directory, delay=0)
+    start = time.perf_counter()
+    autosave.set_source(os.path.join(directory, "source.txt"), "latin-1")
+    autosave.save().result()
+    print(f"Snapshot of {len(document) / 1024 / 1024:.1f} MB: {(time.perf_counter() - start) * 1000:.0f} ms")
+    for _ in range(2000):
+        offset = random.randint(0, len(document))
+        document.replace(offset, random.choice([0, 1, 5]), random.choice(["", "a", "\n", "ä ß"]))
+    start = time.perf_counter()
+    autosave.save().result()
+    print(f"Journal of 2000 edits: {(time.perf_counter() - start) * 1000:.1f} ms")
+    assert autosave.recover().text == document.text
+    document.replace(0, 0, "x" * 2000000)
+    autosave.save().result()
+    recovery = autosave.recover()
+    assert recovery.text == document.text and recovery.encoding == "latin-1"
+    with open(recovery.path, "w") as file:
+        file.write("Saved after the autosave")
+    os.utime(recovery.path, (recovery.time + 1, recovery.time + 1))
+    assert autosave.recover() is None
+    print("Recovered")
+    with open(recovery.path, "w") as file:
+        file.write(document.text)
+    autosave.set_source(recovery.path)
+    autosave.save().result()
+    assert autosave.recover() is None
+    autosave.discard().result()
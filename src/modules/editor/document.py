@@ -0,0 +1,97 @@
+"""document.py
+
+Text document shared by the editor, the synthesis and the file I/O.
+"""
+from kivy.event import EventDispatcher
+
+from modules.editor.piece_table import PieceTable
+
+
+class Document(EventDispatcher):
+    """
+    Text document stored in a piece table (see PieceTable), which dispatches every change.
+    Edits and line lookups don't copy the text, the complete text is only joined when it is requested.
+
+    Events:
+        on_change(start, removed, inserted): removed (str) at offset start was replaced by inserted (str)
+    """
+    __events__ = ('on_change',)
+
+    def __init__(self, text: str = "", **kwargs):
+        super(Document, self).__init__(**kwargs)
+        self._table = PieceTable(text)
+        self._text = text
+
+    def on_change(self, start: int, removed: str, inserted: str):
+        pass
+
+    @property
+    def text(self) -> str:
+        """The complete text (joined once per change and cached)."""
+        if self._text is None:
+            self._text = self._table.text
+        return self._text
+
+    def chunks(self, start: int = 0, end: int = None):
+        """Yield the text piece by piece, e.g. to write it without joining it first."""
+        return self._table.chunks(start, end)
+
+    def snapshot(self):
+        """Immutable view of the current text, see PieceTable.snapshot."""
+        return self._table.snapshot()
+
+    def substring(self, start: int, end: int) -> str:
+        return self._table.substring(start, end)
+
+    def __len__(self):
+        return len(self._table)
+
+    @property
+    def line_count(self) -> int:
+        return self._table.line_count
+
+    def _line_end(self, line: int) -> int:
+        return self._table.line_start(line + 1) - 1 if line + 1 < self.line_count else len(self)
+
+    def line(self, index: int) -> str:
+        return self._table.substring(self._table.line_start(index), self._line_end(index))
+
+    def lines(self, start: int = 0, end: int = None):
+        end = self.line_count if end is None else min(end, self.line_count)
+        if start >= end:
+            return []
+        return self._table.substring(self._table.line_start(start), self._line_end(end - 1)).split("\n")
+
+    def offset_of(self, line: int, column: int) -> int:
+        return self._table.line_start(line) + column
+
+    def position_of(self, offset: int):
+        """
+        Returns:
+            tuple: (line, column) of the offset
+        """
+        offset = min(max(offset, 0), len(self))
+        line = self._table.line_of(offset)
+        return line, offset - self._table.line_start(line)
+
+    def replace(self, start: int, length: int, text: str):
+        """Replace length characters at offset start with text."""
+        start = min(max(start, 0), len(self))
+        removed = self._table.replace(start, length, text)
+        if not removed and not text:
+            return
+        self._text = None
+        self.dispatch('on_change', start, removed, text)
+
+    def insert(self, offset: int, text: str):
+        self.replace(offset, 0, text)
+
+    def delete(self, offset: int, length: int):
+        self.replace(offset, length, "")
+
+    def set_text(self, text: str):
+        """Replace the whole text (the new text becomes the original buffer of a fresh piece table)."""
+        removed = self.text
+        self._table = PieceTable(text)
+        self._text = text
+        self.dispatch('on_change', 0, removed, text)
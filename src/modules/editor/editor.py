@@ -0,0 +1,249 @@
+# Kivy
+from kivy.clock import Clock
+from kivy.metrics import dp
+from kivy.properties import BooleanProperty, ListProperty, NumericProperty, ObjectProperty
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.textinput import TextInput
+# stdlib
+# Custom
+from modules.editor.document import Document
+from modules.editor.history import EditHistory
+from modules.text.diff import edit_range
+
+
+class EditorLine(RecycleDataViewBehavior, TextInput):
+    """
+    A single visible line of the DocumentEditor. Views are recycled while scrolling, so only visible lines exist.
+    Line breaks (enter, backspace at the line start, delete at the line end, pasting) are handed to the editor.
+    """
+    index = NumericProperty(-1)
+    editor = ObjectProperty(None, allownone=True)
+    _refreshing = False
+
+    def refresh_view_attrs(self, rv, index, data):
+        self.index = index
+        self.editor = rv
+        self._refreshing = True
+        try:
+            return super(EditorLine, self).refresh_view_attrs(rv, index, data)
+        finally:
+            self._refreshing = False
+
+    def on_text(self, instance, value):
+        if not self._refreshing and self.editor is not None:
+            self.editor.line_edited(self.index, value)
+
+    def on_cursor(self, instance, value):
+        if self.focus and not self._refreshing and self.editor is not None:
+            self.editor.cursor = [value[0], self.index]
+
+    def on_focus(self, instance, value):
+        if self.editor is not None:
+            if value:
+                self.editor.cursor = [self.cursor[0], self.index]
+            self.editor.focus = value
+
+    def insert_text(self, substring, from_undo=False):
+        if "\n" in substring and self.editor is not None:
+            self.delete_selection()
+            self.editor.insert_at_cursor(substring)
+            return
+        return super(EditorLine, self).insert_text(substring, from_undo=from_undo)
+
+    def keyboard_on_key_down(self, window, keycode, text, modifiers):
+        editor = self.editor
+        if editor is None:
+            return super(EditorLine, self).keyboard_on_key_down(window, keycode, text, modifiers)
+        name = keycode[1]
+        column = self.cursor[0]
+        if name in ("enter", "numpadenter"):
+            self.delete_selection()
+            editor.insert_at_cursor("\n")
+            return True
+        if name == "backspace" and column == 0 and not self._selection and self.index > 0:
+            editor.join_lines(self.index - 1)
+            return True
+        if name == "delete" and column == len(self.text) and not self._selection and self.index < editor.document.line_count - 1:
+            editor.join_lines(self.index)
+            return True
+        if name in ("up", "down"):
+            editor.move_to_line(self.index + (-1 if name == "up" else 1), column)
+            return True
+        if name in ("pageup", "pagedown"):
+            editor.move_to_line(self.index + (-1 if name == "pageup" else 1) * editor.visible_lines(), column)
+            return True
+        return super(EditorLine, self).keyboard_on_key_down(window, keycode, text, modifiers)
+
+    def do_undo(self):
+        # NOTE The history of a recycled view would belong to another line, the editor keeps the history of the document
+        if self.editor is not None:
+            self.editor.undo()
+        else:
+            super(EditorLine, self).do_undo()
+
+    def do_redo(self):
+        if self.editor is not None:
+            self.editor.redo()
+        else:
+            super(EditorLine, self).do_redo()
+
+
+class DocumentEditor(RecycleView):
+    """
+    Virtualized editor for large documents: only the visible lines are created and laid out (see EditorLine),
+    so typing and scrolling cost the same regardless of the document size. Lines have a fixed height and don't wrap.
+
+    The text, cursor and movement API mirrors TextInput (rows are document lines), so it can replace a text field.
+    Changes are dispatched by the document (see Document.on_change) and recorded for undo and redo (see EditHistory).
+    """
+    document = ObjectProperty(None)
+    cursor = ListProperty([0, 0])  # NOTE (column, line), like TextInput.cursor
+    focus = BooleanProperty(False)
+    error = BooleanProperty(False)
+    line_height = NumericProperty(dp(28))
+
+    def __init__(self, **kwargs):
+        self._syncing = False
+        super(DocumentEditor, self).__init__(**kwargs)
+        if self.document is None:
+            self.document = Document()
+
+    def on_document(self, instance, document):
+        document.bind(on_change=self.on_document_change)
+        self.history = EditHistory(document)
+        self.data = [{"text": line} for line in document.lines()]
+
+    def on_document_change(self, document, start, removed, inserted):
+        if self._syncing:
+            return
+        # NOTE Lines before the change are unchanged, so the lines of the change are swapped in place
+        first, _ = document.position_of(start)
+        old_count = removed.count("\n") + 1
+        new_count = inserted.count("\n") + 1
+        self.data[first:first + old_count] = [{"text": line} for line in document.lines(first, first + new_count)]
+
+    @property
+    def text(self) -> str:
+        return self.document.text
+
+    @text.setter
+    def text(self, value: str):
+        self.document.set_text(value)
+        self.cursor = [0, 0]
+
+    def line_edited(self, index: int, text: str):
+        """Apply the edit of a single line (typed into a view) to the document."""
+        if index >= self.document.line_count:
+            return
+        old = self.document.line(index)
+        if old == text:
+            return
+        # NOTE The view already shows the new text, only the data entry is updated (without refreshing the view)
+        self.data[index]["text"] = text
+        # NOTE Only the changed characters are replaced, so the change of a keystroke is a single character
+        start, removed, inserted = edit_range(old, text)
+        self._syncing = True
+        try:
+            self.document.replace(self.document.offset_of(index, start), removed, text[start:start + inserted])
+        finally:
+            self._syncing = False
+
+    def cursor_index(self) -> int:
+        column, line = self.cursor
+        line = min(line, self.document.line_count - 1)
+        return self.document.offset_of(line, min(column, len(self.document.line(line))))
+
+    def get_cursor_from_index(self, index: int):
+        line, column = self.document.position_of(index)
+        return column, line
+
+    def on_cursor(self, instance, value):
+        column, line = value
+        view = self.view_adapter.get_visible_view(line)
+        if view is not None and view.focus and view.cursor[0] != column:
+            view.cursor = (column, 0)
+        elif self.focus and (view is None or not view.focus):
+            self.move_to_line(line, column)
+
+    def on_focus(self, instance, value):
+        if value:
+            self.move_to_line(self.cursor[1], self.cursor[0])
+
+    def insert_at_cursor(self, text: str):
+        offset = self.cursor_index()
+        self.document.insert(offset, text)
+        column, line = self.get_cursor_from_index(offset + len(text))
+        self.move_to_line(line, column)
+
+    def join_lines(self, index: int):
+        """Join the line with the next one (removes the line break at the end of the line)."""
+        column = len(self.document.line(index))
+        self.document.delete(self.document.offset_of(index, column), 1)
+        self.move_to_line(index, column)
+
+    def undo(self):
+        """Revert the last edit (a run of keystrokes is reverted at once) and move the cursor behind it."""
+        offset = self.history.undo()
+        if offset is not None:
+            column, line = self.get_cursor_from_index(offset)
+            self.move_to_line(line, column)
+
+    def redo(self):
+        offset = self.history.redo()
+        if offset is not None:
+            column, line = self.get_cursor_from_index(offset)
+            self.move_to_line(line, column)
+
+    def visible_lines(self) -> int:
+        return max(int(self.height / self.line_height), 1)
+
+    def scroll_to_line(self, line: int):
+        """Scroll the least amount needed to show the line."""
+        content_height = self.document.line_count * self.line_height
+        if content_height <= self.height:
+            return
+        top = (1 - self.scroll_y) * (content_height - self.height)
+        line_top = line * self.line_height
+        if line_top < top:
+            top = line_top
+        elif line_top + self.line_height > top + self.height:
+            top = line_top + self.line_height - self.height
+        else:
+            return
+        self.scroll_y = 1 - top / (content_height - self.height)
+
+    def move_to_line(self, line: int, column: int):
+        """Move the cursor to the line (clamped), scrolling it into view and focusing its view."""
+        line = min(max(line, 0), self.document.line_count - 1)
+        column = min(max(column, 0), len(self.document.line(line)))
+        self.scroll_to_line(line)
+        self.cursor = [column, line]
+        # NOTE The view of the line might only exist after the next layout
+        Clock.schedule_once(lambda dt: self._focus_view(line, column))
+
+    def _focus_view(self, line: int, column: int):
+        view = self.view_adapter.get_visible_view(line)
+        if view is None:
+            return
+        view.focus = True
+        view.cursor = (column, 0)
+
+    def do_cursor_movement(self, action: str, control: bool = False, alt: bool = False):
+        """Subset of TextInput.do_cursor_movement (left, right, home, end, with control for the whole document)."""
+        column, line = self.cursor
+        if action == 'cursor_left':
+            offset = self.cursor_index() - 1
+        elif action == 'cursor_right':
+            offset = self.cursor_index() + 1
+        elif action == 'cursor_home':
+            offset = 0 if control else self.document.offset_of(line, 0)
+        elif action == 'cursor_end':
+            offset = len(self.document) if control else self.document.offset_of(line, len(self.document.line(line)))
+        elif action in ('cursor_up', 'cursor_down'):
+            self.move_to_line(line + (-1 if action == 'cursor_up' else 1), column)
+            return
+        else:
+            return
+        column, line = self.get_cursor_from_index(offset)
+        self.move_to_line(line, column)
@@ -0,0 +1,139 @@
+"""history.py
+
+Undo and redo of document edits, stored as the edits themselves instead of snapshots of the text.
+"""
+from collections import deque
+import time
+
+from modules.editor.document import Document
+
+
+class EditHistory:
+    """
+    Records the changes of a document as [start, removed, inserted, time] and reverts or repeats them.
+    Undoing an edit replaces its inserted text with its removed text in the piece table, so it costs the size
+    of the edit, not of the document.
+
+    Keystroke runs are coalesced into one edit, as long as the keys follow each other within coalesce_delay seconds:
+    typing at the end of the last insertion, backspace in front of the last deletion and delete at the same offset.
+    Line breaks start a new edit, so undo goes back line by line in longer runs. The oldest edits are dropped
+    once the edits hold more than limit characters.
+
+    Args:
+        document (Document): The document to record
+        limit (int): Characters of removed and inserted text kept for undo and redo
+        coalesce_delay (float): Seconds between keystrokes which are still coalesced
+    """
+    entry_size = 64  # NOTE Rough overhead of an edit in characters, so many tiny edits count against the limit too
+
+    def __init__(self, document: Document, limit: int = 4194304, coalesce_delay: float = 1.0):
+        self.document = document
+        self.limit = limit
+        self.coalesce_delay = coalesce_delay
+        self._undo = deque()
+        self._redo = []
+        self._size = 0
+        self._applying = False
+        self._sealed = True  # NOTE The next edit is never coalesced with the last one (e.g. after an undo)
+        document.bind(on_change=self.on_document_change)
+
+    @classmethod
+    def _edit_size(cls, edit) -> int:
+        return len(edit[1]) + len(edit[2]) + cls.entry_size
+
+    def can_undo(self) -> bool:
+        return bool(self._undo)
+
+    def can_redo(self) -> bool:
+        return bool(self._redo)
+
+    def clear(self):
+        """Forget all edits, e.g. after a file has been loaded."""
+        self._undo.clear()
+        self._redo = []
+        self._size = 0
+        self._sealed = True
+
+    def seal(self):
+        """Start a new edit with the next change, even if it continues the last keystroke run."""
+        self._sealed = True
+
+    def on_document_change(self, document, start: int, removed: str, inserted: str):
+        if self._applying:
+            return
+        for edit in self._redo:
+            self._size -= self._edit_size(edit)
+        self._redo = []
+        now = time.monotonic()
+        last = self._undo[-1] if self._undo else None
+        if last is not None and not self._sealed and now - last[3] <= self.coalesce_delay and "\n" not in removed + inserted:
+            if not removed and not last[1] and start == last[0] + len(last[2]):
+                last[2] += inserted  # NOTE Typing
+            elif not inserted and not last[2] and start + len(removed) == last[0]:
+                last[0], last[1] = start, removed + last[1]  # NOTE Backspace
+            elif not inserted and not last[2] and start == last[0]:
+                last[1] += removed  # NOTE Delete
+            else:
+                last = None
+            if last is not None:
+                last[3] = now
+                self._size += len(removed) + len(inserted)
+                self._trim()
+                return
+        self._undo.append([start, removed, inserted, now])
+        self._size += len(removed) + len(inserted) + self.entry_size
+        self._sealed = "\n" in inserted
+        self._trim()
+
+    def _trim(self):
+        while self._size > self.limit and self._undo:
+            self._size -= self._edit_size(self._undo.popleft())
+
+    def _apply(self, start: int, length: int, text: str):
+        self._applying = True
+        try:
+            self.document.replace(start, length, text)
+        finally:
+            self._applying = False
+        self._sealed = True
+
+    def undo(self):
+        """
+        Revert the last edit.
+
+        Returns:
+            int: Offset behind the restored text (for the cursor), or None if there is nothing to undo
+        """
+        if not self._undo:
+            return None
+        edit = self._undo.pop()
+        start, removed, inserted, _ = edit
+        self._apply(start, len(inserted), removed)
+        self._redo.append(edit)
+        return start + len(removed)
+
+    def redo(self):
+        """
+        Repeat the last undone edit.
+
+        Returns:
+            int: Offset behind the inserted text (for the cursor), or None if there is nothing to redo
+        """
+        if not self._redo:
+            return None
+        edit = self._redo.pop()
+        start, removed, inserted, _ = edit
+        self._apply(start, len(removed), inserted)
+        self._undo.append(edit)
+        return start + len(inserted)
+
+
+if __name__ == '__main__':
+    import timeit
+
+    document = Document("".join(f"Line {index} of a large document.\n" for index in range(400000)))
+    history = EditHistory(document)
+    middle = len(document) // 2
+    document.insert(middle, "typed")
+    print(f"Undo in {len(document) / 1024 / 1024:.1f} MB: {timeit.timeit(history.undo, number=1) * 1e6:.0f} us, "
+          f"redo: {timeit.timeit(history.redo, number=1) * 1e6:.0f} us")
@@ -0,0 +1,321 @@
+"""piece_table.py
+
+Piece table text storage: edits never copy the text, they only split and splice pieces.
+"""
+from array import array
+from bisect import bisect_left
+import re
+
+_newline_pattern = re.compile("\n")
+
+
+def _newlines(text: str) -> array:
+    return array('q', [match.start() for match in _newline_pattern.finditer(text)])
+
+
+class _Buffer:
+    """An immutable text (or the growing add buffer) with the offsets of its line breaks."""
+    __slots__ = ("text", "newlines")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.newlines = _newlines(text)
+
+    def append(self, text: str):
+        base = len(self.text)
+        self.newlines.extend(base + offset for offset in _newlines(text))
+        self.text += text
+
+    def count(self, start: int, end: int) -> int:
+        """Number of line breaks in text[start:end]."""
+        return bisect_left(self.newlines, end) - bisect_left(self.newlines, start)
+
+
+class _PrefixSums:
+    """
+    Fenwick tree of non-negative counts (e.g. the characters of every block): changing a count, the sum of the
+    first counts and finding where a running sum is reached are O(log n).
+    """
+    __slots__ = ("_tree", "_size", "_top")
+
+    def __init__(self, counts=()):
+        self._tree = array('q', [0])
+        self._tree.extend(counts)
+        self._size = len(self._tree) - 1
+        for index in range(1, self._size + 1):
+            parent = index + (index & -index)
+            if parent <= self._size:
+                self._tree[parent] += self._tree[index]
+        self._top = 1 << self._size.bit_length() if self._size else 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, index: int, delta: int):
+        """Add delta to the count at index."""
+        tree = self._tree
+        index += 1
+        while index <= self._size:
+            tree[index] += delta
+            index += index & -index
+
+    def prefix(self, index: int) -> int:
+        """Sum of the first index counts."""
+        tree = self._tree
+        total = 0
+        while index > 0:
+            total += tree[index]
+            index &= index - 1
+        return total
+
+    @property
+    def total(self) -> int:
+        return self.prefix(self._size)
+
+    def search(self, value: int):
+        """
+        Returns:
+            tuple: (index, prefix) of the largest index with prefix(index) <= value (like bisect_right(sums, value) - 1)
+        """
+        tree = self._tree
+        position = 0
+        total = 0
+        step = self._top
+        while step:
+            following = position + step
+            if following <= self._size and total + tree[following] <= value:
+                position = following
+                total += tree[following]
+            step >>= 1
+        return position, total
+
+
+class PieceTable:
+    """
+    Text stored as pieces, i.e. spans of immutable buffers: the loaded text and appended texts are referenced,
+    typed text is appended to a small add buffer. Consecutive typing extends the last piece instead of adding one.
+
+    Pieces are grouped in blocks of at most block_size pieces, with the character and line break counts of every
+    block kept in Fenwick trees (see _PrefixSums). Locating an offset or a line is a search of the trees and a short
+    scan of one block. An edit splices one or two blocks and updates their counts in O(log blocks), the trees are
+    only rebuilt when the number of blocks changes (a block is split or merged, i.e. at most every block_size / 2
+    edits of a block), so edits cost amortized O(log n) plus the length of one block.
+
+    Args:
+        text (str): Initial text (referenced, not copied)
+    """
+    block_size = 128
+    add_buffer_size = 65536  # NOTE Larger insertions (e.g. loaded chunks) become buffers of their own
+
+    def __init__(self, text: str = ""):
+        self._buffers = []
+        self._add = None
+        self._blocks = []
+        self._chars = _PrefixSums()
+        self._lines = _PrefixSums()
+        if text:
+            self._set_blocks(0, 0, [self._piece(self._new_buffer(text), 0, len(text))])
+
+    def _new_buffer(self, text: str) -> int:
+        self._buffers.append(_Buffer(text))
+        return len(self._buffers) - 1
+
+    def _piece(self, buffer: int, start: int, length: int):
+        # NOTE Pieces are [buffer, start, length, line breaks], lists so typing can extend them in place
+        return [buffer, start, length, self._buffers[buffer].count(start, start + length)]
+
+    def _set_blocks(self, first: int, last: int, pieces):
+        """Replace the blocks first to last (exclusive) with the pieces and update the counts."""
+        blocks = [pieces[index:index + self.block_size] for index in range(0, len(pieces), self.block_size)]
+        chars = [sum(piece[2] for piece in block) for block in blocks]
+        lines = [sum(piece[3] for piece in block) for block in blocks]
+        if len(blocks) == last - first:
+            for index in range(len(blocks)):
+                block = first + index
+                self._chars.add(block, chars[index] - self._block_count(self._chars, block))
+                self._lines.add(block, lines[index] - self._block_count(self._lines, block))
+            self._blocks[first:last] = blocks
+            return
+        # NOTE The number of blocks changed, the counts of all blocks are rebuilt (O(blocks))
+        all_chars = [self._block_count(self._chars, block) for block in range(len(self._blocks))]
+        all_lines = [self._block_count(self._lines, block) for block in range(len(self._blocks))]
+        all_chars[first:last] = chars
+        all_lines[first:last] = lines
+        self._blocks[first:last] = blocks
+        self._chars = _PrefixSums(all_chars)
+        self._lines = _PrefixSums(all_lines)
+
+    @staticmethod
+    def _block_count(sums: _PrefixSums, block: int) -> int:
+        return sums.prefix(block + 1) - sums.prefix(block)
+
+    def __len__(self):
+        return self._chars.total
+
+    @property
+    def line_count(self) -> int:
+        return self._lines.total + 1
+
+    def chunks(self, start: int = 0, end: int = None):
+        """Yield the text of the range piece by piece (without joining it)."""
+        end = len(self) if end is None else min(end, len(self))
+        if start >= end:
+            return
+        block, offset = self._chars.search(start)
+        for pieces in self._blocks[block:]:
+            for buffer, piece_start, length, _ in pieces:
+                if offset + length > start:
+                    text = self._buffers[buffer].text
+                    yield text[piece_start + max(start - offset, 0):piece_start + min(end - offset, length)]
+                offset += length
+                if offset >= end:
+                    return
+
+    def snapshot(self):
+        """
+        Returns:
+            list: (text, start, end) of every piece, the text is text[start:end] of the pieces joined.
+                  The buffer texts are immutable strings, so the snapshot stays valid after further edits
+                  (e.g. to write it on another thread) and taking it copies no text.
+        """
+        buffers = self._buffers
+        return [(buffers[buffer].text, start, start + length) for block in self._blocks for buffer, start, length, _ in block]
+
+    def substring(self, start: int, end: int) -> str:
+        return "".join(self.chunks(start, end))
+
+    @property
+    def text(self) -> str:
+        return self.substring(0, len(self))
+
+    def _locate(self, offset: int):
+        """
+        Returns:
+            tuple: (block, piece, piece offset) of the piece containing the offset
+                   (the end of the text is located in the last piece)
+        """
+        block, piece_offset = self._chars.search(offset)
+        if block >= len(self._blocks):
+            # NOTE The end of the text is located in the last block
+            block = len(self._blocks) - 1
+            piece_offset = self._chars.prefix(block)
+        pieces = self._blocks[block]
+        for index, piece in enumerate(pieces):
+            if offset < piece_offset + piece[2] or index == len(pieces) - 1:
+                return block, index, piece_offset
+            piece_offset += piece[2]
+        return block, 0, piece_offset
+
+    def line_of(self, offset: int) -> int:
+        """Line of the offset (the number of line breaks before it)."""
+        if not self._blocks:
+            return 0
+        block, index, piece_offset = self._locate(offset)
+        line = self._lines.prefix(block) + sum(piece[3] for piece in self._blocks[block][:index])
+        buffer, start, length, _ = self._blocks[block][index]
+        return line + self._buffers[buffer].count(start, start + min(offset - piece_offset, length))
+
+    def line_start(self, line: int) -> int:
+        """Offset of the first character of the line."""
+        if line <= 0 or not self._blocks:
+            return 0
+        if line >= self.line_count:
+            return len(self)
+        # NOTE The line starts after the line-th line break
+        block, before = self._lines.search(line - 1)
+        remaining = line - before
+        offset = self._chars.prefix(block)
+        for buffer, start, length, newlines in self._blocks[block]:
+            if remaining <= newlines:
+                breaks = self._buffers[buffer].newlines
+                return offset + breaks[bisect_left(breaks, start) + remaining - 1] - start + 1
+            remaining -= newlines
+            offset += length
+
+    def replace(self, start: int, length: int, text: str):
+        """
+        Replace length characters at offset start with text.
+
+        Returns:
+            str: The removed text
+        """
+        end = min(start + length, len(self))
+        start = min(start, end)
+        removed = self.substring(start, end)
+        if not removed and not text:
+            return removed
+        if not removed and self._extend(start, text):
+            return removed
+        if not self._blocks:
+            self._blocks.append([])
+            self._chars = _PrefixSums([0])
+            self._lines = _PrefixSums([0])
+        first_block = self._locate(start)[0]
+        last_block = self._locate(end)[0]
+        offset = self._chars.prefix(first_block)
+        pieces = []
+        inserted = False
+        for piece in (piece for block in self._blocks[first_block:last_block + 1] for piece in block):
+            buffer, piece_start, piece_length, _ = piece
+            piece_end = offset + piece_length
+            if piece_end <= start or offset >= end and inserted:
+                pieces.append(piece)
+            else:
+                if offset < start:
+                    pieces.append(self._piece(buffer, piece_start, start - offset))
+                if not inserted:
+                    pieces.extend(self._insertion(text))
+                    inserted = True
+                if piece_end > end:
+                    cut = max(end - offset, 0)
+                    pieces.append(self._piece(buffer, piece_start + cut, piece_length - cut))
+            offset = piece_end
+        if not inserted:
+            pieces.extend(self._insertion(text))
+        self._set_blocks(first_block, last_block + 1, pieces)
+        return removed
+
+    def _insertion(self, text: str):
+        if not text:
+            return []
+        if len(text) > self.add_buffer_size // 4:
+            return [self._piece(self._new_buffer(text), 0, len(text))]
+        if self._add is None or len(self._buffers[self._add].text) + len(text) > self.add_buffer_size:
+            self._add = self._new_buffer("")
+        buffer = self._buffers[self._add]
+        start = len(buffer.text)
+        buffer.append(text)
+        return [self._piece(self._add, start, len(text))]
+
+    def _extend(self, offset: int, text: str) -> bool:
+        """Append typed text to the piece ending at the offset, if it ends the add buffer (consecutive typing)."""
+        if self._add is None or not self._blocks or offset == 0 or len(text) > self.add_buffer_size // 4:
+            return False
+        block, index, piece_offset = self._locate(offset - 1)
+        piece = self._blocks[block][index]
+        buffer = self._buffers[self._add]
+        if piece[0] != self._add or piece_offset + piece[2] != offset or piece[1] + piece[2] != len(buffer.text) \
+                or len(buffer.text) + len(text) > self.add_buffer_size:
+            return False
+        buffer.append(text)
+        newlines = text.count("\n")
+        piece[2] += len(text)
+        piece[3] += newlines
+        self._chars.add(block, len(text))
+        self._lines.add(block, newlines)
+        return True
+
+
+if __name__ == '__main__':
+    import random
+    import timeit
+
+    text = "".join(f"Line {index} of a large document.\n" for index in range(400000))
+    table = PieceTable(text)
+    middle = len(text) // 2
+    print(f"Document: {len(text) / 1024 / 1024:.1f} MB")
+    typed = iter(range(middle, middle + 1000))
+    print(f"Typing in the middle: {timeit.timeit(lambda: table.replace(next(typed), 0, 'x'), number=1000) / 1000 * 1e6:.1f} us")
+    print(f"Scattered edits: {timeit.timeit(lambda: table.replace(random.randint(0, len(table) - 10), 3, 'ab'), number=1000) / 1000 * 1e6:.1f} us")
+    print(f"Line lookup: {timeit.timeit(lambda: table.line_start(200000), number=1000) / 1000 * 1e6:.1f} us, "
+          f"{sum(len(block) for block in table._blocks)} pieces")
@@ -0,0 +1,326 @@
+"""compiler.py
+
+Compiles Speech Markdown (as typed into the editor) into SSML for the backends.
+See Also:
+    https://www.speechmarkdown.org/syntax/
+
+Tokenizing, parsing and code generation are single passes over the text. Since the package directory contains
+a hyphen, import it with importlib.import_module("modules.speech-markdown.compiler").
+"""
+from collections import OrderedDict, namedtuple
+import html
+import re
+
+try:
+    from .simple_speech_markdown import SimpleSpeechMarkdown
+except ImportError:  # NOTE Run as script (benchmark)
+    from simple_speech_markdown import SimpleSpeechMarkdown
+
+Token = namedtuple("Token", ["kind", "match"])
+Text = namedtuple("Text", ["text"])
+Break = namedtuple("Break", ["time", "strength"])
+Audio = namedtuple("Audio", ["url", "caption"])
+Element = namedtuple("Element", ["text", "modifiers"])
+Tag = namedtuple("Tag", ["ssml"])
+
+
+class SpeechMarkdownError(ValueError):
+    """
+    Invalid Speech Markdown.
+
+    Args:
+        message (str): Description of the error
+        position (int): Character offset of the error in the compiled text
+    """
+    def __init__(self, message: str, position: int = 0):
+        super(SpeechMarkdownError, self).__init__(f"{message} (at character {position})")
+        self.position = position
+
+
+def escape_text(text: str) -> str:
+    """Default text filter: escape text for SSML."""
+    return html.escape(text, quote=False)
+
+
+# NOTE The SSML elements checked by modules/ssml/validator.py, any other tag (e.g. <Enter>) is spoken as text
+SSML_ELEMENTS = ["speak", "p", "s", "break", "prosody", "emphasis", "say-as", "phoneme", "sub", "audio", "w", "lang", "mark"]
+
+_token_pattern = re.compile(r"""
+    (?P<tag></?(?:""" + "|".join(SSML_ELEMENTS) + r""")(?![\w:.-])[^<>\n]*>)
+    |(?P<audio>!(?:\((?P<caption>[^()\n]*)\))?\[["'](?P<url>[^"'\n]+)["']\])
+    |(?P<modifier>\((?P<text>[^()\n]+)\)\[(?P<modifiers>[^\[\]\n]+)\])
+    |(?P<break>\[(?:(?P<time>\d+(?:\.\d+)?m?s)|break\s*:\s*["']?(?P<strength>[\w-]+)["']?)\])
+    |(?P<emphasis>(?<![\w+~-])(?P<marker>\+\+|\+|~|-)(?P<emphasized>[^\s+~-](?:[^\n+~-]*[^\s+~-])?)(?P=marker)(?![\w+~-]))
+""", re.VERBOSE)
+
+_modifier_pattern = re.compile(r"""\s*(?:
+    (?P<key>[\w-]+)(?:\s*:\s*(?:"(?P<double>[^"]*)"|'(?P<single>[^']*)'|(?P<bare>[^;"'\s]+)))?
+    |/(?P<ipa>[^/]+)/
+    |"(?P<sub>[^"]*)"
+)\s*(?:;|$)""", re.VERBOSE)
+
+
+def tokenize(text: str):
+    """
+    Yield Token("text", str) for plain text and Token(kind, re.Match) for markup (tag, audio, modifier, break, emphasis).
+    SSML tags typed by the user are tokenized as a whole, so they are passed through unchanged. Tags of other
+    elements than SSML_ELEMENTS are text, so they are escaped instead of breaking the SSML.
+    """
+    position = 0
+    for match in _token_pattern.finditer(text):
+        if match.start() > position:
+            yield Token("text", text[position:match.start()])
+        yield Token(match.lastgroup, match)
+        position = match.end()
+    if position < len(text):
+        yield Token("text", text[position:])
+
+
+class SpeechMarkdownParser:
+    """
+    Turns tokens into nodes (Text, Tag, Break, Audio, Element) and validates the modifiers
+    against the values modelled by SimpleSpeechMarkdown.
+    """
+    _say_as = {
+        "address": "address",
+        "cardinal": "cardinal",
+        "number": "cardinal",
+        "characters": "characters",
+        "chars": "characters",
+        "date": "date",
+        "expletive": "expletive",
+        "bleep": "expletive",
+        "fraction": "fraction",
+        "interjection": "interjection",
+        "ordinal": "ordinal",
+        "phone": "telephone",
+        "telephone": "telephone",
+        "time": "time",
+        "unit": "unit"
+    }
+    _prosody = {
+        "pitch": SimpleSpeechMarkdown._pitch_levels,
+        "rate": SimpleSpeechMarkdown._rate_levels,
+        "volume": SimpleSpeechMarkdown._volume_levels
+    }
+    _break_strengths = ["none", "x-weak", "weak", "medium", "strong", "x-strong"]
+    _date_formats = ['mdy', 'dmy', 'ymd', 'md', 'dm', 'ym', 'my', 'd', 'm', 'y']
+    _emphasis_markers = {marker: level for level, marker in SimpleSpeechMarkdown._emphasis_levels.items()}
+
+    def parse(self, tokens, offset: int = 0):
+        """
+        Args:
+            tokens (iterable): Tokens of tokenize()
+            offset (int): Offset of the tokenized text, used for error positions
+        Returns:
+            list: Nodes
+        Raises:
+            SpeechMarkdownError: Unknown modifier or invalid value
+        """
+        nodes = []
+        for kind, value in tokens:
+            if kind == "text":
+                nodes.append(Text(value))
+            elif kind == "tag":
+                nodes.append(Tag(value.group()))  # NOTE Validated by modules/ssml/validator.py in the editor
+            elif kind == "break":
+                strength = value.group("strength")
+                if strength is not None and strength not in self._break_strengths:
+                    raise SpeechMarkdownError(f'Invalid break strength: {strength} (must be one of: {", ".join(self._break_strengths)})',
+                                              offset + value.start())
+                nodes.append(Break(value.group("time"), strength))
+            elif kind == "audio":
+                nodes.append(Audio(value.group("url"), value.group("caption") or ""))
+            elif kind == "emphasis":
+                nodes.append(Element(value.group("emphasized"), {"emphasis": self._emphasis_markers[value.group("marker")]}))
+            else:
+                nodes.append(Element(value.group("text"), self.parse_modifiers(value.group("modifiers"), offset + value.start("modifiers"))))
+        return nodes
+
+    def parse_modifiers(self, modifiers: str, position: int) -> dict:
+        """Parse 'key:"value";key' into a dict (keys without value map to None)."""
+        parsed = {}
+        index = 0
+        while index < len(modifiers):
+            match = _modifier_pattern.match(modifiers, index)
+            if match is None or match.end() == index:
+                raise SpeechMarkdownError(f"Invalid modifier: {modifiers[index:]}", position + index)
+            if match.group("ipa") is not None:
+                parsed["ipa"] = match.group("ipa")
+            elif match.group("sub") is not None:
+                parsed["sub"] = match.group("sub")
+            else:
+                key = match.group("key")
+                value = next((group for group in match.group("double", "single", "bare") if group is not None), None)
+                self.validate(key, value, position + index)
+                parsed[key] = value
+            index = match.end()
+        content = [key for key in parsed if key in self._say_as or key in ("ipa", "sub")]
+        if len(content) > 1:
+            raise SpeechMarkdownError(f'Modifiers can not be combined: {", ".join(content)}', position)
+        return parsed
+
+    def validate(self, key: str, value: str, position: int):
+        if key in self._prosody:
+            if value not in self._prosody[key]:
+                raise SpeechMarkdownError(f'Invalid {key}: {value} (must be one of: {", ".join(self._prosody[key])})', position)
+        elif key == "emphasis":
+            levels = SimpleSpeechMarkdown._emphasis_levels
+            if value is not None and value not in levels:
+                raise SpeechMarkdownError(f'Invalid emphasis level: {value} (must be one of: {", ".join(levels)})', position)
+        elif key == "date":
+            if value is not None and value not in self._date_formats:
+                raise SpeechMarkdownError(f'Invalid date format: {value} (must be one of: {", ".join(self._date_formats)})', position)
+        elif key == "time":
+            if value is not None and value not in SimpleSpeechMarkdown._time_formats:
+                raise SpeechMarkdownError(f'Invalid time format: {value} (must be one of: {", ".join(SimpleSpeechMarkdown._time_formats)})', position)
+        elif key in ("ipa", "sub", "lang"):
+            if not value:
+                raise SpeechMarkdownError(f"Missing value of {key}", position)
+        elif key not in self._say_as and key != "whisper":
+            raise SpeechMarkdownError(f"Unknown modifier: {key}", position)
+
+
+class SSMLGenerator:
+    """
+    Generates SSML from parsed nodes.
+
+    Args:
+        text_filter (callable): Converts plain text into SSML text, must escape it (defaults to escape_text)
+    """
+    def __init__(self, text_filter=None):
+        self.text_filter = text_filter or escape_text
+
+    @staticmethod
+    def _attribute(value: str) -> str:
+        return html.escape(value, quote=True)
+
+    def generate(self, nodes) -> str:
+        parts = []
+        for node in nodes:
+            if isinstance(node, Text):
+                parts.append(self.text_filter(node.text))
+            elif isinstance(node, Tag):
+                parts.append(node.ssml)
+            elif isinstance(node, Break):
+                if node.strength is not None:
+                    parts.append(f'<break strength="{node.strength}"/>')
+                else:
+                    parts.append(f'<break time="{node.time}"/>')
+            elif isinstance(node, Audio):
+                parts.append(f'<audio src="{self._attribute(node.url)}">{escape_text(node.caption)}</audio>')
+            else:
+                parts.append(self.element(node))
+        return "".join(parts)
+
+    def element(self, node: Element) -> str:
+        modifiers = node.modifiers
+        # NOTE Innermost tag first, every further tag wraps the previous ones
+        ssml = escape_text(node.text)
+        if "ipa" in modifiers:
+            ssml = f'<phoneme alphabet="ipa" ph="{self._attribute(modifiers["ipa"])}">{ssml}</phoneme>'
+        elif "sub" in modifiers:
+            ssml = f'<sub alias="{self._attribute(modifiers["sub"])}">{ssml}</sub>'
+        else:
+            for key, value in modifiers.items():
+                interpret_as = SpeechMarkdownParser._say_as.get(key)
+                if interpret_as is not None:
+                    format = f' format="{self._attribute(value)}"' if value else ""
+                    ssml = f'<say-as interpret-as="{interpret_as}"{format}>{ssml}</say-as>'
+                    break
+        if "emphasis" in modifiers:
+            ssml = f'<emphasis level="{modifiers["emphasis"] or "moderate"}">{ssml}</emphasis>'
+        prosody = {key: modifiers[key] for key in SpeechMarkdownParser._prosody if key in modifiers}
+        if "whisper" in modifiers:
+            # NOTE Generic SSML has no whisper effect, Speech Markdown renders it as soft and slow prosody
+            prosody.setdefault("volume", "x-soft")
+            prosody.setdefault("rate", "slow")
+        if prosody:
+            attributes = " ".join(f'{key}="{value}"' for key, value in prosody.items())
+            ssml = f'<prosody {attributes}>{ssml}</prosody>'
+        if "lang" in modifiers:
+            ssml = f'<lang xml:lang="{self._attribute(modifiers["lang"])}">{ssml}</lang>'
+        return ssml
+
+
+class SpeechMarkdownCompiler:
+    """
+    Compiles Speech Markdown into SSML paragraph by paragraph (paragraphs are separated by blank lines).
+    Compiled paragraphs are kept in a cache of the least recently used cache_size paragraphs, so after an edit
+    only the changed paragraphs are compiled again, also when the text is compiled line by line or segment by
+    segment (e.g. for the character count and the synthesis).
+
+    Args:
+        text_filter (callable): Converts plain text into SSML text, must escape it (defaults to escape_text)
+        cache_size (int): Paragraphs kept in the cache
+    """
+    _paragraph_separator = re.compile(r'(\n[ \t]*\n\s*)')
+
+    def __init__(self, text_filter=None, cache_size: int = 8192):
+        self.parser = SpeechMarkdownParser()
+        self.generator = SSMLGenerator(text_filter)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def compile_paragraph(self, paragraph: str, offset: int = 0) -> str:
+        """Compile a single paragraph (uncached)."""
+        return self.generator.generate(self.parser.parse(tokenize(paragraph), offset))
+
+    def compile(self, text: str, wrap: bool = False) -> str:
+        """
+        Args:
+            text (str): Speech Markdown
+            wrap (bool): Wrap the SSML into <speak></speak>
+        Returns:
+            str: SSML
+        Raises:
+            SpeechMarkdownError: Invalid Speech Markdown (position is relative to text)
+        """
+        parts = []
+        cache = self._cache
+        offset = 0
+        # NOTE Every odd part is a separator, which is kept as is
+        for index, part in enumerate(self._paragraph_separator.split(text)):
+            if index % 2:
+                parts.append(part)
+            else:
+                ssml = cache.get(part)
+                if ssml is None:
+                    self.misses += 1
+                    ssml = cache[part] = self.compile_paragraph(part, offset)
+                    if len(cache) > self.cache_size:
+                        cache.popitem(last=False)
+                else:
+                    self.hits += 1
+                    cache.move_to_end(part)
+                parts.append(ssml)
+            offset += len(part)
+        ssml = "".join(parts)
+        return f"<speak>{ssml}</speak>" if wrap else ssml
+
+    def clear(self):
+        self._cache = OrderedDict()
+
+
+if __name__ == '__main__':
+    import timeit
+
+    compiler = SpeechMarkdownCompiler()
+    sample = ('Hello, [500ms] this is ++really++ (important)[emphasis:"strong";rate:"slow"]. '
+              'Call (555-555-5555)[phone:"1"] or say (pecan)[/pɪˈkɑːn/] & (whisper this)[whisper].\n\n')
+    print(compiler.compile(sample, wrap=True))
+    # NOTE Numbered paragraphs, so they are all distinct
+    paragraphs = [f"{index}. {sample.strip()}" for index in range(1024 * 1024 // len(sample))]
+    text = "\n\n".join(paragraphs)
+    print(f"Full compile of {len(text) / 1024 / 1024:.2f} MB: "
+          f"{timeit.timeit(lambda: SpeechMarkdownCompiler().compile(text), number=1) * 1000:.1f} ms")
+    compiler.compile(text)
+    paragraphs[len(paragraphs) // 2] = "One (changed)[characters] paragraph."
+    edited = "\n\n".join(paragraphs)
+    print(f"Recompile after editing one paragraph: {timeit.timeit(lambda: compiler.compile(edited), number=1) * 1000:.1f} ms")
+    compiler = SpeechMarkdownCompiler()
+    lines = [paragraph for paragraph in paragraphs[:2000]]
+    print(f"Compiling {len(lines)} lines one by one, first: {timeit.timeit(lambda: [compiler.compile(line) for line in lines], number=1) * 1000:.1f} ms, "
+          f"again: {timeit.timeit(lambda: [compiler.compile(line) for line in lines], number=1) * 1000:.1f} ms")
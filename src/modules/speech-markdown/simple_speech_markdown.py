@@ -12,7 +12,7 @@ class SimpleSpeechMarkdown:
         _rate_levels (list): Rate levels
         _pitch_levels (list): Pitch levels
         _time_formats (list): Time formats
-        _units (list): Units
+        _units (list): Units (see units())
         _volume_levels (list): Volume levels
     """
     _emphasis_levels = {
@@ -39,10 +39,7 @@ class SimpleSpeechMarkdown:
         "hms12",
         "hms24"
     ]
-    _units = [
-        "foot",
-        "ft"
-    ]
+    _units = None  # NOTE The unit symbols of the normalization lexicons plus the spelled out foot, see units()
     _volume_levels = [
         "silent",
         "x-soft",
@@ -141,7 +138,7 @@ class SimpleSpeechMarkdown:
         if(level not in self._emphasis_levels.keys()):
             raise ValueError(f'Invalid emphasis level: {level} (must be one of {self._emphasis_levels.keys()})')
         if(inline):
-            return f'{_emphasis_levels[level]}{text}{_emphasis_levels[level]}'
+            return f'{self._emphasis_levels[level]}{text}{self._emphasis_levels[level]}'
         else:
             return f'({text})[emphasis:\"{level}\"]'
     def expletive(self, text: str) -> str:
@@ -242,7 +239,7 @@ class SimpleSpeechMarkdown:
             https://www.speechmarkdown.org/syntax/phone/
         """
         # TODO Verify phone number for phone()
-        return f'({text})[phone:\"{number}\"]'
+        return f'({text})[phone:\"{country_code}\"]'
     def pitch(self, text: str, level: str = "medium") -> str:
         """
         Args:
@@ -303,22 +300,30 @@ class SimpleSpeechMarkdown:
         if(format not in self._time_formats):
             raise ValueError(f'Invalid time format: {format} (must be one of: {", ".join(self._time_formats)})')
         return f'({time})[time:\"{format}\"]'
+    @classmethod
+    def units(cls) -> list:
+        """Units accepted by unit(): the unit symbols of the normalization lexicons (modules/ssml/normalizer.py) and foot."""
+        if cls._units is None:
+            # NOTE Imported here, so the compiler can still be run as a script from its directory (benchmark)
+            from modules.ssml.normalizer import LEXICONS
+            cls._units = sorted({"foot"} | {unit for lexicon in LEXICONS.values() for unit in lexicon.units})
+        return cls._units
+
     def unit(self, number: int, unit: str) -> str:
         """
         Args:
             number (int): Number
-            unit (str): Unit (Not all unit types are supported yet, currently only supports: foot, ft)
+            unit (str): Unit (foot or a unit symbol of the normalization lexicons, e.g. ft, km, kg, °C)
         Returns:
             str: Speech Markdown unit (e.g. "(1 ft)[unit]" or "(1 foot)[unit]")
         Raises:
-            ValueError: Invalid unit (must be one of: foot, ft)
+            ValueError: Invalid unit
         See Also:
             https://www.speechmarkdown.org/syntax/unit/
         """
-        # TODO Add support for more unit types for unit()
         # TODO Convert metric units to SSML supported imperial units for unit()
-        if(unit not in self._units):
-            raise ValueError(f'Invalid unit: {unit} (must be one of: {", ".join(self._units)})'
+        if(unit not in self.units()):
+            raise ValueError(f'Invalid unit: {unit} (must be one of: {", ".join(self.units())})')
         return f'({number} {unit})[unit]'
     def volume(self, text: str, level: str = "medium") -> str:
         """
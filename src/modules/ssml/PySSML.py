@@ -59,6 +59,9 @@ class PySSML:
         'volume': ['silent', 'x-soft', 'soft', 'medium', 'loud', 'x-loud']
     }
 
+    _escape_pattern = re.compile('[<>"\']')
+    _duration_pattern = re.compile(r'^(\d*\.?\d+)(s|ms)$')
+
     def __init__(self):
         self.ssml_list = []
         self.card_list = []
@@ -68,12 +71,12 @@ class PySSML:
         self.card_list = []
 
     def _escape(self, text):
-        return re.sub('&', 'and', re.sub('[\<\>\"\']', '', str(text)))
+        return self._escape_pattern.sub('', str(text)).replace('&', 'and')
 
     def _validate_duration(self, duration):
         try:
-            matches = re.match('^(\d*\.?\d+)(s|ms)$', duration)
-            value_part = int(matches.groups()[0])
+            matches = self._duration_pattern.match(duration)
+            value_part = float(matches.groups()[0])
             unit_part = matches.groups()[1]
             if (unit_part == 's' and value_part > 10) or value_part > 10000:
                 raise ValueError('Duration %s is longer than 10 seconds' % duration)
@@ -166,10 +169,9 @@ class PySSML:
         if duration is None:
             raise TypeError('Parameter duration must not be None')
         self._validate_duration(duration)
-        ssml = ''
-        for c in self._escape(text):
-            ssml += "<say-as interpret-as='spell-out'>%s</say-as> <break time='%s'/> " % (c, self._escape(duration))
-        self.ssml_list.append(ssml.strip())
+        pause = "<break time='%s'/>" % self._escape(duration)
+        self.ssml_list.append(' '.join("<say-as interpret-as='spell-out'>%s</say-as> %s" % (c, pause)
+                                       for c in self._escape(text)))
         self.card_list.append('%s' % self._escape(text))
 
     def say_as(self, word, interpret, interpret_format=None):
@@ -0,0 +1,369 @@
+"""builder.py
+
+Node tree SSML builder with the element methods of PySSML.
+
+Unlike PySSML, which joins lists of strings, the builder keeps a tree of nodes with precomputed lengths.
+The serialized length is therefore known at any time without joining, and the SSML can be streamed
+to a writer or generator fragment by fragment.
+"""
+from contextlib import contextmanager
+import html
+import re
+import urllib.parse
+
+from modules.ssml.PySSML import PySSML
+
+_duration_pattern = re.compile(r'^(\d*\.?\d+)(s|ms)$')
+
+
+def escape(text) -> str:
+    return html.escape(str(text), quote=False)
+
+
+def escape_attribute(value) -> str:
+    return html.escape(str(value), quote=True)
+
+
+def validate_duration(duration: str):
+    """
+    Raises:
+        ValueError: Duration is invalid or longer than 10 seconds
+    """
+    match = _duration_pattern.match(duration) if isinstance(duration, str) else None
+    if match is None:
+        raise ValueError('Duration %s is invalid' % duration)
+    value, unit = float(match.group(1)), match.group(2)
+    if (value > 10 if unit == 's' else value > 10000):
+        raise ValueError('Duration %s is longer than 10 seconds' % duration)
+
+
+def validate_url(url: str):
+    """
+    Raises:
+        ValueError: URL has no scheme or host
+    """
+    try:
+        parse_tokens = urllib.parse.urlparse(url)
+    except (TypeError, ValueError):
+        raise ValueError('URL %s invalid' % url)
+    if parse_tokens.scheme == '' or parse_tokens.netloc == '':
+        raise ValueError('URL %s invalid' % url)
+
+
+class Node:
+    """
+    SSML element (tag is set) or text node (tag is None).
+    Children of an element are separated by a single space, like the items of PySSML.
+
+    Attributes:
+        length (int): Length of the serialized node, kept up to date when children are appended
+    """
+    __slots__ = ("tag", "attributes", "children", "text", "length", "_open", "_close")
+
+    def __init__(self, tag: str = None, attributes: dict = None, text: str = ""):
+        self.tag = tag
+        self.attributes = attributes or {}
+        self.children = []
+        self.text = text
+        if tag is None:
+            self._open = self._close = ""
+            self.length = len(text)
+        else:
+            attributes = "".join(f' {key}="{escape_attribute(value)}"' for key, value in self.attributes.items())
+            self._open = f"<{tag}{attributes}>"
+            self._close = f"</{tag}>"
+            self.length = len(self._open) + len(self._close)
+
+    def fragments(self):
+        """Yield the serialized node fragment by fragment."""
+        if self.tag is None:
+            yield self.text
+            return
+        if not self.children and self.tag in ("break", "audio"):
+            yield self._open[:-1] + "/>"
+            return
+        yield self._open
+        for index, child in enumerate(self.children):
+            if index:
+                yield " "
+            yield from child.fragments()
+        yield self._close
+
+    def serialized_length(self) -> int:
+        if self.tag in ("break", "audio") and not self.children:
+            return len(self._open) + 1  # NOTE Self-closing: "/>" instead of ">" and no closing tag
+        return self.length
+
+    def plain_text(self) -> str:
+        """Return the text of the node without markup (used for cards)."""
+        if self.tag is None:
+            return html.unescape(self.text)
+        return " ".join(text for text in (child.plain_text() for child in self.children) if text)
+
+
+class SSMLBuilder:
+    """
+    Builds SSML as a node tree.
+
+    Elements are added to the root or to the innermost element opened with element():
+
+        builder = SSMLBuilder()
+        builder.say("Hello")
+        with builder.element("prosody", rate="slow"):
+            builder.say("world")
+        builder.write(sys.stdout)
+
+    Attributes:
+        length (int): Length of the serialized SSML without the <speak> wrapper, including open elements
+    """
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.root = Node("speak")
+        self._stack = [self.root]
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def _append(self, node: Node) -> Node:
+        parent = self._stack[-1]
+        added = node.serialized_length() + (1 if parent.children else 0)
+        parent.children.append(node)
+        for ancestor in self._stack:
+            ancestor.length += added
+        self.length += added
+        return node
+
+    def _leaf(self, tag: str, attributes: dict, text: str = None) -> Node:
+        node = Node(tag, attributes)
+        if text is not None:
+            child = Node(text=escape(text))
+            node.children.append(child)
+            node.length += child.length
+        return self._append(node)
+
+    @contextmanager
+    def element(self, tag: str, **attributes):
+        """Open an element, everything added inside the with block becomes its content."""
+        node = self._append(Node(tag, attributes))
+        self._stack.append(node)
+        try:
+            yield node
+        finally:
+            self._stack.pop()
+
+    def fragments(self, wrap: bool = True):
+        """Yield the SSML fragment by fragment, without building the complete string."""
+        if wrap:
+            yield from self.root.fragments()
+            return
+        for index, child in enumerate(self.root.children):
+            if index:
+                yield " "
+            yield from child.fragments()
+
+    def write(self, writer, wrap: bool = True) -> int:
+        """
+        Stream the SSML to a writer (anything with a write(str) method, e.g. a file).
+
+        Returns:
+            int: Number of characters written
+        """
+        written = 0
+        for fragment in self.fragments(wrap):
+            writer.write(fragment)
+            written += len(fragment)
+        return written
+
+    def ssml(self, wrap: bool = True) -> str:
+        """Return the SSML, pass False to strip the <speak> tag wrapper."""
+        return "".join(self.fragments(wrap))
+
+    def card(self) -> str:
+        return self.root.plain_text()
+
+    def say(self, text):
+        """Add raw text."""
+        if text is None:
+            raise TypeError('Parameter text must not be None')
+        return self._append(Node(text=escape(text)))
+
+    def paragraph(self, text):
+        """Wrap text with <p> tag."""
+        if text is None:
+            raise TypeError('Parameter text must not be None')
+        return self._leaf("p", None, text)
+
+    def sentence(self, text):
+        """Wrap text with <s> tag."""
+        if text is None:
+            raise TypeError('Parameter text must not be None')
+        return self._leaf("s", None, text)
+
+    def pause(self, duration):
+        """Add a pause, must be between 0 and 10 seconds."""
+        if duration is None:
+            raise TypeError('Parameter duration must not be None')
+        validate_duration(duration)
+        return self._leaf("break", {"time": duration})
+
+    def pause_by_strength(self, strength):
+        if strength is None:
+            raise TypeError('Parameter strength must not be None')
+        try:
+            strength = strength.lower().strip()
+        except AttributeError:
+            raise AttributeError('Parameter strength must be a string')
+        if strength not in PySSML.PAUSE_STRENGTH:
+            raise ValueError('Value %s is not a valid strength' % strength)
+        return self._leaf("break", {"strength": strength})
+
+    def audio(self, url):
+        """Add audio, must pass a valid url."""
+        if url is None:
+            raise TypeError('Parameter url must not be None')
+        validate_url(url)
+        return self._leaf("audio", {"src": url})
+
+    def spell(self, text):
+        """Read out each character in text."""
+        if text is None:
+            raise TypeError('Parameter text must not be None')
+        return self._leaf("say-as", {"interpret-as": "spell-out"}, text)
+
+    def spell_slowly(self, text, duration):
+        """Read out each character in text slowly placing a pause between characters, pause between 0 and 10 seconds."""
+        if text is None:
+            raise TypeError('Parameter text must not be None')
+        if duration is None:
+            raise TypeError('Parameter duration must not be None')
+        validate_duration(duration)
+        for char in str(text):
+            self._leaf("say-as", {"interpret-as": "spell-out"}, char)
+            self._leaf("break", {"time": duration})
+
+    def say_as(self, word, interpret, interpret_format=None):
+        """Special considerations when speaking word include date, numbers, etc."""
+        if word is None:
+            raise TypeError('Parameter word must not be None')
+        if interpret is None:
+            raise TypeError('Parameter interpret must not be None')
+        if interpret not in PySSML.INTERPRET_AS:
+            raise ValueError('Unknown interpret as %s' % str(interpret))
+        if interpret_format is not None and interpret_format not in PySSML.DATE_FORMAT:
+            raise ValueError('Unknown date format %s' % str(interpret_format))
+        if interpret_format is not None and interpret != 'date':
+            raise ValueError('Date format %s not valid for interpret as %s' % (str(interpret_format), str(interpret)))
+        attributes = {"interpret-as": interpret}
+        if interpret_format is not None:
+            attributes["format"] = interpret_format
+        return self._leaf("say-as", attributes, word)
+
+    def parts_of_speech(self, word, role):
+        """Special considerations when speaking word include usage or role of word."""
+        if word is None:
+            raise TypeError('Parameter word must not be None')
+        if role is None:
+            raise TypeError('Parameter role must not be None')
+        if role not in PySSML.ROLE:
+            raise ValueError('Unknown role %s' % str(role))
+        return self._leaf("w", {"role": role}, word)
+
+    def phoneme(self, word, alphabet, ph):
+        """Specify specific phonetics used when speaking word."""
+        if word is None:
+            raise TypeError('Parameter word must not be None')
+        if alphabet is None:
+            raise TypeError('Parameter alphabet must not be None')
+        if ph is None:
+            raise TypeError('Parameter ph must not be None')
+        if alphabet not in PySSML.ALPHABETS:
+            raise ValueError('Unknown alphabet %s' % str(alphabet))
+        return self._leaf("phoneme", {"alphabet": alphabet, "ph": ph}, word)
+
+    def emphasis(self, level, word):
+        if level is None:
+            raise TypeError('Parameter level must not be None')
+        if word is None:
+            raise TypeError('Parameter word must not be None')
+        try:
+            if len(word.strip()) == 0:
+                raise ValueError('Parameter word must not be empty')
+            level = level.lower().strip()
+        except AttributeError:
+            raise AttributeError('Parameters must be strings')
+        if level not in PySSML.EMPHASIS_LEVELS:
+            raise ValueError('Unknown emphasis level %s' % level)
+        return self._leaf("emphasis", {"level": level}, word)
+
+    def prosody(self, attributes, word):
+        if attributes is None:
+            raise TypeError('Parameter attributes must not be None')
+        if word is None:
+            raise TypeError('Parameter word must not be None')
+        return self._leaf("prosody", self.validate_prosody(attributes), word)
+
+    @staticmethod
+    def validate_prosody(attributes: dict) -> dict:
+        """
+        Returns:
+            dict: Normalized attributes
+        Raises:
+            KeyError: Unknown attribute
+            ValueError: Invalid value
+        """
+        validated = {}
+        for key, value in attributes.items():
+            if key not in PySSML.PROSODY_ATTRIBUTES:
+                raise KeyError('Attribute %s is unknown' % key)
+            try:
+                value = value.lower().strip()
+            except AttributeError:
+                raise AttributeError('Parameters must be strings')
+            if value in PySSML.PROSODY_ATTRIBUTES[key]:
+                validated[key] = value
+            elif key == 'rate' and value.rstrip('%').isdigit() and 0 <= int(value.rstrip('%')) <= 50:
+                validated[key] = '%d%%' % int(value.rstrip('%'))
+            else:
+                raise ValueError('Attribute %s value %s is invalid' % (key, value))
+        return validated
+
+    def sub(self, alias, word):
+        if alias is None:
+            raise TypeError('Parameter alias must not be None')
+        if word is None:
+            raise TypeError('Parameter word must not be None')
+        try:
+            alias = alias.strip()
+            word = word.strip()
+        except AttributeError:
+            raise AttributeError('Parameters must be strings')
+        if len(alias) == 0:
+            raise ValueError('Alias must not be empty')
+        if len(word) == 0:
+            raise ValueError('Word must not be empty')
+        return self._leaf("sub", {"alias": alias}, word)
+
+
+if __name__ == '__main__':
+    import io
+    import timeit
+
+    builder = SSMLBuilder()
+    builder.say("Hello & welcome")
+    with builder.element("prosody", rate="slow"):
+        builder.spell_slowly("abc", "500ms")
+    builder.say_as("01/02/2024", "date", "dmy")
+    print(builder.ssml(), len(builder), len(builder.ssml(wrap=False)))
+
+    def build():
+        builder = SSMLBuilder()
+        for index in range(20000):
+            builder.sentence(f"Sentence number {index} of a long document.")
+            builder.pause("250ms")
+        return builder
+    print(f"20000 sentences built in {timeit.timeit(build, number=1) * 1000:.1f} ms")
+    long = build()
+    print(f"Streamed {long.write(io.StringIO())} characters (running length {len(long) + len('<speak></speak>')})")
@@ -0,0 +1,255 @@
+"""chunker.py
+
+Splits SSML and Speech Markdown into the segments requested from a backend, without breaking open elements:
+tags open at a segment boundary are closed at the end of the segment and opened again in the next one.
+"""
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from importlib import import_module
+import logging
+import re
+
+from modules.text.segmenter import SentenceSegmenter
+
+tokenize = import_module("modules.speech-markdown.compiler").tokenize
+
+_tag_pattern = re.compile(r'<(/?)([A-Za-z][\w:.-]*)[^<>]*?(/?)>')
+_non_space_pattern = re.compile(r'\S')
+_clause_pattern = re.compile(r'[,;:–—](?=\s)')
+_space_pattern = re.compile(r'\s+')
+
+# NOTE An element which may be split: its opening markup ends at open_end, its closing markup starts at close_start
+_Element = namedtuple("_Element", ["open_start", "open_end", "close_start", "close_end", "opening", "closing"])
+
+
+class Chunk(namedtuple("Chunk", ["start", "end", "prefix", "suffix"])):
+    """
+    A segment of the text: text[start:end] with the markup which reopens (prefix) and closes (suffix)
+    the elements it was cut out of.
+    """
+    __slots__ = ()
+
+    def text(self, source: str) -> str:
+        return self.prefix + source[self.start:self.end] + self.suffix
+
+
+class SsmlChunker:
+    """
+    Splits a text into chunks at sentence ends (see modules/text/segmenter.py), so every sentence is a segment
+    of its own. A sentence longer than the character limit of the backend is split again, preferring breaks
+    ([500ms] or <break/>), then clause punctuation, then spaces. Markup is never cut: tags, breaks and audio
+    stay whole, SSML elements and Speech Markdown modifiers or emphasis which span a boundary are closed and
+    reopened, e.g. "(One. Two.)[rate:slow]" becomes "(One.)[rate:slow]" and "(Two.)[rate:slow]".
+
+    Args:
+        segmenter (SentenceSegmenter): Segmenter of the sentences (defaults to one with the default abbreviations)
+        max_characters (int): Character limit of a request including the markup (None for no limit)
+        measure (callable): measure(chunk_text) returns the characters the backend counts, e.g. after compiling
+                            the Speech Markdown (defaults to len)
+    """
+    min_fill = 0.5  # NOTE A preferred split point is only used if the chunk is at least half the limit
+
+    def __init__(self, segmenter: SentenceSegmenter = None, max_characters: int = None, measure=None):
+        self.segmenter = segmenter or SentenceSegmenter()
+        self.max_characters = max_characters
+        self.measure = measure or len
+
+    def _scan(self, text: str):
+        """Collect the markup intervals, the splittable elements and the ends of breaks in one pass."""
+        markups = []
+        elements = []
+        breaks = []
+        open_tags = []
+        for kind, value in tokenize(text):
+            if kind == "text":
+                continue
+            start, end = value.span()
+            if kind == "modifier":
+                text_end = value.end("text")
+                markups.extend([(start, start + 1), (text_end, end)])
+                elements.append(_Element(start, start + 1, text_end, end, "(", text[text_end:end]))
+            elif kind == "emphasis":
+                marker = value.group("marker")
+                markups.extend([(start, start + len(marker)), (end - len(marker), end)])
+                elements.append(_Element(start, start + len(marker), end - len(marker), end, marker, marker))
+            else:
+                markups.append((start, end))
+                tag = _tag_pattern.match(value.group()) if kind == "tag" else None
+                if kind == "break" or tag is not None and tag.group(2) == "break":
+                    breaks.append(end)
+                elif tag is not None and tag.group(1):
+                    # NOTE Unbalanced closing tags are left to the validator
+                    for index in range(len(open_tags) - 1, -1, -1):
+                        if open_tags[index][0] == tag.group(2):
+                            _, open_start, opening = open_tags.pop(index)
+                            elements.append(_Element(open_start, open_start + len(opening), start, end,
+                                                     opening, f"</{tag.group(2)}>"))
+                            break
+                elif tag is not None and not tag.group(3):
+                    open_tags.append((tag.group(2), start, value.group()))
+        for name, open_start, opening in open_tags:
+            # NOTE Never closed in the text, so it is only closed at the end of the chunks within it
+            elements.append(_Element(open_start, open_start + len(opening), len(text), len(text), opening, f"</{name}>"))
+        markups.sort()
+        elements.sort(key=lambda element: (element.open_end, -element.close_start))
+        return markups, elements, breaks
+
+    def split(self, text: str):
+        """
+        Returns:
+            list: Chunk of every segment in text order, whitespace-only and markup-only spans are not segments of their own
+        """
+        self._text = text
+        self._markups, self._elements, self._breaks = self._scan(text)
+        self._markup_starts = [start for start, _ in self._markups]
+        self._open_ends = [element.open_end for element in self._elements]
+        self._closings = {element.close_start: element.close_end for element in self._elements
+                          if element.close_end > element.close_start}
+        self._base = (-1, [])
+        chunks = []
+        start = 0
+        for boundary in list(self.segmenter.boundaries(text)) + [len(text)]:
+            cut = self._settle(boundary)
+            if cut <= start:
+                continue
+            first = self._skip_space(start, cut)
+            last = self._trim_space(first, cut)
+            if not self._speakable(first, last):
+                continue  # NOTE E.g. only an opening tag on its line, it is spoken with the next sentence
+            self._advance(first)
+            self._add(chunks, first, last)
+            start = cut
+        return chunks
+
+    def _skip_space(self, start: int, end: int) -> int:
+        match = _non_space_pattern.search(self._text, start, end)
+        return end if match is None else match.start()
+
+    def _trim_space(self, start: int, end: int) -> int:
+        while end > start and self._text[end - 1].isspace():
+            end -= 1
+        return end
+
+    def _markup_at(self, position: int):
+        """The markup interval containing the position (not at its start), or None."""
+        index = bisect_right(self._markup_starts, position) - 1
+        if index >= 0 and self._markups[index][0] < position < self._markups[index][1]:
+            return self._markups[index]
+        return None
+
+    def _settle(self, cut: int) -> int:
+        """Move a cut out of markup and past the whitespace and closing markup after it, so closings stay with their content."""
+        markup = self._markup_at(cut)
+        if markup is not None:
+            cut = markup[0]
+        while True:
+            position = self._skip_space(cut, len(self._text))
+            if position not in self._closings:
+                return cut
+            cut = self._closings[position]
+
+    def _speakable(self, start: int, end: int) -> bool:
+        """Whether text[start:end] has any text outside of markup."""
+        position = start
+        for index in range(max(bisect_right(self._markup_starts, start) - 1, 0), len(self._markups)):
+            markup_start, markup_end = self._markups[index]
+            if markup_start >= end:
+                break
+            if markup_end <= position:
+                continue
+            if _non_space_pattern.search(self._text, position, min(markup_start, end)) is not None:
+                return True
+            position = max(position, markup_end)
+        return position < end and _non_space_pattern.search(self._text, position, end) is not None
+
+    def _open_at(self, position: int):
+        """Elements open at the position (not before the last advanced position), outermost first."""
+        base_position, base = self._base
+        opened = self._elements[bisect_right(self._open_ends, base_position):bisect_right(self._open_ends, position)]
+        return [element for element in base + opened if element.close_start > position]
+
+    def _advance(self, position: int):
+        """Remember the elements open at the position, so later lookups only consider the elements opened since."""
+        self._base = (position, self._open_at(position))
+
+    def _chunk(self, start: int, end: int) -> Chunk:
+        opened = self._open_at(start)
+        closed = self._open_at(end)
+        return Chunk(start, end, "".join(element.opening for element in opened),
+                     "".join(element.closing for element in reversed(closed)))
+
+    def _fits(self, chunk: Chunk) -> bool:
+        return self.max_characters is None or self.measure(chunk.text(self._text)) <= self.max_characters
+
+    def _add(self, chunks, start: int, end: int):
+        """Add the chunk of text[start:end], split further as long as it exceeds the limit."""
+        while True:
+            chunk = self._chunk(start, end)
+            if self._fits(chunk):
+                chunks.append(chunk)
+                return
+            cut = self._best_cut(start, end)
+            if cut is None:
+                logging.error("%s: Can not split the text at character %d below %d characters",
+                              self.__class__.__name__, start, self.max_characters)
+                chunks.append(chunk)
+                return
+            chunks.append(self._chunk(start, self._trim_space(start, cut)))
+            start = self._skip_space(cut, end)
+            if start >= end:
+                return
+
+    def _candidates(self, start: int, end: int):
+        """Yield the split points of text[start:end] by preference: after breaks, after clauses, at spaces, anywhere."""
+        yield self._breaks[bisect_right(self._breaks, start):bisect_left(self._breaks, end)]
+        yield [match.end() for match in _clause_pattern.finditer(self._text, start, end)]
+        yield [match.start() for match in _space_pattern.finditer(self._text, start, end)]
+        yield range(start + 1, end)
+
+    def _best_cut(self, start: int, end: int):
+        """The last preferred split point which keeps the chunk within the limit, found by bisection."""
+        best = None
+        for candidates in self._candidates(start, end):
+            low, high = 0, len(candidates)
+            found = None
+            while low < high:
+                middle = (low + high) // 2
+                cut = self._settle(candidates[middle])
+                last = self._trim_space(start, cut)
+                if last <= start or not self._speakable(start, last):
+                    low = middle + 1
+                    continue
+                if cut < end and self._fits(self._chunk(start, last)):
+                    found = cut
+                    low = middle + 1
+                else:
+                    high = middle
+            if found is not None:
+                if best is None or found > best:
+                    best = found
+                if self.measure(self._chunk(start, self._trim_space(start, found)).text(self._text)) >= self.min_fill * self.max_characters:
+                    return found
+        return best
+
+
+if __name__ == '__main__':
+    import random
+    import timeit
+
+    chunker = SsmlChunker(max_characters=60)
+    sample = ('<prosody rate="slow">One sentence. (Another one, spoken slowly.)[rate:slow] ++Very, very, very, very, very, '
+              'very important.++</prosody> Then [500ms] a pause and <emphasis>a long clause, which is split after the '
+              'comma, and then again</emphasis> at a space.')
+    for chunk in chunker.split(sample):
+        print(repr(chunk.text(sample)))
+
+    random.seed(1)
+    words = ["word", "Sentence.", "clause,", "[300ms]", "<break time=\"1s\"/>", "(slow words. More)[rate:slow]", "++loud++", "\n"]
+    paragraphs = [" ".join(random.choice(words) for _ in range(30)) for _ in range(7000)]
+    text = " ".join(f'<prosody pitch="high">{paragraph}</prosody>' if random.random() < 0.5 else paragraph
+                    for paragraph in paragraphs)
+    for limit in (None, 200):
+        chunker = SsmlChunker(max_characters=limit)
+        chunks = chunker.split(text)
+        print(f"{len(text) / 1024 / 1024:.2f} MB, limit {limit}: {len(chunks)} chunks in "
+              f"{timeit.timeit(lambda: chunker.split(text), number=1) * 1000:.0f} ms")
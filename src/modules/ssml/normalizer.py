@@ -0,0 +1,235 @@
+"""normalizer.py
+
+Annotates numbers, dates, times, units and abbreviations with SSML (say-as and sub), so backends read them
+as intended instead of guessing from the raw text.
+"""
+from collections import namedtuple
+import re
+
+from modules.ssml.breaks import XML_ESCAPES
+
+Lexicon = namedtuple("Lexicon", ["abbreviations", "contextual_abbreviations", "units", "date_format", "decimal_separator",
+                                 "thousands_separator", "ordinal"])
+Lexicon.__doc__ = """
+Language specific normalization rules.
+
+Args:
+    abbreviations (dict): Abbreviation (with its periods) -> spoken form
+    contextual_abbreviations (dict): Abbreviation -> [(regex, spoken form)], the first regex which matches the text
+                                     after the abbreviation wins ("" always matches), without a match it is not expanded
+    units (dict): Unit symbol -> (singular, plural) spoken form, used after a number
+    date_format (str): say-as date format of numeric dates with slashes or periods (e.g. "mdy" or "dmy")
+    decimal_separator (str): Decimal separator of numbers
+    thousands_separator (str): Digit grouping separator of numbers
+    ordinal (str): Regex matching an ordinal number (e.g. "1st", or "1." in front of a month or after an article)
+"""
+
+LEXICONS = {
+    "en": Lexicon(
+        abbreviations={
+            "Dr.": "Doctor", "Mr.": "Mister", "Mrs.": "Missus", "Prof.": "Professor", "Jr.": "Junior",
+            "Sr.": "Senior", "e.g.": "for example", "i.e.": "that is", "etc.": "et cetera",
+            "vs.": "versus", "approx.": "approximately", "Fig.": "figure", "Inc.": "Incorporated",
+            "Ltd.": "Limited", "Jan.": "January", "Feb.": "February", "Mar.": "March", "Apr.": "April",
+            "Jun.": "June", "Jul.": "July", "Aug.": "August", "Sep.": "September", "Sept.": "September",
+            "Oct.": "October", "Nov.": "November", "Dec.": "December"
+        },
+        contextual_abbreviations={
+            "No.": [(r'[ \t]*\d', "number")],  # NOTE "No. 5", but not a sentence ending with "No."
+            "St.": [(r'[ \t]+[A-Z][a-z]', "Saint"), ("", "Street")]  # NOTE "St. Louis", but "Main St."
+        },
+        units={
+            "mm": ("millimeter", "millimeters"), "cm": ("centimeter", "centimeters"), "m": ("meter", "meters"),
+            "km": ("kilometer", "kilometers"), "mg": ("milligram", "milligrams"), "g": ("gram", "grams"),
+            "kg": ("kilogram", "kilograms"), "t": ("ton", "tons"), "ml": ("milliliter", "milliliters"),
+            "l": ("liter", "liters"), "s": ("second", "seconds"), "ms": ("millisecond", "milliseconds"),
+            "min": ("minute", "minutes"), "h": ("hour", "hours"), "km/h": ("kilometer per hour", "kilometers per hour"),
+            "mph": ("mile per hour", "miles per hour"), "ft": ("foot", "feet"), "mi": ("mile", "miles"),
+            "lb": ("pound", "pounds"), "lbs": ("pound", "pounds"), "oz": ("ounce", "ounces"),
+            "°C": ("degree Celsius", "degrees Celsius"), "°F": ("degree Fahrenheit", "degrees Fahrenheit"),
+            "%": ("percent", "percent"), "kWh": ("kilowatt hour", "kilowatt hours"), "W": ("watt", "watts"),
+            "kW": ("kilowatt", "kilowatts"), "V": ("volt", "volts"), "Hz": ("hertz", "hertz"),
+            "GB": ("gigabyte", "gigabytes"), "MB": ("megabyte", "megabytes"), "kB": ("kilobyte", "kilobytes")
+        },
+        date_format="mdy",
+        decimal_separator=".",
+        thousands_separator=",",
+        ordinal=r'\d+(?:st|nd|rd|th)\b'
+    ),
+    "de": Lexicon(
+        abbreviations={
+            "Dr.": "Doktor", "Prof.": "Professor", "Hr.": "Herr", "Fr.": "Frau", "Nr.": "Nummer", "Str.": "Straße",
+            "z. B.": "zum Beispiel", "z.B.": "zum Beispiel", "d. h.": "das heißt", "d.h.": "das heißt",
+            "u. a.": "unter anderem", "u.a.": "unter anderem", "usw.": "und so weiter", "bzw.": "beziehungsweise",
+            "ca.": "circa", "vgl.": "vergleiche", "evtl.": "eventuell", "ggf.": "gegebenenfalls",
+            "inkl.": "inklusive", "bzgl.": "bezüglich", "etc.": "et cetera", "Jan.": "Januar", "Feb.": "Februar",
+            "Aug.": "August", "Sept.": "September", "Okt.": "Oktober", "Nov.": "November", "Dez.": "Dezember"
+        },
+        contextual_abbreviations={},
+        units={
+            "mm": ("Millimeter", "Millimeter"), "cm": ("Zentimeter", "Zentimeter"), "m": ("Meter", "Meter"),
+            "km": ("Kilometer", "Kilometer"), "mg": ("Milligramm", "Milligramm"), "g": ("Gramm", "Gramm"),
+            "kg": ("Kilogramm", "Kilogramm"), "t": ("Tonne", "Tonnen"), "ml": ("Milliliter", "Milliliter"),
+            "l": ("Liter", "Liter"), "s": ("Sekunde", "Sekunden"), "ms": ("Millisekunde", "Millisekunden"),
+            "min": ("Minute", "Minuten"), "h": ("Stunde", "Stunden"),
+            "km/h": ("Kilometer pro Stunde", "Kilometer pro Stunde"), "°C": ("Grad Celsius", "Grad Celsius"),
+            "%": ("Prozent", "Prozent"), "€": ("Euro", "Euro"), "kWh": ("Kilowattstunde", "Kilowattstunden"),
+            "W": ("Watt", "Watt"), "kW": ("Kilowatt", "Kilowatt"), "V": ("Volt", "Volt"), "Hz": ("Hertz", "Hertz"),
+            "GB": ("Gigabyte", "Gigabyte"), "MB": ("Megabyte", "Megabyte"), "kB": ("Kilobyte", "Kilobyte")
+        },
+        date_format="dmy",
+        decimal_separator=",",
+        thousands_separator=".",
+        # NOTE "am 1. Mai", "der 3. Platz" or "als 2. ins Ziel", but not the end of a sentence like "Seite 5. Dann",
+        # longer numbers before a period usually end a sentence
+        ordinal=r'(?:' + "|".join(rf'(?<=\b{article}[ \t])' for article in (
+                    "der", "die", "das", "dem", "den", "des", "am", "im", "vom", "zum", "zur", "beim", "ab", "bis", "seit"))
+                + r')\d{1,2}\.(?=[ \t]+[^\W\d_])'
+                + r'|\d{1,2}\.(?=[ \t]+(?:Januar|Februar|März|April|Mai|Juni|Juli|August|September|Oktober|November|Dezember'
+                + r'|Jan\.|Feb\.|Aug\.|Sept\.|Okt\.|Nov\.|Dez\.|[a-zäöüß]))'
+    )
+}
+
+
+def trie_pattern(words) -> str:
+    """
+    Build a regex which matches any of the words from a trie of the words, so shared prefixes are matched once
+    instead of trying every word in turn. The longest word wins.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = None
+
+    def build(node) -> str:
+        alternatives = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ""
+        pattern = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+        return f"(?:{pattern})?" if "" in node else pattern
+    return build(trie)
+
+
+def _escape(text: str) -> str:
+    for char, escaped in XML_ESCAPES.items():
+        text = text.replace(char, escaped)
+    return text
+
+
+class TextNormalizer:
+    """
+    Annotates the tokens of a language in a single pass of one compiled regex: dates and times get say-as,
+    ordinals and grouped numbers say-as ordinal or cardinal, units after numbers and abbreviations get a sub alias.
+    Abbreviations and units are matched by a regex compiled from a trie of the lexicon.
+
+    The text between the tokens is passed on to the text filter (e.g. BreakConverter.convert), so the normalizer
+    can be used as the text filter of the SpeechMarkdownCompiler in front of the other conversions.
+
+    Args:
+        language (str): Key of LEXICONS (e.g. "en" or "de"), language variants like "de-AT" use the base language
+        text_filter (callable): Converts the text between the tokens into SSML text, must escape it
+    Raises:
+        ValueError: Unsupported language
+    """
+    def __init__(self, language: str = "en", text_filter=None):
+        base_language = language.split("-")[0].lower()
+        if base_language not in LEXICONS:
+            raise ValueError(f'Unsupported language: {language} (must be one of: {", ".join(LEXICONS)})')
+        self.language = base_language
+        self.lexicon = LEXICONS[base_language]
+        self.text_filter = text_filter or _escape
+        lexicon = self.lexicon
+        thousands, decimal = re.escape(lexicon.thousands_separator), re.escape(lexicon.decimal_separator)
+        number = rf'\d{{1,3}}(?:{thousands}\d{{3}})+(?:{decimal}\d+)?|\d+(?:{decimal}\d+)?'
+        # NOTE Every token starts a word with a digit or the first character of an abbreviation,
+        # checking that first lets the scan skip all other positions quickly
+        first_chars = "".join(sorted({re.escape(abbreviation[0]) for abbreviation
+                                      in list(lexicon.abbreviations) + list(lexicon.contextual_abbreviations)}))
+        # NOTE A contextual abbreviation only matches if one of its rules matches the text after it
+        contextual = "|".join(
+            rf'{re.escape(abbreviation)}(?!\w)(?=' + "|".join(f"(?:{regex})" for regex, _ in rules) + ")"
+            for abbreviation, rules in sorted(lexicon.contextual_abbreviations.items(), key=lambda item: -len(item[0])))
+        self._contextual = {abbreviation: [(re.compile(regex), spoken) for regex, spoken in rules]
+                            for abbreviation, rules in lexicon.contextual_abbreviations.items()}
+        # NOTE Single letter units need a space after the number, "1990s" is a decade and "4x4m" no length
+        letters = [unit for unit in lexicon.units if len(unit) == 1 and unit.isalpha()]
+        attached = f"(?!(?:{trie_pattern(letters)})(?![\\w/]))" if letters else ""
+        self._pattern = re.compile(rf"""
+            (?<![\w.])(?=[\d{first_chars}])(?:
+                (?<![,/:-])(?:
+                    (?P<iso_date>\d{{4}}-\d{{2}}-\d{{2}})
+                    |(?P<date>\d{{1,2}}[./]\d{{1,2}}[./](?:\d{{4}}|\d{{2}}))
+                    |(?P<time>\d{{1,2}}:\d{{2}}(?::\d{{2}})?(?:[ \t]?[ap]\.?m\.?)?)
+                    |(?P<ordinal>{lexicon.ordinal})
+                    |(?P<number>{number})(?:(?:[ \t]|{attached})(?P<unit>{trie_pattern(lexicon.units)})(?![\w/]))?
+                )(?![.,]?\d)  # NOTE Not part of a longer number like the version "2.0.1"
+                |(?P<abbreviation>{trie_pattern(lexicon.abbreviations)})(?!\w)
+                {f"|(?P<contextual>{contextual})" if contextual else ""}
+            )
+        """, re.VERBOSE)
+
+    def _number_value(self, number: str) -> float:
+        number = number.replace(self.lexicon.thousands_separator, "").replace(self.lexicon.decimal_separator, ".")
+        return float(number)
+
+    def _annotate(self, match) -> str:
+        kind = match.lastgroup
+        if kind == "abbreviation":
+            abbreviation = match.group("abbreviation")
+            return f'<sub alias="{self.lexicon.abbreviations[abbreviation]}">{_escape(abbreviation)}</sub>'
+        if kind == "contextual":
+            abbreviation = match.group("contextual")
+            spoken = next(spoken for regex, spoken in self._contextual[abbreviation] if regex.match(match.string, match.end()))
+            return f'<sub alias="{spoken}">{_escape(abbreviation)}</sub>'
+        if kind == "iso_date":
+            return f'<say-as interpret-as="date" format="ymd">{match.group()}</say-as>'
+        if kind == "date":
+            return f'<say-as interpret-as="date" format="{self.lexicon.date_format}">{match.group()}</say-as>'
+        if kind == "time":
+            return f'<say-as interpret-as="time">{match.group()}</say-as>'
+        if kind == "ordinal":
+            return f'<say-as interpret-as="ordinal">{match.group()}</say-as>'
+        number = match.group("number")
+        unit = match.group("unit")
+        if unit is None and not match.group().isdigit():
+            return f'<say-as interpret-as="cardinal">{number}</say-as>'  # NOTE Grouped or decimal number
+        if unit is None:
+            return number  # NOTE Plain integers are read correctly by all backends
+        singular, plural = self.lexicon.units[unit]
+        spoken = singular if self._number_value(number) == 1 else plural
+        separator = match.group()[len(number):len(match.group()) - len(unit)]
+        return f'{number}{separator}<sub alias="{spoken}">{_escape(unit)}</sub>'
+
+    def convert(self, text: str) -> str:
+        """Annotate the tokens and pass the text between them to the text filter (linear in the length of the text)."""
+        parts = []
+        position = 0
+        text_filter = self.text_filter
+        for match in self._pattern.finditer(text):
+            if match.start() > position:
+                parts.append(text_filter(text[position:match.start()]))
+            parts.append(self._annotate(match))
+            position = match.end()
+        if position < len(text):
+            parts.append(text_filter(text[position:]))
+        return "".join(parts)
+
+
+if __name__ == '__main__':
+    import timeit
+    from modules.ssml.breaks import BreakConverter
+
+    breaks = BreakConverter(escape=True)
+    english = TextNormalizer("en", breaks.convert)
+    print(english.convert("Dr. Smith ran 5 km in 25 min on 03/14/2024 at 7:30 pm, e.g. 1,250.5 m per 1 h & 2nd place."))
+    print(english.convert("No. 5 is on Main St. in St. Louis. Did he win? No."))
+    german = TextNormalizer("de", breaks.convert)
+    sample = "Am 1. Mai, d. h. am 01.05.2024 um 14:30, lief Dr. Müller ca. 10,5 km bei 20 °C, z. B. 1.000 m in 3 min. "
+    print(german.convert(sample))
+    prose = "Der schnelle braune Fuchs springt über den faulen Hund und läuft dann weiter durch den Wald, bis er am Fluss ankommt. "
+    for name, paragraph in [("Token dense text", sample), ("Prose", prose * 9 + sample)]:
+        text = paragraph * (1024 * 1024 // len(paragraph))
+        print(f"{name}, {len(text) / 1024 / 1024:.2f} MB: {timeit.timeit(lambda: german.convert(text), number=1) * 1000:.0f} ms "
+              f"(breaks only: {timeit.timeit(lambda: breaks.convert(text), number=1) * 1000:.0f} ms)")
@@ -0,0 +1,107 @@
+"""pronunciation.py
+
+User pronunciation dictionary, applied to the text before synthesis.
+"""
+import hashlib
+import json
+import re
+
+from modules.ssml.PySSML import PySSML
+from modules.ssml.builder import escape, escape_attribute
+from modules.ssml.normalizer import trie_pattern
+
+
+class PronunciationDictionary:
+    """
+    Words whose pronunciation is fixed, either by a phoneme (e.g. IPA) or by an alias which is read instead.
+
+    All words are compiled into a single regex built from a trie of the words, so the text is scanned once in C
+    no matter how many entries there are (like an Aho-Corasick automaton, the longest word wins at each position).
+    The regex is compiled when the entries are set and cached until they change.
+
+    Args:
+        entries (dict): Word -> {"ph": pronunciation, "alphabet": "ipa" or "x-sampa" (optional)} or {"alias": text}
+        text_filter (callable): Converts the text between the words into SSML text, must escape it
+    Raises:
+        ValueError: Invalid entry
+    """
+    def __init__(self, entries: dict = None, text_filter=None):
+        self.text_filter = text_filter or escape
+        self.entries = {}
+        self.digest = None
+        self._pattern = None
+        self._replacements = {}
+        self.set_entries(entries or {})
+
+    @staticmethod
+    def validate_entry(word: str, entry: dict):
+        if not word or word != word.strip():
+            raise ValueError(f"Invalid word: '{word}' (must not be empty or start or end with whitespace)")
+        if not isinstance(entry, dict) or ("ph" in entry) == ("alias" in entry):
+            raise ValueError(f"Pronunciation of '{word}' needs either a phoneme (ph) or an alias")
+        if not str(entry.get("ph", entry.get("alias"))).strip():
+            raise ValueError(f"Pronunciation of '{word}' must not be empty")
+        alphabet = entry.get("alphabet", "ipa")
+        if "ph" in entry and alphabet not in PySSML.ALPHABETS:
+            raise ValueError(f'Invalid alphabet for {word}: {alphabet} (must be one of: {", ".join(PySSML.ALPHABETS)})')
+
+    def set_entries(self, entries: dict):
+        """
+        Replace the entries, the regex is only compiled again if they changed.
+
+        Raises:
+            ValueError: Invalid entry (the previous entries are kept)
+        """
+        for word, entry in entries.items():
+            self.validate_entry(word, entry)
+        digest = hashlib.blake2b(json.dumps(entries, sort_keys=True, ensure_ascii=False).encode("utf-8"),
+                                 digest_size=8).hexdigest()
+        if digest == self.digest:
+            return
+        replacements = {}
+        for word, entry in entries.items():
+            if "ph" in entry:
+                replacements[word] = (f'<phoneme alphabet="{escape_attribute(entry.get("alphabet", "ipa"))}" '
+                                      f'ph="{escape_attribute(entry["ph"])}">{escape(word)}</phoneme>')
+            else:
+                replacements[word] = f'<sub alias="{escape_attribute(entry["alias"])}">{escape(word)}</sub>'
+        # NOTE Whole words only, e.g. "Kivy" doesn't match in "Kivys"
+        self._pattern = re.compile(rf'(?<!\w)(?:{trie_pattern(entries)})(?!\w)') if entries else None
+        self._replacements = replacements
+        self.entries = dict(entries)
+        self.digest = digest
+
+    def convert(self, text: str) -> str:
+        """Mark up the words of the dictionary and pass the text between them to the text filter."""
+        if self._pattern is None:
+            return self.text_filter(text)
+        parts = []
+        position = 0
+        text_filter = self.text_filter
+        replacements = self._replacements
+        for match in self._pattern.finditer(text):
+            if match.start() > position:
+                parts.append(text_filter(text[position:match.start()]))
+            parts.append(replacements[match.group()])
+            position = match.end()
+        if position < len(text):
+            parts.append(text_filter(text[position:]))
+        return "".join(parts)
+
+
+if __name__ == '__main__':
+    import random
+    import string
+    import timeit
+
+    dictionary = PronunciationDictionary({"Kivy": {"ph": "ˈkɪvi"}, "SSML": {"alias": "S S M L"},
+                                          "Nguyen": {"ph": "ŋʷɪən", "alphabet": "ipa"}})
+    print(dictionary.convert("Kivy renders SSML for Mr. Nguyen & Kivys friends."))
+    random.seed(1)
+    words = {"".join(random.choices(string.ascii_letters, k=random.randint(4, 12))) for _ in range(5000)}
+    entries = {word: {"alias": word.lower()} for word in words}
+    print(f"Compiling {len(entries)} entries: {timeit.timeit(lambda: PronunciationDictionary(entries), number=1) * 1000:.0f} ms")
+    dictionary.set_entries(entries)
+    text = " ".join(random.choice(list(words)) if random.random() < 0.02 else "lorem" for _ in range(200000))
+    print(f"Applying to {len(text) / 1024 / 1024:.2f} MB: {timeit.timeit(lambda: dictionary.convert(text), number=1) * 1000:.0f} ms, "
+          f"unchanged entries: {timeit.timeit(lambda: dictionary.set_entries(entries), number=1) * 1000:.1f} ms")
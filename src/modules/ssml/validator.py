@@ -0,0 +1,280 @@
+"""validator.py
+
+Incremental validator for SSML which is hand-edited in the editor.
+
+Lines are lexed and their tags validated once, the results are cached by line text. After an edit only the
+changed lines are lexed again and their problems are merged into the problems of the other lines. The nesting
+check only walks the tags of the document again if the edit added, removed or renamed a tag.
+"""
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+import re
+
+from modules.ssml.PySSML import PySSML
+from modules.ssml.builder import SSMLBuilder, validate_duration, validate_url
+
+Problem = namedtuple("Problem", ["start", "end", "line", "column", "message", "severity"])
+Tag = namedtuple("Tag", ["start", "end", "name", "closing", "self_closing"])
+
+ERROR = "error"
+WARNING = "warning"
+
+_tag_pattern = re.compile(r'<(/?)([A-Za-z][\w:.-]*)([^<>]*?)(/?)>')
+_unterminated_pattern = re.compile(r'<(/?)([A-Za-z][\w:.-]*)[^<>]*$')
+_attribute_pattern = re.compile(r'\s*([\w:.-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+
+
+def _choice(name: str, values):
+    def validate(value: str):
+        if value not in values:
+            raise ValueError(f'Invalid {name}: {value} (must be one of: {", ".join(values)})')
+    return validate
+
+
+def _not_empty(name: str):
+    def validate(value: str):
+        if not value.strip():
+            raise ValueError(f"{name} must not be empty")
+    return validate
+
+
+def _prosody(name: str):
+    def validate(value: str):
+        try:
+            SSMLBuilder.validate_prosody({name: value})
+        except (KeyError, ValueError):
+            values = PySSML.PROSODY_ATTRIBUTES[name]
+            raise ValueError(f'Invalid {name}: {value} (must be one of: {", ".join(values)})')
+    return validate
+
+
+class SSMLValidator:
+    """
+    Validates tags, attributes and nesting against the PySSML constants.
+
+    Usage:
+        validator = SSMLValidator()
+        problems = validator.validate(text)  # Once for a new text
+        problems = validator.edit(text, start, removed, inserted)  # On every change, only the edited lines are lexed
+        if validator.has_errors(): ...
+    """
+    # NOTE Tag -> attribute -> validator (raises ValueError)
+    attributes = {
+        "speak": {},
+        "p": {},
+        "s": {},
+        "break": {"time": validate_duration, "strength": _choice("strength", PySSML.PAUSE_STRENGTH)},
+        "prosody": {name: _prosody(name) for name in PySSML.PROSODY_ATTRIBUTES},
+        "emphasis": {"level": _choice("level", PySSML.EMPHASIS_LEVELS)},
+        # NOTE The format depends on interpret-as (e.g. a telephone country code), only dates are checked below
+        "say-as": {"interpret-as": _choice("interpret-as", PySSML.INTERPRET_AS), "format": lambda value: None},
+        "phoneme": {"alphabet": _choice("alphabet", list(PySSML.ALPHABETS)), "ph": _not_empty("ph")},
+        "sub": {"alias": _not_empty("alias")},
+        "audio": {"src": validate_url},
+        "w": {"role": _choice("role", PySSML.ROLE)},
+        "lang": {"xml:lang": _not_empty("xml:lang")},
+        "mark": {"name": _not_empty("name")}
+    }
+    required = {
+        "say-as": ["interpret-as"],
+        "phoneme": ["ph"],
+        "sub": ["alias"],
+        "audio": ["src"],
+        "lang": ["xml:lang"]
+    }
+    empty = ["break", "audio", "mark"]  # NOTE Elements which may be self-closing
+
+    def __init__(self):
+        self.line_starts = array('q', [0])
+        self.lines = [self.lex_line("")]  # NOTE (tags, problems) of every line
+        self._cache = {}
+        self._line_problems = []  # NOTE Problems of the lines in text order
+        self._nesting = []  # NOTE (line, tag, message, severity) of the nesting check
+        self.problems = []
+
+    def has_errors(self) -> bool:
+        return any(problem.severity == ERROR for problem in self.problems)
+
+    def lex_line(self, line: str):
+        """
+        Lex a line and validate its tags.
+
+        Returns:
+            tuple: (tags, problems) with offsets relative to the line, problems are (start, end, message, severity)
+        """
+        tags = []
+        problems = []
+        for match in _tag_pattern.finditer(line):
+            closing, name, attributes, self_closing = match.group(1) == "/", match.group(2), match.group(3), match.group(4) == "/"
+            tags.append(Tag(match.start(), match.end(), name, closing, self_closing))
+            rules = self.attributes.get(name)
+            if rules is None:
+                # NOTE Not SSML, so it's spoken as text (e.g. <Enter> or <name@example.com>) and doesn't block synthesis
+                problems.append((match.start(), match.end(), f"Unknown tag <{name}> is spoken as text", WARNING))
+                continue
+            if closing:
+                if attributes.strip() or self_closing:
+                    problems.append((match.start(), match.end(), f"Malformed closing tag </{name}>", ERROR))
+                continue
+            if self_closing and name not in self.empty:
+                problems.append((match.start(), match.end(), f"<{name}> must not be self-closing", WARNING))
+            problems.extend(self.validate_attributes(name, attributes, rules, match.start(), match.end()))
+        unterminated = _unterminated_pattern.search(line, tags[-1].end if tags else 0)
+        if unterminated is not None and unterminated.group(2) in self.attributes:
+            problems.append((unterminated.start(), len(line), "Unterminated tag (tags must not span lines)", ERROR))
+        return tags, problems
+
+    def validate_attributes(self, name: str, attributes: str, rules: dict, start: int, end: int):
+        problems = []
+        seen = {}
+        index = 0
+        attributes = attributes.rstrip()
+        while index < len(attributes):
+            match = _attribute_pattern.match(attributes, index)
+            if match is None:
+                problems.append((start, end, f"Malformed attributes in <{name}>: {attributes[index:].strip()}", ERROR))
+                break
+            key = match.group(1)
+            value = match.group(2) if match.group(2) is not None else match.group(3)
+            seen[key] = value
+            validate = rules.get(key)
+            if validate is None:
+                problems.append((start, end, f"Unknown attribute {key} of <{name}>", ERROR))
+            else:
+                try:
+                    validate(value)
+                except ValueError as e:
+                    problems.append((start, end, str(e), ERROR))
+            index = match.end()
+        for key in self.required.get(name, []):
+            if key not in seen:
+                problems.append((start, end, f"<{name}> requires the attribute {key}", ERROR))
+        if name == "break" and "time" not in seen and "strength" not in seen:
+            problems.append((start, end, "<break> requires the attribute time or strength", WARNING))
+        if name == "say-as" and seen.get("interpret-as") == "date" and "format" in seen:
+            try:
+                _choice("format", PySSML.DATE_FORMAT)(seen["format"])
+            except ValueError as e:
+                problems.append((start, end, str(e), ERROR))
+        return problems
+
+    def _lex_cached(self, line: str):
+        lexed = self._cache.get(line)
+        if lexed is None:
+            lexed = self._cache[line] = self.lex_line(line)
+        return lexed
+
+    def validate(self, text: str):
+        """
+        Validate a new text, reusing the results of lines with known text.
+
+        Returns:
+            list: Problems in text order
+        """
+        self.line_starts = array('q', [0])
+        self.lines = [self._lex_cached("")]
+        self._line_problems = []
+        self._nesting = []
+        return self.edit(text, 0, 0, len(text))
+
+    def edit(self, text: str, start: int, removed: int, inserted: int, offset: int = 0):
+        """
+        Validate the lines of an edit: text[start:start + inserted] replaced removed characters of the previous text.
+
+        Args:
+            offset (int): Offset of text in the new text, if text is only the part which contains the edited lines
+                          (see Document.lines)
+        Returns:
+            list: Problems of the whole text in text order
+        """
+        delta = inserted - removed
+        first = bisect_right(self.line_starts, start) - 1
+        last = bisect_right(self.line_starts, start + removed) - 1
+        region_start = self.line_starts[first]
+        line_end = text.find("\n", start + inserted - offset)
+        region_end = len(text) if line_end < 0 else line_end
+        if len(self._cache) > 4 * len(self.lines) + 1024:
+            self._cache = {}  # NOTE Keeps the cache proportional to the document
+        lines = text[region_start - offset:region_end].split("\n")
+        starts = array('q')
+        position = region_start
+        for line in lines:
+            starts.append(position)
+            position += len(line) + 1
+        line_delta = len(lines) - (last - first + 1)
+        old_tags = [(number, tag) for number in range(first, last + 1) for tag in self.lines[number][0]]
+        self.lines[first:last + 1] = [self._lex_cached(line) for line in lines]
+        self.line_starts[first:] = starts + array('q', (position + delta for position in self.line_starts[last + 1:]))
+        new_tags = [(number, tag) for number in range(first, first + len(lines)) for tag in self.lines[number][0]]
+
+        # NOTE Problem.line counts from 1, the problems of the lines in front of the edit are kept as they are
+        problems = [problem for problem in self._line_problems if problem.line <= first]
+        for index in range(len(lines)):
+            line_start = starts[index]
+            for problem_start, problem_end, message, severity in self.lines[first + index][1]:
+                problems.append(Problem(line_start + problem_start, line_start + problem_end, first + index + 1,
+                                        problem_start + 1, message, severity))
+        problems.extend(problem._replace(start=problem.start + delta, end=problem.end + delta, line=problem.line + line_delta)
+                        for problem in self._line_problems if problem.line > last + 1)
+        self._line_problems = problems
+
+        if [tag[2:] for _, tag in old_tags] == [tag[2:] for _, tag in new_tags]:
+            # NOTE The same tags in the same order (e.g. typing text), so the nesting is unchanged and only moves
+            moved = dict(zip(old_tags, new_tags))
+            self._nesting = [moved[(number, tag)] + (message, severity) if first <= number <= last else
+                             (number + line_delta if number > last else number, tag, message, severity)
+                             for number, tag, message, severity in self._nesting]
+        else:
+            self._nesting = self.check_nesting((number, tag) for number, (tags, _) in enumerate(self.lines) for tag in tags)
+        nesting = [Problem(self.line_starts[number] + tag.start, self.line_starts[number] + tag.end, number + 1,
+                           tag.start + 1, message, severity) for number, tag, message, severity in self._nesting]
+        self.problems = sorted(self._line_problems + nesting, key=lambda problem: problem.start)
+        return self.problems
+
+    def check_nesting(self, tags):
+        """
+        Args:
+            tags (iterable): (line, Tag) of the document in text order
+        Returns:
+            list: (line, tag, message, severity) of every nesting problem
+        """
+        problems = []
+        stack = []
+        for number, tag in tags:
+            if tag.name not in self.attributes or tag.self_closing:
+                continue
+            if not tag.closing:
+                stack.append((number, tag))
+                continue
+            if not stack or stack[-1][1].name != tag.name:
+                expected = f"</{stack[-1][1].name}>" if stack else "no closing tag"
+                problems.append((number, tag, f"Unexpected </{tag.name}>, expected {expected}", ERROR))
+                # NOTE Recover by closing up to the matching element, if there is one
+                names = [open_tag.name for _, open_tag in stack]
+                if tag.name in names:
+                    del stack[len(names) - 1 - names[::-1].index(tag.name):]
+                continue
+            stack.pop()
+        for number, tag in stack:
+            if tag.name in self.empty:
+                continue  # NOTE e.g. <break time="1s"> without closing tag is accepted by the backends
+            problems.append((number, tag, f"<{tag.name}> is never closed", ERROR))
+        return problems
+
+if __name__ == '__main__':
+    import timeit
+
+    validator = SSMLValidator()
+    sample = ('<p>Hello <break time="500ms"/> <prosody rate="slow" pitch="high">world</prosody>, '
+              '<say-as interpret-as="date" format="dmy">01/02/2024</say-as>.</p>\n')
+    for problem in validator.validate('<speak><p>Hi <break time="20s"/> <foo>x</foo> <emphasis level="loud">y</p>\n'
+                                      '<prosody rate="fast">z</speak> <audio src="nope"/> <sub>q</sub> <s'):
+        print(problem)
+    # NOTE Numbered lines, so they are all distinct
+    text = "<speak>\n" + "".join(f"{index}. {sample}" for index in range(2000)) + "</speak>"
+    print(f"Cold validation of {len(text) / 1024:.0f} kB: {timeit.timeit(lambda: SSMLValidator().validate(text), number=1) * 1000:.1f} ms")
+    validator.validate(text)
+    start = text.index("world")
+    edited = text[:start] + "word" + text[start + 5:]
+    print(f"Validation after an edit: {timeit.timeit(lambda: validator.edit(edited, start, 5, 4), number=1) * 1000:.2f} ms")
@@ -0,0 +1,106 @@
+"""char_count.py
+
+Billable character count of a document, updated incrementally as lines change.
+"""
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+import logging
+
+
+class CharacterCounter:
+    """
+    Counts the characters a backend bills for the text, i.e. after the markup has been converted,
+    line by line (Speech Markdown never spans lines).
+
+    After an edit only the changed lines are measured again, the total is updated by the difference of the changed
+    lines, so a keystroke never measures the whole text. The counts of recently measured lines are kept by their
+    text (least recently used first out), so undo, pasting a line again or a merged burst of edits does not measure
+    them again. Only rebuild() measures every line, it's meant for a change of the conversion.
+
+    Args:
+        measure (callable): measure(line) returns the billable characters of a line (defaults to len)
+    """
+    def __init__(self, measure=None):
+        self.measure = measure or len
+        self.total = 0
+        self.line_starts = array('q', [0])
+        self.counts = array('q', [0])
+        self._cache = OrderedDict()
+
+    def _measure(self, line: str) -> int:
+        count = self._cache.get(line)
+        if count is not None:
+            self._cache.move_to_end(line)
+        else:
+            try:
+                count = self.measure(line)
+            except ValueError as e:
+                # NOTE Invalid markup is reported by the validator, count the line as typed until it is fixed
+                logging.debug("%s: Counting invalid line as typed: %s", self.__class__.__name__, e)
+                count = len(line)
+            self._cache[line] = count
+            if len(self._cache) > 2 * len(self.counts) + 1024:
+                self._cache.popitem(last=False)  # NOTE Keeps the cache proportional to the document
+        return count
+
+    def rebuild(self, lines, measure=None):
+        """
+        Measure every line again, e.g. after the conversion settings have changed.
+
+        Args:
+            lines (list): Lines of the text without line breaks (see Document.lines)
+            measure (callable): New measure, if it has changed
+        """
+        if measure is not None:
+            self.measure = measure
+        self._cache = OrderedDict()
+        self.counts = array('q')
+        self.line_starts = array('q')
+        position = 0
+        for line in lines:
+            self.line_starts.append(position)
+            self.counts.append(self._measure(line))
+            position += len(line) + 1
+        if not self.counts:
+            self.line_starts.append(0)
+            self.counts.append(0)
+        self.total = sum(self.counts)
+
+    def edit(self, text: str, start: int, removed: int, inserted: int, offset: int = 0):
+        """
+        Update the count after text[start:start + inserted] replaced removed characters of the previous text.
+
+        Args:
+            offset (int): Offset of text in the new text, if text is only the part which contains the edited lines
+                          (see Document.lines)
+        """
+        delta = inserted - removed
+        first = bisect_right(self.line_starts, start) - 1
+        last = bisect_right(self.line_starts, start + removed) - 1
+        region_start = self.line_starts[first]
+        line_end = text.find("\n", start + inserted - offset)
+        region_end = len(text) if line_end < 0 else line_end
+        lines = text[region_start - offset:region_end].split("\n")
+        starts = array('q')
+        position = region_start
+        for line in lines:
+            starts.append(position)
+            position += len(line) + 1
+        counts = array('q', [self._measure(line) for line in lines])
+        self.total += sum(counts) - sum(self.counts[first:last + 1])
+        self.counts[first:last + 1] = counts
+        self.line_starts[first:] = starts + array('q', (position + delta for position in self.line_starts[last + 1:]))
+
+if __name__ == '__main__':
+    import timeit
+
+    measure = lambda line: len(line.replace("[500ms]", '<break time="500ms"/>'))
+    counter = CharacterCounter(measure)
+    text = "".join(f"Line {index} with a pause [500ms] in it.\n" for index in range(200000))
+    counter.rebuild(text.split("\n"))
+    middle = text.index("\n", len(text) // 2) + 1
+    edited = text[:middle] + "x" + text[middle:]
+    print(f"Keystroke in {len(text) / 1024 / 1024:.1f} MB: "
+          f"{timeit.timeit(lambda: counter.edit(edited, middle, 0, 1), number=1) * 1000:.2f} ms, "
+          f"full count: {timeit.timeit(lambda: sum(measure(line) for line in text.split(chr(10))), number=1) * 1000:.0f} ms")
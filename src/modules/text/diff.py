@@ -0,0 +1,41 @@
+"""diff.py
+
+Locates the edited region between two versions of a text.
+"""
+
+
+def _common_prefix(old: str, new: str) -> int:
+    # NOTE Binary search on slice comparisons, which run in C, instead of comparing character by character in Python
+    low, high = 0, min(len(old), len(new))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if old[low:middle] == new[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _common_suffix(old: str, new: str, limit: int) -> int:
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if old[len(old) - middle:len(old) - low] == new[len(new) - middle:len(new) - low]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def edit_range(old: str, new: str):
+    """
+    Return the single edit which turns old into new.
+
+    Returns:
+        tuple: (start, removed, inserted), i.e. old[start:start + removed] was replaced by new[start:start + inserted]
+    """
+    if old is new or old == new:
+        return len(old), 0, 0
+    start = _common_prefix(old, new)
+    suffix = _common_suffix(old, new, min(len(old), len(new)) - start)
+    return start, len(old) - start - suffix, len(new) - start - suffix
@@ -0,0 +1,142 @@
+"""loader.py
+
+Loads text files in the background, detecting the encoding and decoding them chunk by chunk.
+"""
+import codecs
+import logging
+import os
+import threading
+
+# NOTE Longest BOMs first, the UTF-32 LE BOM starts with the UTF-16 LE BOM.
+# These codecs consume the BOM when decoding and write it again when the file is saved
+BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16")
+]
+FALLBACK_ENCODING = "cp1252"  # NOTE Decodes (almost) every byte, so legacy Western European files still load
+
+
+def detect_encoding(sample: bytes):
+    """
+    Detect the encoding from the BOM or, without one, from a sample of the file.
+
+    Returns:
+        str: Name of the codec
+    """
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return encoding
+    if b"\x00" in sample:
+        # NOTE UTF-16 without BOM: mostly ASCII text has every other byte zero
+        even = sample[0::2].count(0)
+        odd = sample[1::2].count(0)
+        if odd > len(sample) // 4 and odd > 4 * even:
+            return "utf-16-le"
+        if even > len(sample) // 4 and even > 4 * odd:
+            return "utf-16-be"
+    try:
+        # NOTE Not final, the sample may end within a multi-byte character
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return FALLBACK_ENCODING
+
+
+class TextLoader:
+    """
+    Reads and decodes a text file on a worker thread, handing the text over in chunks as it is decoded.
+    The first chunk is small, so the beginning of a large file can be shown right away.
+    Line breaks are normalized to "\\n" (also across chunks), undecodable bytes are replaced.
+
+    Args:
+        path (str): Path of the text file
+        on_chunk (callable): on_chunk(text), called from the worker thread for every decoded chunk, in order
+        on_done (callable): on_done(encoding, error), called from the worker thread (error is None on success)
+        first_chunk_size (int): Bytes decoded for the first chunk
+        chunk_size (int): Bytes decoded for every following chunk
+    """
+    sample_size = 65536
+
+    def __init__(self, path: str, on_chunk, on_done=None, first_chunk_size: int = 16384, chunk_size: int = 1048576):
+        self.path = path
+        self.on_chunk = on_chunk
+        self.on_done = on_done
+        self.first_chunk_size = first_chunk_size
+        self.chunk_size = chunk_size
+        self.encoding = None
+        self._cancelled = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name="text-loader")
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        """Stop loading, no further callbacks are made."""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def _run(self):
+        error = None
+        try:
+            with open(self.path, "rb") as file:
+                sample = file.read(self.sample_size)
+                self.encoding = detect_encoding(sample)
+                file.seek(0)
+                decoder = codecs.getincrementaldecoder(self.encoding)(errors="replace")
+                pending_cr = ""
+                size = self.first_chunk_size
+                while not self.cancelled:
+                    data = file.read(size)
+                    size = self.chunk_size
+                    text = pending_cr + decoder.decode(data, final=not data)
+                    # NOTE A "\r" at the end might be the first half of a "\r\n" in the next chunk
+                    pending_cr = "\r" if data and text.endswith("\r") else ""
+                    if pending_cr:
+                        text = text[:-1]
+                    text = text.replace("\r\n", "\n").replace("\r", "\n")
+                    if text and not self.cancelled:
+                        self.on_chunk(text)
+                    if not data:
+                        break
+        except OSError as e:
+            error = f"{type(e).__name__}: {e}"
+            logging.error("%s: Could not load %s: %s", self.__class__.__name__, self.path, error)
+        if self.on_done is not None and not self.cancelled:
+            self.on_done(self.encoding, error)
+
+
+if __name__ == '__main__':
+    import tempfile
+    import time
+
+    for encoding in ["utf-8", "utf-8-sig", "utf-16", "cp1252"]:
+        with tempfile.NamedTemporaryFile("w", encoding=encoding, newline="\r\n", suffix=".txt", delete=False) as file:
+            file.write("Grüße aus Köln, á é í ó ú.\n" * 3)
+        chunks = []
+        done = threading.Event()
+        TextLoader(file.name, chunks.append, lambda encoding, error: done.set(), first_chunk_size=7, chunk_size=5).start()
+        done.wait()
+        with open(file.name, "rb") as raw:
+            print(f"{encoding}: detected {detect_encoding(raw.read())}, {''.join(chunks)[:27]!r}")
+        os.remove(file.name)
+
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", suffix=".txt", delete=False) as file:
+        for index in range(400000):
+            file.write(f"Zeile {index}: Grüße aus Köln.\n")
+    first = []
+    done = threading.Event()
+    start = time.perf_counter()
+    loader = TextLoader(file.name, lambda text: first or first.append(time.perf_counter() - start),
+                        lambda encoding, error: done.set()).start()
+    done.wait()
+    print(f"Loading {os.path.getsize(file.name) / 1024 / 1024:.1f} MB: first chunk after {first[0] * 1000:.2f} ms, "
+          f"done after {(time.perf_counter() - start) * 1000:.0f} ms")
+    os.remove(file.name)
@@ -0,0 +1,200 @@
+"""segmenter.py
+
+Sentence segmentation with an incrementally updated character offset index.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+import re
+
+from modules.text.diff import edit_range
+
+# NOTE Compared in lower case without the trailing period
+DEFAULT_ABBREVIATIONS = frozenset([
+    # English
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "etc", "e.g", "i.e", "cf", "approx", "no", "fig",
+    "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec", "inc", "ltd", "co",
+    # German
+    "z.b", "d.h", "u.a", "usw", "bzw", "ca", "nr", "str", "hr", "fr", "vgl", "evtl", "ggf", "inkl", "bzgl", "s"
+])
+
+
+class SentenceSegmenter:
+    """
+    Finds sentence boundaries in a single regex scan.
+
+    A sentence ends at terminal punctuation (optionally followed by closing quotes or brackets) which is followed
+    by whitespace, or at a line break. Periods after abbreviations, initials and ordinals ("1. Mai") and periods
+    followed by a lower case word do not end a sentence. SSML tags and Speech Markdown brackets are skipped,
+    so punctuation inside them (e.g. <break time="0.5s"/> or [0.5s]) never ends a sentence.
+
+    Args:
+        abbreviations (iterable): Abbreviations in lower case without the trailing period (defaults to DEFAULT_ABBREVIATIONS)
+    """
+    _boundary_pattern = re.compile(r"""
+        (?P<skip><[^<>\n]*>|\[[^\[\]\n]*\])
+        |(?P<end>[.!?…]+["'”’»)]*)(?=\s|$)
+        |(?P<newline>\n)
+    """, re.VERBOSE)
+    _word_before_pattern = re.compile(r'[\w.]+\Z')
+    _next_word_pattern = re.compile(r'\s*(\S)')
+
+    def __init__(self, abbreviations=None):
+        self.abbreviations = frozenset(DEFAULT_ABBREVIATIONS if abbreviations is None else abbreviations)
+
+    def _is_boundary(self, text: str, match) -> bool:
+        terminator = match.group("end")
+        if not terminator.startswith(".") or terminator.startswith(".."):
+            return True
+        next_word = self._next_word_pattern.match(text, match.end())
+        if next_word is not None and (next_word.group(1).islower() or next_word.group(1).isdigit()):
+            return False
+        word = self._word_before_pattern.search(text, max(match.start() - 32, 0), match.start())
+        if word is None:
+            return True
+        word = word.group().lower()
+        if len(word) == 1 and word.isalpha():
+            return False  # NOTE Initial, e.g. "J. Smith"
+        if len(word) <= 2 and word.isdigit():
+            return False  # NOTE Ordinal, e.g. "1. Mai" (years like "2024." still end a sentence)
+        return word not in self.abbreviations
+
+    def boundaries(self, text: str, start: int = 0, end: int = None):
+        """Yield the end offsets of the sentences in text[start:end]."""
+        end = len(text) if end is None else end
+        # NOTE No endpos, so lookaheads and tags see the text after the region
+        for match in self._boundary_pattern.finditer(text, start):
+            if match.end() > end:
+                break
+            if match.lastgroup == "skip":
+                continue
+            if match.lastgroup == "newline" or self._is_boundary(text, match):
+                yield match.end()
+
+    def split(self, text: str, start: int = 0, end: int = None):
+        """
+        Split text[start:end] into sentences.
+
+        Returns:
+            list: (start, end) character offsets of every sentence, surrounding whitespace and whitespace-only spans are skipped
+        """
+        end = len(text) if end is None else end
+        spans = []
+        position = start
+        for boundary in list(self.boundaries(text, start, end)) + [end]:
+            sentence_start = position
+            while sentence_start < boundary and text[sentence_start].isspace():
+                sentence_start += 1
+            sentence_end = boundary
+            while sentence_end > sentence_start and text[sentence_end - 1].isspace():
+                sentence_end -= 1
+            if sentence_end > sentence_start:
+                spans.append((sentence_start, sentence_end))
+            position = boundary
+        return spans
+
+
+class SentenceIndex:
+    """
+    Sentence offsets of a document in two compact arrays, updated incrementally on edits.
+
+    Only the lines touched by an edit are segmented again, looking up the sentence at an offset is a bisect.
+
+    Args:
+        segmenter (SentenceSegmenter): Segmenter to use (defaults to a SentenceSegmenter with the default abbreviations)
+    """
+    def __init__(self, segmenter: SentenceSegmenter = None):
+        self.segmenter = segmenter or SentenceSegmenter()
+        self.text = ""
+        self.starts = array('q')
+        self.ends = array('q')
+
+    def __len__(self):
+        return len(self.starts)
+
+    def set_text(self, text: str):
+        """Update the index to the new text, only the edited region (found by diffing) is segmented again."""
+        if self.text is None:
+            self.rebuild(text)
+            return
+        start, removed, inserted = edit_range(self.text, text)
+        if removed or inserted:
+            self.edit(text, start, removed, inserted)
+
+    def rebuild(self, text: str):
+        self.text = text
+        spans = self.segmenter.split(text)
+        self.starts = array('q', (start for start, _ in spans))
+        self.ends = array('q', (end for _, end in spans))
+
+    def edit(self, text: str, start: int, removed: int, inserted: int, offset: int = None):
+        """
+        Update the index after text[start:start + inserted] replaced removed characters of the previous text.
+
+        Args:
+            offset (int): If given, text is only the part of the new text from this offset on, which has to
+                          contain the edited lines including the line break behind them (see Document.lines)
+        """
+        if offset is None:
+            if not self.starts:
+                self.rebuild(text)
+                return
+            self.text = text
+            offset = 0
+        else:
+            self.text = None  # NOTE Only a region is known, set_text segments everything again
+        delta = inserted - removed
+        # NOTE Tags and brackets never span lines and line breaks always end a sentence,
+        # so segmenting the edited lines again is enough (an edit may change how a tag is matched anywhere in its line)
+        region_start = text.rfind("\n", 0, start - offset) + 1
+        line_end = text.find("\n", start + inserted - offset)
+        region_end = len(text) if line_end < 0 else line_end + 1
+        low = bisect_left(self.starts, offset + region_start)
+        high = bisect_left(self.starts, offset + region_end - delta)
+        spans = self.segmenter.split(text, region_start, region_end)
+        self.starts[low:] = array('q', [offset + span[0] for span in spans]) + array('q', (position + delta for position in self.starts[high:]))
+        self.ends[low:] = array('q', [offset + span[1] for span in spans]) + array('q', (position + delta for position in self.ends[high:]))
+
+    def spans(self):
+        return list(zip(self.starts, self.ends))
+
+    def sentence_at(self, offset: int):
+        """
+        Returns:
+            int: Index of the sentence containing the offset, or of the next sentence if the offset is between two
+                 sentences (None after the last sentence)
+        """
+        index = bisect_right(self.ends, offset)
+        if index > 0 and self.ends[index - 1] == offset and self.starts[index - 1] < offset:
+            index -= 1  # NOTE The end of a sentence still belongs to it (e.g. cursor behind the period)
+        return index if index < len(self.starts) else None
+
+    def span(self, index: int):
+        return self.starts[index], self.ends[index]
+
+    def next_start(self, offset: int):
+        """Return the start of the first sentence after the offset, or None."""
+        index = bisect_right(self.starts, offset)
+        return self.starts[index] if index < len(self.starts) else None
+
+    def previous_start(self, offset: int):
+        """Return the start of the last sentence before the offset, or None."""
+        index = bisect_left(self.starts, offset)
+        return self.starts[index - 1] if index > 0 else None
+
+
+if __name__ == '__main__':
+    import timeit
+
+    segmenter = SentenceSegmenter()
+    sample = ('Dr. Smith met J. R. Doe at 3 p.m. on the 1. Mai, e.g. in the U.S. office! "Really?" he asked. '
+              'Pause <break time="0.5s"/> here [0.5s] and (read. this)[rate:"slow"] too.\nNext line without period\n')
+    for start, end in segmenter.split(sample):
+        print(repr(sample[start:end]))
+    text = "".join(f"{index}. {sample}" for index in range(1024 * 1024 // len(sample)))
+    print(f"Segmenting {len(text) / 1024 / 1024:.2f} MB: {timeit.timeit(lambda: segmenter.split(text), number=1) * 1000:.1f} ms")
+    index = SentenceIndex(segmenter)
+    index.rebuild(text)
+    middle = len(text) // 2
+    edited = text[:middle] + "New sentence. " + text[middle:]
+    print(f"Incremental update after an edit: {timeit.timeit(lambda: SentenceIndex.edit(index, edited, middle, 0, 14), number=1) * 1000:.2f} ms")
+    print(f"Lookup: {timeit.timeit(lambda: index.sentence_at(middle), number=10000) / 10000 * 1e6:.2f} us, {len(index)} sentences")
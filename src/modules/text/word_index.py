@@ -0,0 +1,140 @@
+"""word_index.py
+
+Per-line word boundaries of a document, updated incrementally as lines change.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+import re
+
+from modules.text.diff import edit_range
+
+
+class WordIndex:
+    """
+    Word boundaries for every line (words are runs of non-whitespace characters), relative to the line start.
+
+    After an edit only the changed lines are lexed again (lines with known text are reused from a cache),
+    the line offsets after the edit are shifted. All lookups are bisects.
+    """
+    _word_pattern = re.compile(r'\S+')
+
+    def __init__(self):
+        self.text = ""
+        self.line_starts = array('q', [0])
+        self.lines = [self._lex("")]
+        self._cache = {}
+
+    def _lex(self, line: str):
+        starts, ends = array('q'), array('q')
+        for match in self._word_pattern.finditer(line):
+            starts.append(match.start())
+            ends.append(match.end())
+        return len(line), starts, ends
+
+    def _lex_cached(self, line: str):
+        lexed = self._cache.get(line)
+        if lexed is None:
+            lexed = self._cache[line] = self._lex(line)
+        return lexed
+
+    def set_text(self, text: str):
+        """Update the index to the new text, only the edited lines (found by diffing) are lexed again."""
+        if self.text is None:
+            self.text = ""
+            self.line_starts = array('q', [0])
+            self.lines = [self._lex("")]
+        start, removed, inserted = edit_range(self.text, text)
+        if removed or inserted:
+            self.edit(text, start, removed, inserted)
+
+    def edit(self, text: str, start: int, removed: int, inserted: int, offset: int = None):
+        """
+        Update the index after text[start:start + inserted] replaced removed characters of the previous text.
+
+        Args:
+            offset (int): If given, text is only the part of the new text from this offset on, which has to
+                          contain the edited lines (see Document.lines)
+        """
+        self.text = text if offset is None else None  # NOTE Only a region is known, set_text lexes everything again
+        offset = offset or 0
+        delta = inserted - removed
+        first = bisect_right(self.line_starts, start) - 1
+        last = bisect_right(self.line_starts, start + removed) - 1
+        region_start = self.line_starts[first]
+        line_end = text.find("\n", start + inserted - offset)
+        region_end = len(text) if line_end < 0 else line_end
+        if len(self._cache) > 4 * len(self.lines) + 1024:
+            self._cache = {}  # NOTE Keeps the cache proportional to the document
+        lines = text[region_start - offset:region_end].split("\n")
+        starts = array('q')
+        position = region_start
+        for line in lines:
+            starts.append(position)
+            position += len(line) + 1
+        self.lines[first:last + 1] = [self._lex_cached(line) for line in lines]
+        self.line_starts[first:] = starts + array('q', (position + delta for position in self.line_starts[last + 1:]))
+
+    def line_at(self, offset: int) -> int:
+        return bisect_right(self.line_starts, offset) - 1
+
+    def line_span(self, line: int):
+        """Return the (start, end) offsets of the line without the line break."""
+        return self.line_starts[line], self.line_starts[line] + self.lines[line][0]
+
+    def word_end(self, offset: int) -> int:
+        """Return the end of the word at or after the offset in the same line (the line end if there is none)."""
+        line = self.line_at(offset)
+        line_start = self.line_starts[line]
+        length, _, ends = self.lines[line]
+        index = bisect_left(ends, offset - line_start)
+        return line_start + (ends[index] if index < len(ends) else length)
+
+    def next_word_start(self, offset: int):
+        """Return the start of the first word after the offset, or None."""
+        line = self.line_at(offset)
+        column = offset - self.line_starts[line]
+        while line < len(self.lines):
+            starts = self.lines[line][1]
+            index = bisect_right(starts, column)
+            if index < len(starts):
+                return self.line_starts[line] + starts[index]
+            line += 1
+            column = -1
+        return None
+
+    def previous_word_start(self, offset: int):
+        """Return the start of the last word before the offset, or None."""
+        line = self.line_at(offset)
+        column = offset - self.line_starts[line]
+        while line >= 0:
+            starts = self.lines[line][1]
+            index = bisect_left(starts, column)
+            if index > 0:
+                return self.line_starts[line] + starts[index - 1]
+            line -= 1
+            column = self.lines[line][0] + 1 if line >= 0 else 0
+        return None
+
+    def next_line_start(self, offset: int):
+        line = self.line_at(offset) + 1
+        return self.line_starts[line] if line < len(self.line_starts) else None
+
+    def previous_line_start(self, offset: int):
+        """Return the start of the line, or of the previous line if the offset already is at a line start."""
+        line = self.line_at(offset)
+        if offset > self.line_starts[line]:
+            return self.line_starts[line]
+        return self.line_starts[line - 1] if line > 0 else None
+
+
+if __name__ == '__main__':
+    import timeit
+
+    words = WordIndex()
+    text = "".join(f"Line {index} with a few words to jump across.\n" for index in range(20000))
+    print(f"Indexing {len(text) / 1024:.0f} kB: {timeit.timeit(lambda: WordIndex().set_text(text), number=1) * 1000:.1f} ms")
+    words.set_text(text)
+    middle = len(text) // 2
+    edited = text[:middle] + "typed " + text[middle:]
+    print(f"Update after typing: {timeit.timeit(lambda: words.set_text(edited), number=1) * 1000:.2f} ms")
+    print(f"Snapping: {timeit.timeit(lambda: words.word_end(middle), number=10000) / 10000 * 1e6:.2f} us")
@@ -0,0 +1,35 @@
+"""files.py
+
+File helpers shared by the editor and the settings.
+"""
+import os
+import shutil
+
+
+def write_atomic(path: str, chunks, encoding: str = "utf-8", newline: str = ""):
+    """
+    Write the chunks to a temporary file next to the path and rename it over the path once it is complete,
+    so the file is never left half written. The file keeps the permissions of the file it replaces, the temporary
+    file is removed if writing fails.
+
+    Args:
+        path (str): Target path
+        chunks (iterable): Text chunks to write
+        encoding (str): Encoding of the file
+        newline (str): Line break translation as for open() (the default writes the text unchanged)
+    """
+    tmp_path = path + ".part"
+    try:
+        with open(tmp_path, "w", encoding=encoding, newline=newline) as file:
+            file.writelines(chunks)
+            file.flush()
+            os.fsync(file.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -15,8 +15,19 @@ from kivy.uix.popup import Popup
 # stdlib
 import os
 import sys
+import threading
 # Custom
 from modules.dialog.exitdialog import ExitDialog
+from modules.dialog.recoverydialog import RecoveryDialog
+from modules.audio.waveform import WaveformView # NOTE Registers the widget for main_screen.kv
+from modules.audio.export import EXPORT_FORMATS
+from modules.ssml.validator import SSMLValidator, ERROR
+from modules.text.segmenter import SentenceIndex
+from modules.text.word_index import WordIndex
+from modules.text.char_count import CharacterCounter
+from modules.text.loader import TextLoader
+from modules.editor.autosave import Autosave
+from modules.util.files import write_atomic
 
 
 class MainScreen(MDScreen):
@@ -28,9 +39,18 @@ class MainScreen(MDScreen):
     menu_options = {
         "Settings": "settings",
         "About": "about",
+        "Playback metrics": None,  # NOTE Toggles the debug overlay and doesn't have an associated screen
         "Exit": None  # NOTE Exit just closes the app and doesn't have an associated screen
     }
     supported_text_files = ["txt", "md", "rst"]
+    # NOTE Step width of the cursor buttons -> icon of the mode button (cycled by the mode button)
+    cursor_modes = {
+        "character": "alpha-c-box-outline",
+        "word": "alpha-w-box-outline",
+        "sentence": "alpha-s-box-outline",
+        "line": "alpha-l-box-outline"
+    }
+    cursor_mode = StringProperty("character")
 
 
     def __init__(self, title: str, **kwargs):
@@ -43,6 +63,8 @@ class MainScreen(MDScreen):
         self.title = title
         self.last_path = None
         self.opened_file = None
+        self.text_loader = None
+        self.text_encoding = "utf-8"  # NOTE Files are saved in the encoding they were loaded with
         # FIXME This is used to keep track of the file manager state (open or closed) but is not currently used
         self.manager_open = False
         self.file_manager = MDFileManager(
@@ -56,9 +78,48 @@ class MainScreen(MDScreen):
         self.cnt_button = 0
         self.old_cnt_button = 0
         self.old_cursor_index = self.ids.text_main.cursor_index()
+        self.metrics_event = None
+        self.ssml_validator = SSMLValidator()
+        self.sentences = SentenceIndex(App.get_running_app().api.segmenter)
+        self.words = WordIndex()
+        self.characters = CharacterCounter(App.get_running_app().api.measure_segment)
+        self.character_quota = None  # NOTE (used, limit) characters of the subscription, queried in the background
+        self.synthesizing = False  # NOTE Whether a render is running in the background
+        self.pending_edit = None  # NOTE (start, old end, new end) of the edits not yet applied to the indexes
+        # NOTE Bursts of typing are indexed and validated once
+        self.text_changed_trigger = Clock.create_trigger(lambda dt: self.on_text_changed(), 0.1)
+        self.ids.text_main.document.bind(on_change=self.on_document_change)
+        global_settings = App.get_running_app().global_settings
+        self.autosave = Autosave(self.ids.text_main.document, os.path.join(global_settings.get_tmp_dir(), "autosave"),
+                                 delay=global_settings.get_setting("Editor", "autosave_delay", default=2.0))
+        recovery = self.autosave.recover()
+        if recovery is not None:
+            # NOTE Nothing is restored without asking, the autosave may be older than what the user expects
+            Clock.schedule_once(lambda dt: RecoveryDialog(recovery, on_restore=self.restore_autosave,
+                                                          on_discard=self.autosave.discard).open())
         Clock.schedule_once(self.set_focus, 0.1)
         self.load_current_voice()
         App.get_running_app().api.settings.bind(voice_text=self.update_current_voice)
+        App.get_running_app().api.bind(peaks=self.ids.waveform.setter('pyramid'),
+                                       text_filters_revision=self.on_text_filters)
+        App.get_running_app().api.load_peaks()
+        self.update_character_quota()
+
+    def restore_autosave(self, recovery):
+        """Show the recovered text as the file it was edited from, so saving writes it back there."""
+        if self.text_loader is not None:
+            self.text_loader.cancel()
+            self.text_loader = None
+        self.ids.text_main.text = recovery.text
+        self.ids.text_main.history.clear()
+        if recovery.path is not None:
+            self.opened_file = os.path.basename(recovery.path)
+            self.last_path = os.path.dirname(recovery.path)
+        self.text_encoding = recovery.encoding
+        self.autosave.set_source(recovery.path, recovery.encoding)
+        self.ids.label_status.text = "Restored the autosaved text"
+        log.info("%s: Restored %d characters of %s from the autosave", self.__class__.__name__, len(recovery.text),
+                 recovery.path or "a new text")
 
     def load_current_voice(self): 
         app_instance = App.get_running_app()
@@ -86,6 +147,10 @@ class MainScreen(MDScreen):
             log.error("%s: Invalid menu option: %s",
                       self.__class__.__name__, text_item)
             return
+        if text_item == "Playback metrics":
+            self.toggle_metrics_overlay()
+            self.drop_menu.dismiss()
+            return
         if text_item == "Exit":
             ExitDialog().open()
         self.manager.current = self.menu_options[text_item]
@@ -147,20 +212,85 @@ class MainScreen(MDScreen):
             self.opened_file = None
             self.ids.text_main.text = ""
             return
-        # FIXME This is not handling file encoding properly and will cause issues with non-ASCII characters (e.g. mutated vowels such as á, é, í, ó, ú, etc.)
-        with open(os.path.abspath(file), 'r') as file:
-            text = file.read()
-            log.info("%s: Loaded file: %s", self.__class__.__name__, file)
-            log.debug("%s: Text: %s...", self.__class__.__name__, text[0:40])
-            self.ids.text_main.text = text
+        if self.text_loader is not None:
+            self.text_loader.cancel()
+        self.ids.text_main.text = ""
+        # NOTE The chunks are appended on the main thread, the first one shows the beginning of the file right away
+        document = self.ids.text_main.document
+        loader = TextLoader(os.path.abspath(file),
+                            on_chunk=lambda text: Clock.schedule_once(lambda dt: loader.cancelled or document.insert(len(document), text)),
+                            on_done=lambda encoding, error: Clock.schedule_once(lambda dt: loader.cancelled or self.on_textfile_loaded(file, encoding, error)))
+        self.text_loader = loader.start()
+
+    def on_textfile_loaded(self, file: str, encoding: str, error: str):
+        self.text_loader = None
+        if error is not None:
+            self.ids.label_status.text = f"Could not load {os.path.basename(file)}: {error}"
+            return
+        self.text_encoding = encoding
+        self.ids.text_main.history.clear()  # NOTE Undo doesn't go back into the previous file
+        self.autosave.set_source(os.path.abspath(file), encoding)
+        log.info("%s: Loaded file: %s (%s)", self.__class__.__name__, file, encoding)
 
     def save_textfile(self, file: str):
         if file is None:
             log.error("%s: No file selected to save.", self.__class__.__name__)
             return
-        with open(os.path.abspath(file), 'w') as file:
-            file.write(self.ids.text_main.text)
-            log.info("%s: Saved file: %s", self.__class__.__name__, file)
+        document = self.ids.text_main.document
+        try:
+            for chunk in document.chunks():
+                chunk.encode(self.text_encoding)
+        except UnicodeEncodeError:
+            log.warning("%s: Text can't be saved as %s, saving as utf-8", self.__class__.__name__, self.text_encoding)
+            self.text_encoding = "utf-8"
+        # NOTE Written piece by piece (the text is never joined) to a temporary file, which replaces the file once complete
+        try:
+            write_atomic(os.path.abspath(file), document.chunks(), encoding=self.text_encoding, newline=None)
+        except OSError as e:
+            log.error("%s: Could not save %s: %s", self.__class__.__name__, file, e)
+            self.ids.label_status.text = f"Could not save {os.path.basename(file)}: {e}"
+            return
+        log.info("%s: Saved file: %s", self.__class__.__name__, file)
+        self.autosave.discard()
+
+    def on_export(self):
+        menu_items = [
+            {
+                "text": extension.upper(),
+                "on_release": lambda x=extension: self.export_render(x),
+            } for extension in EXPORT_FORMATS.keys()
+        ]
+        self.export_menu = MDDropdownMenu(
+            caller=self.ids.btn_export, items=menu_items
+        )
+        self.export_menu.open()
+
+    def export_render(self, extension: str):
+        self.export_menu.dismiss()
+        api = App.get_running_app().api
+        if not api:
+            log.error("%s: API not available.", self.__class__.__name__)
+            return
+        # NOTE The render is exported next to the opened text file, using the same base name
+        directory = self.last_path if self.last_path is not None else os.path.expanduser("~")
+        base_name = os.path.splitext(self.opened_file)[0] if self.opened_file else "speech-jokey"
+        target = os.path.join(directory, f"{base_name}.{extension}")
+        try:
+            api.save(target, on_progress=self.on_export_progress, on_done=self.on_export_done)
+            self.ids.label_status.text = f"Exporting to {target}..."
+        except Exception as e:
+            msg = "Error during export"
+            log.error("%s: %s: %s", self.__class__.__name__, msg, e)
+            self.ids.label_status.text = msg
+
+    def on_export_progress(self, fraction: float):
+        self.ids.label_status.text = f"Exporting... {fraction:.0%}"
+
+    def on_export_done(self, target: str, error: str):
+        if error is None:
+            self.ids.label_status.text = f"Exported to {target}"
+        else:
+            self.ids.label_status.text = "Error during export"
 
     def on_select_voice(self):
         api = App.get_running_app().api
@@ -205,8 +335,14 @@ class MainScreen(MDScreen):
         # TODO Implement audio playback (this is mostly a placeholder without a backend implementation yet)
         api = App.get_running_app().api
         if api:
+            text_main = self.ids.text_main
+            cursor_index = text_main.cursor_index()
+            self.update_indexes()
+            # NOTE With the cursor at the very end (e.g. right after typing), the whole render is replayed
+            sentence = self.sentences.sentence_at(cursor_index) if cursor_index < len(text_main.document) else None
+            char_offset = self.sentences.span(sentence)[0] if sentence is not None else 0
             try:
-                api.play()
+                api.play(char_offset=char_offset)
             except NotImplementedError:
                 log.error(
                     "%s: Audio playback not implemented for this API.", self.__class__.__name__)
@@ -214,28 +350,169 @@ class MainScreen(MDScreen):
                 log.error("%s: Error during playback: %s",
                           self.__class__.__name__, e)
 
+    def on_pause(self):
+        api = App.get_running_app().api
+        if api:
+            if api.is_paused():
+                api.resume()
+            else:
+                api.pause()
+
+    def on_stop(self):
+        api = App.get_running_app().api
+        if api:
+            api.stop()
+
+    def toggle_metrics_overlay(self):
+        if self.metrics_event is None:
+            self.ids.label_metrics.opacity = 1
+            self.update_metrics_overlay(0)
+            self.metrics_event = Clock.schedule_interval(self.update_metrics_overlay, 0.5)
+        else:
+            self.metrics_event.cancel()
+            self.metrics_event = None
+            self.ids.label_metrics.opacity = 0
+
+    def update_metrics_overlay(self, dt):
+        api = App.get_running_app().api
+        if not api:
+            return
+        metrics = api.get_playback_metrics()
+        self.ids.label_metrics.text = (
+            f"underflows: {metrics['underflows']}   starved: {metrics['starvations']}\n"
+            f"queue: {metrics['queue_frames']} frames (low {metrics['queue_low_water']})\n"
+            f"callback: p99 {metrics['callback_ms']['p99_ms']} ms, max {metrics['callback_ms']['max_ms']} ms\n"
+            f"decode: p99 {metrics['decode_ms']['p99_ms']} ms\n"
+            f"start latency: p50 {metrics['start_latency_ms']['p50_ms']} ms, max {metrics['start_latency_ms']['max_ms']} ms")
+
+    def on_document_change(self, document, start: int, removed: str, inserted: str):
+        """Merge the change into the pending edit, so the indexes are updated once for a burst of changes."""
+        end = start + len(removed)
+        if self.pending_edit is None:
+            self.pending_edit = (start, end, start + len(inserted))
+        else:
+            pending_start, old_end, new_end = self.pending_edit
+            # NOTE Text after the pending edit is unchanged, so its offsets map back to the old text by the length difference
+            self.pending_edit = (min(pending_start, start), old_end + max(end - new_end, 0),
+                                 max(new_end, end) + len(inserted) - len(removed))
+        self.text_changed_trigger()
+
+    def update_indexes(self):
+        """
+        Apply the pending edit to the sentence and word indexes, the character count and the SSML validation.
+        Only the edited lines are read from the document and processed again, the complete text is never joined for an edit.
+        """
+        if self.pending_edit is None:
+            return
+        start, old_end, new_end = self.pending_edit
+        self.pending_edit = None
+        document = self.ids.text_main.document
+        first, _ = document.position_of(start)
+        last, _ = document.position_of(new_end)
+        region = "\n".join(document.lines(first, last + 1))
+        if last + 1 < document.line_count:
+            region += "\n"  # NOTE The sentence index also segments the line break behind the edited lines
+        offset = document.offset_of(first, 0)
+        self.sentences.edit(region, start, old_end - start, new_end - start, offset=offset)
+        self.words.edit(region, start, old_end - start, new_end - start, offset=offset)
+        self.characters.edit(region, start, old_end - start, new_end - start, offset=offset)
+        self.ssml_validator.edit(region, start, old_end - start, new_end - start, offset=offset)
+        self.update_character_count()
+
+    def update_character_count(self):
+        """Show the billable characters of the text and what rendering it would cost."""
+        total = self.characters.total
+        status = f"{total:,} characters"
+        price = App.get_running_app().global_settings.get_setting("Billing", "price_per_1000_characters", default=0.0)
+        if price:
+            status += f" ≈ {total / 1000 * price:.2f}"
+        if self.character_quota is not None:
+            used, limit = self.character_quota
+            status += f" ({used + total:,} of {limit:,} after rendering)"
+        self.ids.label_characters.text = status
+
+    def on_text_filters(self, api, revision):
+        """Count every line again, the conversion (e.g. the pauses or the language) has changed."""
+        self.update_indexes()
+        self.characters.rebuild(self.ids.text_main.document.lines(), api.measure_segment)
+        self.update_character_count()
+
+    def update_character_quota(self):
+        """Query the character quota of the subscription in the background and show it once it is known."""
+        api = App.get_running_app().api
+
+        def query():
+            quota = api.character_quota()
+            Clock.schedule_once(lambda dt: self.on_character_quota(quota))
+        threading.Thread(target=query, daemon=True, name="character-quota").start()
+
+    def on_character_quota(self, quota):
+        self.character_quota = quota
+        self.update_character_count()
+
+    def on_text_changed(self):
+        """
+        Update the sentence and word indexes and validate the SSML in the editor (unchanged lines are neither
+        segmented nor checked again) and show the first problem.
+        """
+        self.update_indexes()
+        problems = self.ssml_validator.problems
+        self.ids.text_main.error = self.ssml_validator.has_errors()
+        if problems:
+            problem = next((problem for problem in problems if problem.severity == ERROR), problems[0])
+            more = f" (+{len(problems) - 1} more)" if len(problems) > 1 else ""
+            self.ids.label_status.text = f"Line {problem.line}, column {problem.column}: {problem.message}{more}"
+        elif self.ids.label_status.text.startswith("Line "):
+            self.ids.label_status.text = ""
+
     def on_synthesize(self):
         # TODO Implement text to speech synthesis (this is mostly a placeholder without a backend implementation yet)
         api = App.get_running_app().api
-        tmp_dir = App.get_running_app().global_settings.get_tmp_dir()
-        synthesized_file = os.path.join(tmp_dir, 'output_file.wav')
+        self.update_indexes()  # NOTE The validator is only updated when the debounced update ran
+        if self.ssml_validator.has_errors():
+            # NOTE The request would fail anyway, the problem is already shown in the status label
+            log.error("%s: Synthesis blocked by invalid SSML: %s", self.__class__.__name__, self.ssml_validator.problems[0].message)
+            self.on_text_changed()
+            return
+        if not api:
+            return
+        if self.synthesizing:
+            return  # NOTE One render at a time, they would request and write the same segments
+        synthesized_file = api.artifacts.new_path()
         log.info(f"Using synthesized_file={synthesized_file}")
+        text = self.ids.text_main.text
 
-        if api:
+        def synthesize():
+            # NOTE The render requests every segment from the API, so it runs in the background like the export
+            msg = None
             try:
-                # FIXME: Use constant or configurable output path
-                api.synthesize(self.ids.text_main.text, synthesized_file)
+                api.synthesize(text, synthesized_file)
             except NotImplementedError:
                 msg = "Text to speech synthesis not implemented for this API."
                 log.error("%s: %s", self.__class__.__name__, msg)
-                self.ids.label_status.text = msg
+            except ValueError as e:
+                # NOTE e.g. invalid Speech Markdown, the message contains the position
+                msg = f"Invalid input: {e}"
+                log.error("%s: %s", self.__class__.__name__, msg)
             except Exception as e:
                 msg = "Error during synthesis"
                 log.error("%s: %s: %s", self.__class__.__name__, msg, e)
-                self.ids.label_status.text = msg
+            Clock.schedule_once(lambda dt: self.on_synthesize_done(msg))
+        self.synthesizing = True
+        self.ids.label_status.text = "Synthesizing..."
+        threading.Thread(target=synthesize, daemon=True, name="synthesize").start()
+
+    def on_synthesize_done(self, error: str):
+        self.synthesizing = False
+        if error is not None:
+            self.ids.label_status.text = error
+            return
+        self.ids.label_status.text = "Synthesized"
+        self.update_character_quota()
         popup_window = CustomPopup(content_text=f"Text has been synthesized\nto an audio file",
                                    size_hint=(None, None), size=(400, 400))
         popup_window.open()
+
     def on_cursor_control(self):
         new_cursor_index = self.ids.text_main.cursor_index()
         old_cursor_index = self.old_cursor_index
@@ -243,21 +520,10 @@ class MainScreen(MDScreen):
         old_cnt_button = self.old_cnt_button
 
         if abs(cnt_button - old_cnt_button) == 0 and abs(new_cursor_index - old_cursor_index) > 1:
-            # set cursor to the end of the word
-            cursor_in_row_index = self.ids.text_main._cursor[0]
-            row = self.ids.text_main._cursor[1]
-            text_row = self.ids.text_main._lines[row]
-
-            spaces = []
-            for index in range(cursor_in_row_index, len(text_row)):
-                char = text_row[index]
-                if char == " ":
-                    spaces.append(index)
-            if spaces:
-                end_word_index = spaces[0]
-                self.ids.text_main.cursor = (end_word_index, row)
-            else:
-                self.ids.text_main.do_cursor_movement('cursor_end')
+            # set cursor to the end of the word (or the end of the line, if there is no word after the cursor)
+            text_main = self.ids.text_main
+            self.update_indexes()
+            text_main.cursor = text_main.get_cursor_from_index(self.words.word_end(new_cursor_index))
 
         self.new_cursor_index = self.ids.text_main.cursor_index()
         self.save_old_cursor_index(new_cursor_index)
@@ -270,15 +536,47 @@ class MainScreen(MDScreen):
         self.old_cnt_button = cnt_button
 
     def on_cursor_left(self):
-        self.ids.text_main.do_cursor_movement('cursor_left')
-        self.cnt_button = self.cnt_button + 1
-        Clock.schedule_once(self.set_focus, 0.1)
+        self.move_cursor(forward=False)
 
     def on_cursor_right(self):
-        self.ids.text_main.do_cursor_movement('cursor_right')
+        self.move_cursor(forward=True)
+
+    def on_undo(self):
+        self.ids.text_main.undo()
+        Clock.schedule_once(self.set_focus, 0.1)
+
+    def on_redo(self):
+        self.ids.text_main.redo()
+        Clock.schedule_once(self.set_focus, 0.1)
+
+    def on_cursor_mode(self):
+        """Cycle the step width of the cursor buttons (character, word, sentence, line)."""
+        modes = list(self.cursor_modes)
+        self.cursor_mode = modes[(modes.index(self.cursor_mode) + 1) % len(modes)]
+        Clock.schedule_once(self.set_focus, 0.1)
+
+    def move_cursor(self, forward: bool):
+        text_main = self.ids.text_main
+        if self.cursor_mode == "character":
+            text_main.do_cursor_movement('cursor_right' if forward else 'cursor_left')
+        else:
+            target = self.jump_target(text_main.cursor_index(), forward)
+            if target is None:
+                text_main.do_cursor_movement('cursor_end' if forward else 'cursor_home', control=True)
+            else:
+                text_main.cursor = text_main.get_cursor_from_index(target)
         self.cnt_button = self.cnt_button + 1
         Clock.schedule_once(self.set_focus, 0.1)
 
+    def jump_target(self, offset: int, forward: bool):
+        """Return the offset of the next or previous word, sentence or line start (None if there is none)."""
+        self.update_indexes()
+        if self.cursor_mode == "sentence":
+            return self.sentences.next_start(offset) if forward else self.sentences.previous_start(offset)
+        if self.cursor_mode == "word":
+            return self.words.next_word_start(offset) if forward else self.words.previous_word_start(offset)
+        return self.words.next_line_start(offset) if forward else self.words.previous_line_start(offset)
+
     def set_focus(self, dt):
         self.ids.text_main.focus = True
         
@@ -3,10 +3,13 @@ from kivy.app import App
 from kivy.uix.popup import Popup
 from kivy.properties import ObjectProperty, ListProperty
 from kivy.event import EventDispatcher
+from kivy.clock import Clock
 from kivy.logger import Logger as log
 # KivyMD
 from kivymd.uix.screen import MDScreen
 # stdlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import os
 import importlib
 import inspect
@@ -14,22 +17,36 @@ import json
 from pathlib import Path
 # Custom
 from api.base import BaseApiSettings
+from modules.util.files import write_atomic
 from modules.util.widget_loader import load_widget
 
 def none_settings():
     pass
 
 class GlobalSettings(EventDispatcher):
+    """
+    The settings of the app and the APIs, stored as JSON in the app directory.
+
+    Changes are saved in the background once there is a pause of save_delay seconds, so a burst of changes
+    (e.g. all settings of an API, or a batch()) writes the file once. The file is written to a temporary file
+    which replaces it, so it's never left truncated. Call flush() to save right away (e.g. when the app stops).
+    """
     _instance = None
     _settings_file_name="app_settings.json"
     _settings_file = _settings_file_name
     _default_settings = {}
     _app_dir="."
     _tmp_dir="."
+    save_delay = 0.5
+    retry_delay = 5.0  # NOTE Seconds before a failed save is tried again
 
     def __new__(cls, app_dir, tmp_dir):
         if cls._instance is None:
             cls._instance = super(GlobalSettings, cls).__new__(cls)
+            cls._instance._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="settings")
+            cls._instance._save_event = Clock.create_trigger(lambda dt: cls._instance.flush(), cls.save_delay)
+            cls._instance._batch_depth = 0
+            cls._instance._dirty = False
         return cls._instance
 
     def __init__(self, app_dir, tmp_dir):
@@ -47,9 +64,47 @@ class GlobalSettings(EventDispatcher):
 
 
     def save_settings(self):
-        with open(self._settings_file, 'w') as file:
-            json.dump(self._settings, file, indent=4)
+        """Save the settings once there is a pause in the changes (or once the outermost batch() is done)."""
+        self._dirty = True
+        if self._batch_depth == 0:
+            # NOTE Debounced: saving waits for a pause of save_delay seconds after the last change
+            self._save_event.cancel()
+            self._save_event()
+
+    @contextmanager
+    def batch(self):
+        """Change several settings, which are saved together afterwards (batches may be nested)."""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0 and self._dirty:
+                self.save_settings()
+
+    def flush(self):
+        """
+        Save the settings now, if they have changed, on the background thread.
+
+        Returns:
+            Future: Done once the file is written (None if there was nothing to save)
+        """
+        self._save_event.cancel()
+        if not self._dirty:
+            return None
+        self._dirty = False
+        # NOTE Serialized on the calling thread, so the writer never sees settings which are changed meanwhile
+        content = json.dumps(self._settings, indent=4)
+        return self._executor.submit(self._write, content)
+
+    def _write(self, content: str):
+        try:
+            write_atomic(self._settings_file, [content])
             log.info("%s: Settings saved: %s", self.__class__.__name__, self._settings_file)
+        except OSError as e:
+            log.error("%s: Could not save the settings to %s: %s", self.__class__.__name__, self._settings_file, e)
+            # NOTE Retried on the main thread, which owns the save trigger, unless a newer change saves them first
+            Clock.schedule_once(lambda dt: self.save_settings(), self.retry_delay)
     
     def load_settings(self):
         if os.path.exists(self._settings_file):
@@ -62,10 +117,9 @@ class GlobalSettings(EventDispatcher):
         log.debug("%s: Update %s: %s to '%s'.", self.__class__.__name__, api_name, key, value)
         if api_name in self._settings.keys():
             self._settings[api_name][key] = value
-            self.save_settings()
         else:
             self._settings[api_name] = {key: value}
-            self.save_settings()
+        self.save_settings()
 
     def get_setting(self, api_name, key, default=None):
         value = self._settings.get(api_name, {}).get(key, default)
@@ -74,7 +128,8 @@ class GlobalSettings(EventDispatcher):
     
     def reset(self):
         self._settings = self._default_settings.copy()
-        self.save_settings()
+        self._dirty = True
+        self.flush()
 
     def get_app_dir(self):
         """Return the app directory (base directory) of the program."""
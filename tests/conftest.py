@@ -0,0 +1,7 @@
+import os
+import sys
+
+# NOTE Kivy parses the command line on import, which would clash with the options of pytest
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,40 @@
+import os
+
+from modules.audio.artifacts import ArtifactStore
+
+
+def render(store, text, voice="Rachel"):
+    path = store.new_path()
+    with open(path + store.partial_suffix, "wb") as file:
+        file.write(b"RIFF")
+    with open(path + ".timing.json", "w") as file:
+        file.write("{}")
+    return store.add(path, text, voice, "pcm_44100", 44100, 1.5)
+
+
+def test_add_renames_the_partial_render(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    assert store.latest() is None
+    artifact = render(store, "Hello.")
+    assert os.path.exists(artifact.path) and not os.path.exists(artifact.path + store.partial_suffix)
+    assert store.latest() == artifact
+    assert artifact.format == "pcm_44100" and artifact.duration == 1.5
+
+
+def test_find_by_text_and_voice(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    first = render(store, "Hello.", "Rachel")
+    second = render(store, "Hello.", "Adam")
+    assert store.find("Hello.") == second
+    assert store.find("Hello.", "Rachel") == first
+    assert store.find("Bye.") is None
+
+
+def test_prune_keeps_the_newest_renders_and_their_sidecars(tmp_path):
+    store = ArtifactStore(str(tmp_path), keep=2)
+    artifacts = [render(store, f"Text {number}") for number in range(3)]
+    assert not os.path.exists(artifacts[0].path) and not os.path.exists(artifacts[0].path + ".timing.json")
+    assert all(os.path.exists(artifact.path) for artifact in artifacts[1:])
+    assert store.find("Text 0") is None
+    # NOTE The manifest is shared by every store on the directory
+    assert ArtifactStore(str(tmp_path)).latest() == artifacts[2]
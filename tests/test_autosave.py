@@ -0,0 +1,60 @@
+import os
+
+from modules.editor.autosave import Autosave
+from modules.editor.document import Document
+
+
+def autosave_of(document, tmp_path):
+    return Autosave(document, str(tmp_path / "autosave"), delay=0, journal_limit=64)
+
+
+def test_recover_snapshot_and_journal(tmp_path):
+    document = Document("Hello world\n")
+    autosave = autosave_of(document, tmp_path)
+    autosave.save().result()
+    document.replace(5, 0, ",")
+    document.replace(len(document), 0, "More text")
+    autosave.save().result()
+    recovery = autosave.recover()
+    assert recovery.text == document.text and recovery.path is None
+    # NOTE Past the journal limit the edits go into a new snapshot
+    document.replace(0, 0, "x" * 100)
+    autosave.flush().result()
+    assert autosave.recover().text == document.text
+
+
+def test_unchanged_file_is_not_recovered(tmp_path):
+    source = tmp_path / "source.txt"
+    source.write_bytes("Zeile eins\r\nZeile zwei, ä\r\n".encode("cp1252"))
+    document = Document("Zeile eins\nZeile zwei, ä\n")
+    autosave = autosave_of(document, tmp_path)
+    autosave.set_source(str(source), "cp1252")
+    autosave.save().result()
+    os.utime(source, (0, 0))
+    assert autosave.recover() is None
+    document.replace(0, 0, "Neu: ")
+    autosave.flush().result()
+    recovery = autosave.recover()
+    assert recovery.text == document.text and recovery.encoding == "cp1252"
+
+
+def test_newer_file_is_not_recovered(tmp_path):
+    source = tmp_path / "source.txt"
+    source.write_text("Text")
+    document = Document("Text")
+    autosave = autosave_of(document, tmp_path)
+    autosave.set_source(str(source))
+    document.replace(0, 0, "Edited ")
+    autosave.save().result()
+    saved = autosave.recover().time
+    os.utime(source, (saved + 1, saved + 1))
+    assert autosave.recover() is None
+
+
+def test_discard(tmp_path):
+    document = Document("Text")
+    autosave = autosave_of(document, tmp_path)
+    autosave.save().result()
+    autosave.discard().result()
+    assert autosave.recover() is None
+    assert autosave.flush() is not None  # NOTE Starts over with a snapshot
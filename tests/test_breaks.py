@@ -0,0 +1,36 @@
+import pytest
+
+from modules.ssml.breaks import BreakConverter
+
+
+def test_breaks_in_front_of_punctuation():
+    assert BreakConverter().convert("Hi, you. Ok?") == \
+        'Hi<break time="0.0s" />, you<break time="0.5s" />. Ok<break time="0.5s" />?'
+    assert BreakConverter({}).convert("a < b, c.") == "a < b, c."
+
+
+def test_escaping_in_the_same_pass():
+    converter = BreakConverter({".": "250ms"}, escape=True)
+    assert converter.convert("<a> & b.") == '&lt;a&gt; &amp; b<break time="250ms" />.'
+    assert BreakConverter({}, escape=True).convert("&amp;") == "&amp;amp;"  # NOTE Text, not markup
+
+
+def test_escaped_break_character():
+    converter = BreakConverter({"&": "1s"}, escape=True)
+    assert converter.convert("A & B") == 'A <break time="1s" />&amp; B'
+
+
+def test_invalid_breaks():
+    with pytest.raises(ValueError):
+        BreakConverter({"..": "1s"})
+    with pytest.raises(ValueError):
+        BreakConverter({".": "soon"})
+
+
+def test_rules_round_trip():
+    rules = ",=0.0s .=500ms"
+    breaks = BreakConverter.parse_rules(rules)
+    assert breaks == {",": "0.0s", ".": "500ms"}
+    assert BreakConverter.format_rules(breaks) == rules
+    with pytest.raises(ValueError):
+        BreakConverter.parse_rules(".0.5s")
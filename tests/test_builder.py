@@ -0,0 +1,64 @@
+import io
+
+import pytest
+
+from modules.ssml.builder import SSMLBuilder, validate_duration, validate_url
+
+
+def build():
+    builder = SSMLBuilder()
+    builder.say("Hello & welcome")
+    with builder.element("prosody", rate="slow"):
+        builder.spell_slowly("ab", "500ms")
+    builder.say_as("01/02/2024", "date", "dmy")
+    builder.pause_by_strength(" Strong ")
+    builder.sub("World Wide Web", "WWW")
+    return builder
+
+
+def test_serialization():
+    assert build().ssml() == (
+        '<speak>Hello &amp; welcome <prosody rate="slow"><say-as interpret-as="spell-out">a</say-as> '
+        '<break time="500ms"/> <say-as interpret-as="spell-out">b</say-as> <break time="500ms"/></prosody> '
+        '<say-as interpret-as="date" format="dmy">01/02/2024</say-as> <break strength="strong"/> '
+        '<sub alias="World Wide Web">WWW</sub></speak>')
+
+
+def test_running_length_matches_the_serialization():
+    builder = build()
+    assert len(builder) == len(builder.ssml(wrap=False))
+    with builder.element("emphasis", level="strong"):
+        assert len(builder) == len(builder.ssml(wrap=False))
+        builder.paragraph("Open <element>")
+    assert len(builder) == len(builder.ssml(wrap=False))
+    stream = io.StringIO()
+    assert builder.write(stream) == len(builder.ssml()) and stream.getvalue() == builder.ssml()
+
+
+def test_card_is_the_plain_text():
+    builder = SSMLBuilder()
+    builder.sentence("Fish & chips")
+    builder.pause("1s")
+    builder.say_as("5", "cardinal")
+    assert builder.card() == "Fish & chips 5"
+    builder.clear()
+    assert builder.ssml() == "<speak></speak>" and len(builder) == 0
+
+
+def test_validation():
+    builder = SSMLBuilder()
+    with pytest.raises(ValueError):
+        builder.pause("11s")
+    with pytest.raises(ValueError):
+        builder.say_as("5", "cardinal", "dmy")
+    with pytest.raises(ValueError):
+        builder.prosody({"rate": "60%"}, "fast")
+    with pytest.raises(KeyError):
+        builder.prosody({"speed": "slow"}, "fast")
+    with pytest.raises(TypeError):
+        builder.say(None)
+    assert builder.prosody({"rate": "40"}, "slow").attributes == {"rate": "40%"}
+    validate_duration("250ms")
+    validate_url("https://example.com/a.mp3")
+    with pytest.raises(ValueError):
+        validate_url("example.com/a.mp3")
@@ -0,0 +1,43 @@
+import random
+
+from modules.text.char_count import CharacterCounter
+
+
+def measure(line: str) -> int:
+    return len(line.replace("[500ms]", '<break time="500ms"/>'))
+
+
+def test_edit_matches_full_count():
+    random.seed(1)
+    counter = CharacterCounter(measure)
+    text = ""
+    for _ in range(3000):
+        start = random.randint(0, len(text))
+        removed = len(text[start:start + random.choice([0, 0, 1, random.randint(0, 30)])])
+        inserted = random.choice(["a", "\n", "word [500ms] ", "", "x\ny\n"])
+        text = text[:start] + inserted + text[start + removed:]
+        counter.edit(text, start, removed, len(inserted))
+        assert counter.total == sum(measure(line) for line in text.split("\n"))
+
+
+def test_only_changed_lines_are_measured():
+    measured = []
+    counter = CharacterCounter(lambda line: measured.append(line) or len(line))
+    text = "\n".join(f"Line {index}" for index in range(100))
+    counter.rebuild(text.split("\n"))
+    measured.clear()
+    start = text.index("Line 50")
+    text = text[:start] + "x" + text[start:]
+    counter.edit(text, start, 0, 1)
+    assert measured == ["xLine 50"]
+    assert counter.total == len(text) - text.count("\n")
+
+
+def test_invalid_lines_count_as_typed():
+    def measure(line):
+        if "(" in line:
+            raise ValueError("Invalid markup")
+        return 2 * len(line)
+    counter = CharacterCounter(measure)
+    counter.rebuild(["ab", "(c"])
+    assert counter.total == 4 + 2
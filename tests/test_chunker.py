@@ -0,0 +1,47 @@
+import random
+
+import pytest
+
+from modules.ssml.chunker import SsmlChunker
+
+WORDS = ["word", "Sentence.", "clause,", "[300ms]", "<break time=\"1s\"/>", "(slow words. More)[rate:slow]", "++loud++", "\n"]
+
+
+def random_text(paragraphs: int) -> str:
+    random.seed(6)
+    texts = [" ".join(random.choice(WORDS) for _ in range(30)) for _ in range(paragraphs)]
+    return " ".join(f'<prosody pitch="high">{text}</prosody>' if random.random() < 0.5 else text for text in texts)
+
+
+def test_sentences_and_reopened_elements():
+    text = "One. <emphasis>Two. Three.</emphasis>"
+    assert [chunk.text(text) for chunk in SsmlChunker().split(text)] == [
+        "One.", "<emphasis>Two.</emphasis>", "<emphasis>Three.</emphasis>"]
+    text = "One. (Two. Three.)[rate:slow]"
+    assert [chunk.text(text) for chunk in SsmlChunker().split(text)] == ["One.", "(Two.)[rate:slow]", "(Three.)[rate:slow]"]
+
+
+def test_long_sentence_is_split_at_a_clause():
+    text = "A long clause, which is split after the comma, and then again at a space."
+    chunks = [chunk.text(text) for chunk in SsmlChunker(max_characters=50).split(text)]
+    assert all(len(chunk) <= 50 for chunk in chunks)
+    assert chunks[0].endswith(",")
+    assert " ".join(chunks) == text
+
+
+@pytest.mark.parametrize("limit", [None, 200])
+def test_chunks_fit_and_stay_balanced(limit):
+    text = random_text(500)
+    chunks = SsmlChunker(max_characters=limit).split(text)
+    assert chunks
+    for chunk in chunks:
+        chunk_text = chunk.text(text)
+        assert limit is None or len(chunk_text) <= limit
+        assert chunk_text.count("<prosody") == chunk_text.count("</prosody>")
+        assert chunk_text.count("(") == chunk_text.count(")[")
+    assert [chunk.start for chunk in chunks] == sorted(chunk.start for chunk in chunks)
+
+
+def test_unknown_tags_are_text():
+    text = "Press <Enter>. Then go."
+    assert [chunk.text(text) for chunk in SsmlChunker().split(text)] == ["Press <Enter>.", "Then go."]
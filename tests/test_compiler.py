@@ -0,0 +1,52 @@
+from importlib import import_module
+
+import pytest
+
+compiler_module = import_module("modules.speech-markdown.compiler")
+SpeechMarkdownCompiler = compiler_module.SpeechMarkdownCompiler
+SpeechMarkdownError = compiler_module.SpeechMarkdownError
+
+
+def test_markup_is_compiled_to_ssml():
+    compiler = SpeechMarkdownCompiler()
+    assert compiler.compile('Hi, [500ms] ++really++ (now)[rate:"slow"] [break:"weak"]') == (
+        'Hi, <break time="500ms"/> <emphasis level="strong">really</emphasis> '
+        '<prosody rate="slow">now</prosody> <break strength="weak"/>')
+    assert compiler.compile('(1/2/2024)[date:"dmy"] (pecan)[/pɪˈkɑːn/]', wrap=True) == (
+        '<speak><say-as interpret-as="date" format="dmy">1/2/2024</say-as> '
+        '<phoneme alphabet="ipa" ph="pɪˈkɑːn">pecan</phoneme></speak>')
+
+
+def test_ssml_tags_pass_through_and_other_tags_are_text():
+    compiler = SpeechMarkdownCompiler()
+    assert compiler.compile('Press <Enter> & <break time="1s"/>') == 'Press &lt;Enter&gt; &amp; <break time="1s"/>'
+
+
+def test_text_filter_only_sees_text():
+    compiler = SpeechMarkdownCompiler(text_filter=str.upper)
+    assert compiler.compile("a (b)[characters] c") == 'A <say-as interpret-as="characters">b</say-as> C'
+
+
+def test_errors_report_the_position_in_the_text():
+    compiler = SpeechMarkdownCompiler()
+    with pytest.raises(SpeechMarkdownError) as error:
+        compiler.compile("First paragraph.\n\nThen (x)[foo]")
+    assert error.value.position == 18 + len("Then (x)[")
+    with pytest.raises(ValueError):
+        compiler.compile("(x)[characters;number]")
+
+
+def test_unchanged_paragraphs_come_from_the_cache():
+    compiler = SpeechMarkdownCompiler(cache_size=2)
+    text = "One ++a++.\n\nTwo.\n  \nThree."
+    ssml = compiler.compile(text)
+    assert ssml == 'One <emphasis level="strong">a</emphasis>.\n\nTwo.\n  \nThree.'
+    assert (compiler.hits, compiler.misses) == (0, 3)
+    assert compiler.compile("Two.\n\nThree!") == "Two.\n\nThree!"
+    assert (compiler.hits, compiler.misses) == (1, 4)
+    # NOTE Only the 2 most recently used paragraphs are kept
+    compiler.compile("One ++a++.")
+    assert compiler.misses == 5
+    compiler.clear()
+    compiler.compile("Two.")
+    assert compiler.misses == 6
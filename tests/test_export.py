@@ -0,0 +1,55 @@
+import queue
+import threading
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from modules.audio.export import Exporter, encode, export_format
+
+
+@pytest.fixture
+def render(tmp_path):
+    path = str(tmp_path / "render.wav")
+    sf.write(path, np.linspace(-0.5, 0.5, 22050, dtype=np.float32), 22050, subtype='FLOAT')
+    return path
+
+
+def test_export_format_by_extension():
+    assert export_format("speech.FLAC") == ("FLAC", "PCM_16")
+    with pytest.raises(ValueError):
+        export_format("speech.aiff")
+
+
+def test_encode_streams_blocks_and_reports_progress(render, tmp_path):
+    target = str(tmp_path / "speech.flac")
+    progress = queue.Queue()
+    encode(render, target, progress, blocksize=4096)
+    messages = list(progress.queue)
+    assert messages[-1] == ("done", target)
+    fractions = [value for kind, value in messages if kind == "progress"]
+    assert len(fractions) == 6 and fractions[-1] == 1.0
+    data, samplerate = sf.read(target)
+    assert samplerate == 22050 and len(data) == 22050
+
+
+def test_encode_reports_errors(tmp_path):
+    progress = queue.Queue()
+    encode(str(tmp_path / "missing.wav"), str(tmp_path / "speech.wav"), progress)
+    kind, error = progress.get_nowait()
+    assert kind == "error" and error
+    assert not (tmp_path / "speech.wav").exists()
+
+
+def test_export_in_a_background_process(render, tmp_path):
+    target = str(tmp_path / "speech.wav")
+    done = threading.Event()
+    results = []
+
+    def on_done(path, error):
+        results.append((path, error))
+        done.set()
+    Exporter().export(render, target, on_done=on_done)
+    assert done.wait(60)
+    assert results == [(target, None)]
+    assert sf.info(target).frames == 22050
@@ -0,0 +1,24 @@
+from modules.audio.formats import OutputFormat, negotiate_output_format
+
+PCM_22050 = OutputFormat("pcm_22050", "pcm", 22050)
+PCM_44100 = OutputFormat("pcm_44100", "pcm", 44100)
+MP3_44100 = OutputFormat("mp3_44100_128", "mp3", 44100)
+MP3_48000 = OutputFormat("mp3_48000_192", "mp3", 48000)
+
+
+def test_pcm_at_the_device_rate_wins():
+    assert negotiate_output_format([MP3_44100, PCM_22050, PCM_44100], 44100) is PCM_44100
+
+
+def test_codec_at_the_device_rate_before_resampling():
+    assert negotiate_output_format([PCM_22050, PCM_44100, MP3_48000], 48000) is MP3_48000
+
+
+def test_highest_pcm_rate_without_a_native_format():
+    assert negotiate_output_format([MP3_44100, PCM_22050, PCM_44100], 96000) is PCM_44100
+
+
+def test_first_format_without_pcm():
+    assert negotiate_output_format([MP3_44100, MP3_48000], 96000) is MP3_44100
+    assert negotiate_output_format([], 44100) is None
+    assert PCM_44100.is_pcm and not MP3_44100.is_pcm
@@ -0,0 +1,41 @@
+import random
+
+from modules.editor.document import Document
+from modules.editor.history import EditHistory
+
+
+def test_undo_and_redo_restore_every_version():
+    random.seed(1)
+    document = Document("".join(f"Line {index} of a document.\n" for index in range(1000)))
+    history = EditHistory(document, coalesce_delay=-1)  # NOTE Never coalesced, so every version is restored
+    versions = [document.text]
+    for _ in range(300):
+        document.replace(random.randint(0, len(document)), random.choice([0, 1, 7]), random.choice(["", "a", "word ", "x\ny"]))
+        if document.text != versions[-1]:
+            versions.append(document.text)
+    for version in reversed(versions[:-1]):
+        history.undo()
+        assert document.text == version
+    assert history.undo() is None
+    for version in versions[1:]:
+        history.redo()
+        assert document.text == version
+    assert history.redo() is None
+
+
+def test_typing_is_coalesced_until_a_line_break():
+    history = EditHistory(Document("x" * 100))
+    for offset in range(100, 400):
+        history.document.insert(offset, "a")
+    history.document.insert(400, "\n")
+    assert len(history._undo) == 2
+    history.undo()
+    history.undo()
+    assert history.document.text == "x" * 100
+
+
+def test_limit_drops_the_oldest_edits():
+    history = EditHistory(Document(), limit=1000)
+    for _ in range(400):
+        history.document.insert(0, "\n")
+    assert 0 < len(history._undo) <= 1000 // history.entry_size
@@ -0,0 +1,53 @@
+import codecs
+import threading
+
+import pytest
+
+from modules.text.loader import FALLBACK_ENCODING, TextLoader, detect_encoding
+
+TEXT = "Grüße aus Köln\r\nZweite Zeile\rDritte — Zeile\n€"
+
+
+@pytest.mark.parametrize("encoding, data, expected", [
+    ("utf-8", TEXT.encode("utf-8"), "utf-8"),
+    ("utf-8-sig", codecs.BOM_UTF8 + TEXT.encode("utf-8"), "utf-8-sig"),
+    ("utf-16", TEXT.encode("utf-16"), "utf-16"),
+    ("utf-32", TEXT.encode("utf-32"), "utf-32"),
+    ("utf-16-le", TEXT.encode("utf-16-le"), "utf-16-le"),
+    ("utf-16-be", TEXT.encode("utf-16-be"), "utf-16-be"),
+    ("cp1252", TEXT.encode("cp1252"), FALLBACK_ENCODING),
+])
+def test_detect_encoding(encoding, data, expected):
+    assert detect_encoding(data) == expected
+
+
+def test_sample_may_end_within_a_character():
+    assert detect_encoding("aä".encode("utf-8")[:-1]) == "utf-8"
+
+
+def load(path, **kwargs):
+    chunks, result = [], []
+    done = threading.Event()
+
+    def on_done(encoding, error):
+        result.extend([encoding, error])
+        done.set()
+    TextLoader(str(path), chunks.append, on_done, **kwargs).start()
+    assert done.wait(10)
+    return "".join(chunks), chunks, result
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "utf-16", "cp1252"])
+def test_chunks_decode_across_boundaries(tmp_path, encoding):
+    path = tmp_path / "text.txt"
+    path.write_bytes(TEXT.encode(encoding))
+    # NOTE Odd chunk sizes split multi-byte characters and the "\r\n"
+    text, chunks, (detected, error) = load(path, first_chunk_size=3, chunk_size=5)
+    assert error is None and len(chunks) > 3
+    assert text == TEXT.replace("\r\n", "\n").replace("\r", "\n")
+    assert detected == (encoding if encoding != "cp1252" else FALLBACK_ENCODING)
+
+
+def test_missing_file_reports_an_error(tmp_path):
+    text, chunks, (encoding, error) = load(tmp_path / "missing.txt")
+    assert text == "" and error.startswith("FileNotFoundError")
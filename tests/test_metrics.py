@@ -0,0 +1,42 @@
+from modules.audio.metrics import LatencyHistogram, PlaybackMetrics
+
+
+def test_histogram_buckets_and_percentiles():
+    histogram = LatencyHistogram([1, 2, 5])
+    assert histogram.percentile(0.5) == 0.0
+    for value in [0.5, 1, 1.5, 1.8, 4, 9]:
+        histogram.record(value)
+    assert histogram.counts == [2, 2, 1, 1]
+    assert histogram.percentile(0.5) == 2
+    assert histogram.percentile(0.99) == float('inf')
+    assert histogram.maximum == 9
+    histogram.reset()
+    assert histogram.total == 0 and histogram.counts == [0, 0, 0, 0]
+
+
+def test_queue_low_water_is_only_tracked_while_producing():
+    metrics = PlaybackMetrics()
+    metrics.queue_level(100)
+    metrics.queue_level(40)
+    metrics.queue_level(0, track_low_water=False)
+    assert metrics.queue_frames == 0 and metrics.queue_low_water == 40
+
+
+def test_start_latency_is_recorded_once():
+    metrics = PlaybackMetrics()
+    metrics.first_sample()
+    assert metrics.start_latency_ms.total == 0
+    metrics.play_requested()
+    metrics.first_sample(output_delay=0.01)
+    metrics.first_sample()
+    assert metrics.start_latency_ms.total == 1 and metrics.start_latency_ms.maximum >= 10
+
+
+def test_snapshot_is_plain_data():
+    metrics = PlaybackMetrics()
+    metrics.underflows += 1
+    snapshot = metrics.snapshot()
+    assert snapshot["underflows"] == 1 and snapshot["queue_low_water"] == 0
+    assert snapshot["callback_ms"]["counts"] == [0] * 9
+    metrics.reset()
+    assert metrics.snapshot()["underflows"] == 0
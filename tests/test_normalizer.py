@@ -0,0 +1,71 @@
+import pytest
+
+from modules.ssml.breaks import BreakConverter
+from modules.ssml.normalizer import TextNormalizer, trie_pattern
+
+
+@pytest.fixture(scope="module")
+def english():
+    return TextNormalizer("en")
+
+
+@pytest.fixture(scope="module")
+def german():
+    return TextNormalizer("de-AT")
+
+
+def test_units_and_numbers(english):
+    assert english.convert("5 km in 1 h") == \
+        '5 <sub alias="kilometers">km</sub> in 1 <sub alias="hour">h</sub>'
+    assert english.convert("5km, 50%") == '5<sub alias="kilometers">km</sub>, 50<sub alias="percent">%</sub>'
+    assert english.convert("1,250.5 m") == '1,250.5 <sub alias="meters">m</sub>'
+    assert english.convert("1,250.5") == '<say-as interpret-as="cardinal">1,250.5</say-as>'
+    assert english.convert("42 apples") == "42 apples"
+
+
+def test_decades_and_attached_single_letters(english):
+    assert english.convert("the 1990s were") == "the 1990s were"
+    assert english.convert("3s and 3 s") == '3s and 3 <sub alias="seconds">s</sub>'
+
+
+def test_versions(english, german):
+    assert english.convert("version 2.0.1 is out") == "version 2.0.1 is out"
+    assert german.convert("Version 2,0,1 und 10.5.3.1") == "Version 2,0,1 und 10.5.3.1"
+
+
+def test_dates_times_and_ordinals(english, german):
+    assert english.convert("on 2024-03-14 at 7:30 pm, 2nd") == (
+        'on <say-as interpret-as="date" format="ymd">2024-03-14</say-as> at '
+        '<say-as interpret-as="time">7:30 pm</say-as>, <say-as interpret-as="ordinal">2nd</say-as>')
+    assert german.convert("am 01.05.2024") == 'am <say-as interpret-as="date" format="dmy">01.05.2024</say-as>'
+    assert german.convert("Am 1. Mai") == 'Am <say-as interpret-as="ordinal">1.</say-as> Mai'
+    assert german.convert("der 3. Platz") == 'der <say-as interpret-as="ordinal">3.</say-as> Platz'
+
+
+def test_german_ordinal_before_sentence_start(german):
+    assert german.convert("Siehe Seite 5. Dann weiter.") == "Siehe Seite 5. Dann weiter."
+    assert german.convert("Es waren 12. Danach nicht mehr.") == "Es waren 12. Danach nicht mehr."
+
+
+def test_abbreviations(english, german):
+    assert english.convert("No. 5 on Main St. in St. Louis. No.") == (
+        '<sub alias="number">No.</sub> 5 on Main <sub alias="Street">St.</sub> in '
+        '<sub alias="Saint">St.</sub> Louis. No.')
+    assert german.convert("z. B. ca. 3 kg") == \
+        '<sub alias="zum Beispiel">z. B.</sub> <sub alias="circa">ca.</sub> 3 <sub alias="Kilogramm">kg</sub>'
+
+
+def test_text_filter_escapes_between_tokens():
+    normalizer = TextNormalizer("en", BreakConverter(escape=True).convert)
+    assert normalizer.convert("A & B: 5 km") == 'A &amp; B: 5 <sub alias="kilometers">km</sub>'
+
+
+def test_unsupported_language():
+    with pytest.raises(ValueError):
+        TextNormalizer("xx")
+
+
+def test_trie_pattern_prefers_the_longest_word():
+    import re
+    pattern = re.compile(trie_pattern(["m", "mm", "min", "ms"]))
+    assert [pattern.match(word).group() for word in ("m", "mm", "min", "ms", "mx")] == ["m", "mm", "min", "ms", "m"]
@@ -0,0 +1,47 @@
+import numpy as np
+
+from modules.audio.peaks import PeakBuilder, PeakPyramid
+
+
+def ramp(frames):
+    return np.linspace(-1, 1, frames, dtype=np.float32)[:, None]
+
+
+def test_levels_reduce_to_a_single_bucket():
+    pyramid = PeakPyramid.from_samples(ramp(1000), 1000, base_bucket=10, factor=4)
+    assert [len(level) for level in pyramid.mins] == [100, 25, 7, 2, 1]
+    assert pyramid.frames == 1000
+    assert pyramid.mins[-1][0] == -1 and pyramid.maxs[-1][0] == 1
+
+
+def test_window_picks_a_coarse_level():
+    pyramid = PeakPyramid.from_samples(ramp(1000), 1000, base_bucket=10, factor=4)
+    mins, maxs = pyramid.window(0, 1000, 10)
+    assert len(mins) == 10 and np.all(mins <= maxs)
+    assert mins[0] == -1 and maxs[-1] == 1
+    assert len(pyramid.window(0, 1000, 1000)[0]) == 100  # NOTE Never finer than level 0
+    assert len(pyramid.window(500, 500, 10)[0]) == 0
+
+
+def test_concatenate_matches_the_whole_render():
+    samples = ramp(1280)
+    whole = PeakPyramid.from_samples(samples, 1000, base_bucket=64)
+    joined = PeakPyramid.concatenate([PeakPyramid.from_samples(samples[:640], 1000, base_bucket=64),
+                                      PeakPyramid.from_samples(samples[640:], 1000, base_bucket=64)])
+    assert joined.levels == whole.levels
+    for level in range(whole.levels):
+        assert np.array_equal(joined.mins[level], whole.mins[level])
+        assert np.array_equal(joined.maxs[level], whole.maxs[level])
+
+
+def test_builder_saves_segments_and_render(tmp_path):
+    builder = PeakBuilder()
+    paths = [str(tmp_path / f"segment{number}{PeakPyramid.suffix}") for number in range(2)]
+    for path in paths:
+        builder.submit_segment(ramp(640), 1000, path)
+    published = []
+    render = builder.submit_render(paths, str(tmp_path / "render.wav"), callback=published.append).result()
+    assert render.frames == 1280 and published == [render]
+    assert builder.submit_segment(ramp(640), 1000, paths[0]) is None  # NOTE Built once per segment
+    loaded = PeakPyramid.load(str(tmp_path / "render.wav") + PeakPyramid.suffix)
+    assert loaded.samplerate == 1000 and np.array_equal(loaded.maxs[0], render.maxs[0])
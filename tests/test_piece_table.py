@@ -0,0 +1,52 @@
+import random
+import re
+
+import pytest
+
+from modules.editor.piece_table import PieceTable
+
+
+def check(table: PieceTable, reference: str):
+    assert table.text == reference
+    assert len(table) == len(reference)
+    assert table.line_count == reference.count("\n") + 1
+    for offset in random.sample(range(len(reference) + 1), min(20, len(reference) + 1)):
+        assert table.line_of(offset) == reference.count("\n", 0, offset)
+    breaks = [match.start() for match in re.finditer("\n", reference)]
+    for line in random.sample(range(table.line_count + 1), min(20, table.line_count + 1)):
+        expected = 0 if line == 0 else (len(reference) if line >= table.line_count else breaks[line - 1] + 1)
+        assert table.line_start(line) == expected
+
+
+@pytest.mark.parametrize("block_size", [4, PieceTable.block_size])
+def test_replace_matches_str(monkeypatch, block_size):
+    monkeypatch.setattr(PieceTable, "block_size", block_size)
+    random.seed(1)
+    table, reference = PieceTable(), ""
+    for step in range(3000):
+        start = random.randint(0, len(reference))
+        length = random.choice([0, 0, 1, random.randint(0, 20)])
+        text = random.choice(["", "a", "\n", "xy\nz", "word ", "\n\n" * random.randint(0, 40), "q" * 20000])
+        if len(reference) > 200000:
+            start, length = 0, 100000  # NOTE Keeps the reference small
+        assert table.replace(start, length, text) == reference[start:start + length]
+        reference = reference[:start] + text + reference[start + length:]
+        if step % 97 == 0:
+            check(table, reference)
+    check(table, reference)
+
+
+def test_chunks_and_substring():
+    table = PieceTable("Hello\nworld")
+    table.replace(5, 0, ", dear")
+    table.replace(0, 0, ">")
+    assert "".join(table.chunks()) == ">Hello, dear\nworld"
+    assert "".join(table.chunks(3, 9)) == table.substring(3, 9) == "llo, d"
+
+
+def test_snapshot_is_immutable():
+    table = PieceTable("abc")
+    snapshot = table.snapshot()
+    table.replace(1, 1, "XYZ")
+    assert "".join(text[start:end] for text, start, end in snapshot) == "abc"
+    assert table.text == "aXYZc"
@@ -0,0 +1,124 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+try:
+    from modules.audio import playback
+    from modules.audio.playback import PlaybackService, SegmentQueue
+except (ImportError, OSError):  # NOTE sounddevice raises OSError if PortAudio is not installed
+    pytest.skip("sounddevice is not available", allow_module_level=True)
+
+
+def drain(queue, frames):
+    out = np.empty((frames, queue.channels), dtype=np.float32)
+    return out[:queue.read(out)]
+
+
+def test_segments_play_back_to_back():
+    queue = SegmentQueue()
+    queue.append(np.arange(5))
+    queue.append(np.arange(5, 8))
+    assert queue.pending_frames() == 8
+    out = np.full((10, 1), 7.0, dtype=np.float32)
+    assert queue.read(out) == 8
+    assert out[:8, 0].tolist() == list(range(8))
+    assert not out[8:].any()  # NOTE Unfilled frames are silence
+    assert queue.pending_frames() == 0
+
+
+def test_crossfade_mixes_the_unplayed_tail():
+    queue = SegmentQueue(crossfade_frames=4)
+    first = np.ones(10, dtype=np.float32)
+    queue.append(first)
+    queue.append(np.zeros(10))
+    played = drain(queue, 100)[:, 0]
+    # NOTE The overlap replaces 4 frames of each segment and ramps from the first into the second
+    assert len(played) == 16
+    assert played[:6].tolist() == [1.0] * 6
+    assert np.all(np.diff(played[6:10]) < 0)
+    assert played[10:].tolist() == [0.0] * 6
+    assert first.tolist() == [1.0] * 10  # NOTE The caller's arrays are not modified
+
+
+def test_crossfade_only_uses_what_has_not_been_played():
+    queue = SegmentQueue(crossfade_frames=4)
+    queue.append(np.ones(10))
+    drain(queue, 8)
+    queue.append(np.zeros(10))
+    assert len(drain(queue, 100)) == 2 + 10 - 2
+
+
+def test_no_crossfade_for_continuation_blocks():
+    queue = SegmentQueue(channels=2, crossfade_frames=4)
+    queue.append(np.ones((3, 2)))
+    queue.append(np.ones((3, 2)), crossfade=False)
+    assert drain(queue, 100).tolist() == [[1.0, 1.0]] * 6
+
+
+def test_clear_and_finish():
+    queue = SegmentQueue()
+    queue.append(np.ones(10))
+    queue.finish()
+    assert queue.finished
+    queue.clear()
+    assert queue.pending_frames() == 0 and len(drain(queue, 4)) == 0
+    queue.append(np.ones(1))
+    assert not queue.finished  # NOTE Appending reopens the queue
+
+
+class OutputStream:
+    """Stands in for the device, the tests call the callback themselves."""
+    def __init__(self, samplerate, channels, callback, **kwargs):
+        self.samplerate, self.channels, self.active = samplerate, channels, False
+
+    def start(self):
+        self.active = True
+
+    def close(self):
+        self.active = False
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(playback.sd, "OutputStream", OutputStream)
+    monkeypatch.setattr(PlaybackService, "_instance", None)
+    return PlaybackService(blocksize=4, buffer_seconds=1.0)
+
+
+def callback(service, frames=4):
+    out = np.empty((frames, 1), dtype=np.float32)
+    status = SimpleNamespace(output_underflow=False)
+    service.callback(out, frames, SimpleNamespace(outputBufferDacTime=0.0, currentTime=0.0), status)
+    return out
+
+
+def test_playback_plays_until_the_queue_is_finished(service):
+    generation = service.start(16000)
+    assert service.append(np.ones(6), generation)
+    service.finish(generation)
+    assert callback(service)[:, 0].tolist() == [1.0] * 4
+    assert service.state == service.PLAYING
+    with pytest.raises(playback.sd.CallbackStop):
+        callback(service)
+    assert service.state == service.STOPPED and service.finished.is_set()
+
+
+def test_pause_outputs_silence(service):
+    generation = service.start(16000)
+    service.append(np.ones(8), generation)
+    service.pause()
+    assert not callback(service).any() and service.queue.pending_frames() == 8
+    service.resume()
+    assert callback(service).all()
+
+
+def test_stopped_or_replaced_playback_rejects_samples(service):
+    first = service.start(16000)
+    second = service.start(16000)
+    assert not service.append(np.ones(4), first)
+    service.stop()
+    assert service.stream is None  # NOTE The device is released unless keep_warm is set
+    assert not service.append(np.ones(4), second)
+    service.finish(second)
+    assert not service.queue.finished
@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+
+from modules.audio.cache import SegmentCache
+from modules.audio.processing import db_to_amplitude, mix_channels, normalize_rms, resample, trim_silence
+
+RATE = 1000
+
+
+def padded_tone(lead, tone, tail):
+    samples = np.zeros((lead + tone + tail, 1), dtype=np.float32)
+    samples[lead:lead + tone] = 0.5
+    return samples
+
+
+def test_trim_silence_keeps_the_padding():
+    samples = padded_tone(300, 100, 200)
+    trimmed = trim_silence(samples, RATE, padding_ms=20)
+    assert len(trimmed) == 20 + 100 + 20
+    assert len(trim_silence(samples, RATE, padding_ms=20, trailing=False)) == 20 + 100 + 200
+    assert len(trim_silence(samples, RATE, padding_ms=20, leading=False)) == 300 + 100 + 20
+    assert len(trim_silence(np.zeros((50, 1), dtype=np.float32), RATE)) == 0
+
+
+def test_normalize_rms_with_peak_limit():
+    samples = np.full((100, 1), 0.01, dtype=np.float32)
+    normalize_rms(samples, target_db=-20.0)
+    assert np.allclose(samples, db_to_amplitude(-20.0))
+    spiky = np.zeros((100, 1), dtype=np.float32)
+    spiky[0] = 0.1
+    normalize_rms(spiky, target_db=-20.0, peak_db=-6.0)
+    assert np.isclose(np.max(spiky), db_to_amplitude(-6.0))
+    silence = np.zeros((10, 1), dtype=np.float32)
+    assert not normalize_rms(silence).any()
+
+
+def test_resample_and_mix_channels():
+    samples = np.linspace(0, 1, 100, dtype=np.float32)[:, None]
+    resampled = resample(samples, 1000, 2000)
+    assert resampled.shape == (200, 1) and resampled.dtype == np.float32
+    assert resample(samples, 1000, 1000) is samples
+    stereo = mix_channels(samples, 2)
+    assert stereo.shape == (100, 2) and np.array_equal(stereo[:, 0], stereo[:, 1])
+    assert np.allclose(mix_channels(np.array([[1.0, 0.0]], dtype=np.float32), 1), 0.5)
+
+
+def test_segment_cache_put_get_and_prune(tmp_path):
+    cache = SegmentCache(str(tmp_path), max_bytes=0)
+    key = SegmentCache.key("Api", "voice", None, -20.0, "Hello.")
+    assert key != SegmentCache.key("Api", "voice", None, -20.0, "Hello!")
+    assert cache.get(key) is None
+    cache.put(key, padded_tone(10, 10, 10), RATE)
+    data, samplerate = cache.get(key)
+    assert samplerate == RATE and data.shape == (30, 1) and data[15, 0] == 0.5
+    peaks = cache.peaks_path(key, RATE, 30)
+    open(peaks, "wb").close()
+    cache.prune()
+    assert not os.path.exists(cache.path(key)) and not os.path.exists(peaks)
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,45 @@
+import pytest
+
+from modules.ssml.pronunciation import PronunciationDictionary
+
+ENTRIES = {"Kivy": {"ph": "ˈkɪvi"}, "SSML": {"alias": "S S M L"}, "New": {"alias": "Nu"},
+           "New York": {"ph": "nu ˈjɔrk", "alphabet": "x-sampa"}}
+
+
+def test_whole_words_and_the_longest_match():
+    dictionary = PronunciationDictionary(ENTRIES)
+    assert dictionary.convert("Kivy & Kivys in New York, New SSML.") == (
+        '<phoneme alphabet="ipa" ph="ˈkɪvi">Kivy</phoneme> &amp; Kivys in '
+        '<phoneme alphabet="x-sampa" ph="nu ˈjɔrk">New York</phoneme>, '
+        '<sub alias="Nu">New</sub> <sub alias="S S M L">SSML</sub>.')
+
+
+def test_text_filter_and_empty_dictionary():
+    assert PronunciationDictionary().convert("a < b") == "a &lt; b"
+    dictionary = PronunciationDictionary({"SSML": {"alias": "S S M L"}}, text_filter=str.upper)
+    assert dictionary.convert("ssml SSML") == 'SSML <sub alias="S S M L">SSML</sub>'
+
+
+@pytest.mark.parametrize("word, entry", [
+    ("", {"alias": "x"}),
+    (" Kivy", {"alias": "x"}),
+    ("Kivy", {}),
+    ("Kivy", {"ph": "x", "alias": "y"}),
+    ("Kivy", {"alias": " "}),
+    ("Kivy", {"ph": "x", "alphabet": "klingon"}),
+])
+def test_invalid_entries_keep_the_previous_ones(word, entry):
+    dictionary = PronunciationDictionary(ENTRIES)
+    with pytest.raises(ValueError):
+        dictionary.set_entries({word: entry})
+    assert dictionary.entries == ENTRIES
+
+
+def test_digest_changes_with_the_entries():
+    dictionary = PronunciationDictionary(ENTRIES)
+    digest, pattern = dictionary.digest, dictionary._pattern
+    dictionary.set_entries(dict(reversed(list(ENTRIES.items()))))
+    assert dictionary.digest == digest and dictionary._pattern is pattern  # NOTE Not compiled again
+    dictionary.set_entries({"Kivy": {"alias": "Kivi"}})
+    assert dictionary.digest != digest
+    assert dictionary.convert("Kivy SSML") == '<sub alias="Kivi">Kivy</sub> SSML'
@@ -0,0 +1,58 @@
+import numpy as np
+import soundfile as sf
+
+from modules.audio.processing import process_segment
+from modules.audio.render import RenderWriter
+
+RATE = 16000
+
+
+def sentence(pause_seconds):
+    """A 0.3 s tone with 0.1 s of silence in front and a pause behind, like a sentence followed by a <break>."""
+    tone = 0.5 * np.sin(2 * np.pi * 440 * np.arange(int(0.3 * RATE)) / RATE)
+    samples = np.concatenate([np.zeros(int(0.1 * RATE)), tone, np.zeros(int(pause_seconds * RATE))])
+    return samples.astype(np.float32)[:, None]
+
+
+def loud_blocks(samples, block=160):
+    """Whether every 10 ms block is loud, and the block numbers where that changes."""
+    blocks = len(samples) // block
+    loud = np.abs(samples[:blocks * block, 0]).reshape(blocks, block).max(axis=1) > 0.01
+    return loud, np.flatnonzero(np.diff(loud.astype(np.int8)))
+
+
+def test_render_keeps_the_break_between_sentences(tmp_path):
+    path = str(tmp_path / "render.wav")
+    writer = RenderWriter(path, trim=True)
+    for number, offset in enumerate((0, 20)):
+        segment = process_segment(sentence(0.5), RATE, -20.0)
+        writer.write(segment, RATE, offset, last=number == 1)
+    writer.close(True)
+
+    data, samplerate = sf.read(path, dtype='float32', always_2d=True)
+    assert samplerate == RATE
+    loud, edges = loud_blocks(data)
+    # Two tones, the gap between them is the 0.5 s break plus the 0.1 s lead-in of the second sentence
+    assert len(edges) == 4
+    assert (edges[2] - edges[1]) / 100 >= 0.55
+    # Only the outer edges are trimmed, down to the padding
+    assert np.flatnonzero(loud)[0] / 100 < 0.05
+    assert len(loud) - np.flatnonzero(loud)[-1] < 5
+    assert writer.index.sample_at(20) > edges[1] * 160
+
+
+def test_render_removes_incomplete_file(tmp_path):
+    path = tmp_path / "render.wav"
+    writer = RenderWriter(str(path))
+    writer.write(sentence(0.2), RATE, 0)
+    writer.close(False)
+    assert not path.exists()
+
+
+def test_process_segment_keeps_silence():
+    segment = sentence(0.5)
+    processed = process_segment(segment.copy(), RATE, -20.0)
+    assert len(processed) == len(segment)
+    # The level is measured without the silence (apart from the padding), not diluted by the pause
+    rms = np.sqrt(np.mean(np.square(processed[int(0.1 * RATE):int(0.4 * RATE)])))
+    assert abs(20 * np.log10(rms) + 20.0) < 1.0
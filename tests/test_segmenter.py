@@ -0,0 +1,61 @@
+import random
+
+from modules.editor.document import Document
+from modules.text.segmenter import SentenceIndex, SentenceSegmenter
+
+PIECES = ["a", "\n", "Word. Next one! ", "", "x\ny.\n", " Dr. Who. ", "(read. this)[rate:slow] ", '<break time="1s"/>']
+
+
+def texts(segmenter, text):
+    return [text[start:end] for start, end in segmenter.split(text)]
+
+
+def test_split_keeps_abbreviations_and_markup():
+    segmenter = SentenceSegmenter()
+    assert texts(segmenter, "Dr. Smith arrived. He left!\nNext line") == ["Dr. Smith arrived.", "He left!", "Next line"]
+    assert texts(segmenter, "Pause <break time=\"0.5s\"/> here. (Read. this)[rate:slow] too.") == \
+        ["Pause <break time=\"0.5s\"/> here.", "(Read. this)[rate:slow] too."]
+
+
+def test_edit_matches_rebuild():
+    random.seed(2)
+    index, text = SentenceIndex(), ""
+    for _ in range(1000):
+        start = random.randint(0, len(text))
+        removed = len(text[start:start + random.choice([0, 0, 1, random.randint(0, 30)])])
+        inserted = random.choice(PIECES)
+        text = text[:start] + inserted + text[start + removed:]
+        index.edit(text, start, removed, len(inserted))
+        reference = SentenceIndex()
+        reference.rebuild(text)
+        assert index.spans() == reference.spans()
+
+
+def test_edit_of_a_region_matches_rebuild():
+    random.seed(3)
+    document, index = Document(), SentenceIndex()
+    edits = []
+    document.bind(on_change=lambda document, start, removed, inserted: edits.append((start, len(removed), len(inserted))))
+    for _ in range(1000):
+        document.replace(random.randint(0, len(document)), random.choice([0, 0, 1, random.randint(0, 30)]),
+                         random.choice(PIECES))
+        for start, removed, inserted in edits:
+            first, _ = document.position_of(start)
+            last, _ = document.position_of(start + inserted)
+            region = "\n".join(document.lines(first, last + 1)) + ("\n" if last + 1 < document.line_count else "")
+            index.edit(region, start, removed, inserted, offset=document.offset_of(first, 0))
+        edits.clear()
+        reference = SentenceIndex()
+        reference.rebuild(document.text)
+        assert index.spans() == reference.spans()
+
+
+def test_lookups():
+    index = SentenceIndex()
+    index.set_text("One. Two. Three.")
+    assert index.sentence_at(0) == 0
+    assert index.sentence_at(4) == 0  # NOTE Behind the period
+    assert index.sentence_at(5) == 1
+    assert index.next_start(0) == 5
+    assert index.previous_start(5) == 0
+    assert index.sentence_at(16) is None or index.sentence_at(16) == 2
@@ -0,0 +1,71 @@
+import json
+import os
+
+import pytest
+
+from modules.util.files import write_atomic
+
+try:
+    from settings import app_settings
+    from settings.app_settings import GlobalSettings
+except (ImportError, OSError):  # NOTE kivymd, or sounddevice without PortAudio, is not installed
+    GlobalSettings = None
+
+
+def test_write_atomic_replaces_the_file_and_keeps_its_mode(tmp_path):
+    path = tmp_path / "settings.json"
+    path.write_text("old")
+    os.chmod(path, 0o600)
+    write_atomic(str(path), ["new", " content"])
+    assert path.read_text() == "new content"
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    assert os.listdir(tmp_path) == ["settings.json"]
+
+
+def test_write_atomic_keeps_the_old_file_on_errors(tmp_path):
+    path = tmp_path / "settings.json"
+    path.write_text("old")
+
+    def chunks():
+        yield "partial"
+        raise RuntimeError("interrupted")
+    with pytest.raises(RuntimeError):
+        write_atomic(str(path), chunks())
+    assert path.read_text() == "old" and os.listdir(tmp_path) == ["settings.json"]
+
+
+@pytest.fixture
+def settings(tmp_path, monkeypatch):
+    if GlobalSettings is None:
+        pytest.skip("kivymd or sounddevice is not available")
+    monkeypatch.setattr(GlobalSettings, "_instance", None)
+    return GlobalSettings(str(tmp_path), str(tmp_path))
+
+
+def saved(settings):
+    with open(settings._settings_file) as file:
+        return json.load(file)
+
+
+def test_changes_are_saved_once_after_a_batch(settings):
+    with settings.batch():
+        settings.update_setting("Api", "voice", "Rachel")
+        with settings.batch():
+            settings.update_setting("Api", "model", "v2")
+        assert not settings._save_event.is_triggered  # NOTE Nested batches save once the outermost is done
+    assert settings._save_event.is_triggered
+    settings.flush().result()
+    assert not settings._save_event.is_triggered
+    assert saved(settings) == {"Api": {"voice": "Rachel", "model": "v2"}}
+    assert settings.flush() is None  # NOTE Nothing changed since
+
+
+def test_failed_save_is_retried(settings, monkeypatch):
+    scheduled = []
+    monkeypatch.setattr(app_settings.Clock, "schedule_once", lambda callback, delay=0: scheduled.append((callback, delay)))
+    settings.update_setting("Api", "voice", "Rachel")
+    settings._settings_file = os.path.join(settings._settings_file, "missing", "app_settings.json")
+    settings.flush().result()
+    assert [delay for callback, delay in scheduled] == [settings.retry_delay]
+    scheduled[0][0](0)
+    assert settings._dirty and settings._save_event.is_triggered
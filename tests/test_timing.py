@@ -0,0 +1,40 @@
+import pytest
+
+from modules.audio.timing import TimingIndex
+
+
+def test_lookup_in_both_directions():
+    index = TimingIndex(16000)
+    for char_offset, sample_offset in [(0, 0), (12, 8000), (30, 20000)]:
+        index.add(char_offset, sample_offset)
+    assert [index.sample_at(offset) for offset in (0, 11, 12, 29, 100)] == [0, 0, 8000, 8000, 20000]
+    assert [index.char_at(offset) for offset in (0, 7999, 8000, 25000)] == [0, 0, 12, 30]
+
+
+def test_before_the_first_unit():
+    index = TimingIndex(16000)
+    assert index.sample_at(5) == 0 and index.char_at(5) == 0
+    index.add(10, 100)
+    assert index.sample_at(5) == 0 and index.char_at(50) == 0
+
+
+def test_entries_must_ascend():
+    index = TimingIndex(16000)
+    index.add(10, 100)
+    with pytest.raises(ValueError):
+        index.add(5, 200)
+    with pytest.raises(ValueError):
+        index.add(20, 50)
+    index.add(10, 100)  # NOTE An empty unit starts where the previous one starts
+    assert len(index) == 2
+
+
+def test_save_and_load(tmp_path):
+    index = TimingIndex(22050)
+    index.add(0, 0)
+    index.add(42, 1234)
+    path = str(tmp_path / "render.timing.json")
+    index.save(path)
+    loaded = TimingIndex.load(path)
+    assert loaded.samplerate == 22050 and len(loaded) == 2
+    assert loaded.sample_at(50) == 1234 and loaded.char_at(1234) == 42
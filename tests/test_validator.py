@@ -0,0 +1,44 @@
+import random
+
+from modules.ssml.validator import ERROR, WARNING, SSMLValidator
+
+PIECES = ["<p>", "</p>", "<s>", "</s>", "word ", "\n", "<break time=\"1s\"/>", "<emphasis>", "</emphasis>", "<foo>", "<b", "x", ""]
+
+
+def test_problems():
+    problems = SSMLValidator().validate('<p>Hi <break time="20s"/> <emphasis level="loud">y</p>\n<s')
+    assert [(problem.line, problem.severity) for problem in problems] == [(1, ERROR), (1, ERROR), (1, ERROR), (2, ERROR)]
+    assert "Unexpected </p>" in problems[2].message
+
+
+def test_unknown_tags_are_warnings():
+    validator = SSMLValidator()
+    problems = validator.validate("Press <Enter> or write to <name@example.com>, if a <b then")
+    assert [problem.severity for problem in problems] == [WARNING, WARNING]
+    assert not validator.has_errors()
+
+
+def test_edit_matches_full_validation():
+    random.seed(3)
+    validator, text = SSMLValidator(), ""
+    for _ in range(1000):
+        start = random.randint(0, len(text))
+        removed = len(text[start:start + random.choice([0, 0, 1, random.randint(0, 20)])])
+        inserted = "".join(random.choice(PIECES) for _ in range(random.randint(0, 3)))
+        text = text[:start] + inserted + text[start + removed:]
+        if random.random() < 0.5:
+            first = text.rfind("\n", 0, start) + 1
+            end = text.find("\n", start + len(inserted))
+            region = text[first:] if end < 0 else text[first:end + 1]
+            problems = validator.edit(region, start, removed, len(inserted), offset=first)
+        else:
+            problems = validator.edit(text, start, removed, len(inserted))
+        assert problems == SSMLValidator().validate(text)
+
+
+def test_say_as_format_is_checked_for_dates_only():
+    validator = SSMLValidator()
+    assert not validator.validate('<say-as interpret-as="telephone" format="39">06 1234</say-as>')
+    assert not validator.validate('<say-as interpret-as="date" format="dmy">01.02.2024</say-as>')
+    problems = validator.validate('<say-as interpret-as="date" format="39">01.02.2024</say-as>')
+    assert [problem.severity for problem in problems] == [ERROR]
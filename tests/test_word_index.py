@@ -0,0 +1,55 @@
+import random
+
+from modules.editor.document import Document
+from modules.text.word_index import WordIndex
+
+PIECES = ["a", "\n", "word ", "", "x\ny\n", "  two words  "]
+
+
+def assert_same(index: WordIndex, text: str):
+    reference = WordIndex()
+    reference.set_text(text)
+    assert list(index.line_starts) == list(reference.line_starts)
+    assert index.lines == reference.lines
+
+
+def test_edit_matches_rebuild():
+    random.seed(4)
+    index, text = WordIndex(), ""
+    for _ in range(2000):
+        start = random.randint(0, len(text))
+        removed = len(text[start:start + random.choice([0, 0, 1, random.randint(0, 30)])])
+        inserted = random.choice(PIECES)
+        text = text[:start] + inserted + text[start + removed:]
+        index.edit(text, start, removed, len(inserted))
+        assert_same(index, text)
+
+
+def test_edit_of_a_region_matches_rebuild():
+    random.seed(5)
+    document, index = Document(), WordIndex()
+    edits = []
+    document.bind(on_change=lambda document, start, removed, inserted: edits.append((start, len(removed), len(inserted))))
+    for _ in range(1000):
+        document.replace(random.randint(0, len(document)), random.choice([0, 0, 1, random.randint(0, 30)]),
+                         random.choice(PIECES))
+        for start, removed, inserted in edits:
+            first, _ = document.position_of(start)
+            last, _ = document.position_of(start + inserted)
+            region = "\n".join(document.lines(first, last + 1))
+            index.edit(region, start, removed, inserted, offset=document.offset_of(first, 0))
+        edits.clear()
+        assert_same(index, document.text)
+
+
+def test_navigation():
+    index = WordIndex()
+    index.set_text("one two\n  three")
+    assert index.word_end(1) == 3
+    assert index.word_end(4) == 7
+    assert index.next_word_start(0) == 4
+    assert index.next_word_start(4) == 10
+    assert index.next_word_start(10) is None
+    assert index.previous_word_start(10) == 4
+    assert index.next_line_start(2) == 8
+    assert index.previous_line_start(8) == 0